@@ -4,17 +4,26 @@ Chat API - 对话接口
 提供智能对话功能，基于 RAG + LLM 实现。
 """
 
+import asyncio
+import json
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, AsyncIterator, Mapping
 from datetime import datetime
+from app.core.config import settings
 from app.services.chat_service import ChatService, get_chat_service
+from app.services.chat_channel import ChatChannel
+from app.services.llm_limiter import LimiterOverloadedError
+from app.services.user_plans import UserPlanCache
 
 router = APIRouter()
 
 # 全局 ChatService 实例
 _chat_service: Optional[ChatService] = None
+# 全局用户套餐缓存
+_user_plans: Optional[UserPlanCache] = None
 
 
 def get_chat_service_instance() -> ChatService:
@@ -25,6 +34,36 @@ def get_chat_service_instance() -> ChatService:
     return _chat_service
 
 
+def get_user_plans() -> UserPlanCache:
+    """获取用户套餐缓存（LLM 上游繁忙时按套餐排队）"""
+    global _user_plans
+    if _user_plans is None:
+        _user_plans = UserPlanCache(ttl=settings.LLM_PLAN_CACHE_TTL)
+    return _user_plans
+
+
+def _plan_user_id(headers: Mapping[str, str], user_id: Optional[str]) -> Optional[str]:
+    """
+    决定排队优先级的用户ID
+
+    配置了 LLM_PLAN_USER_HEADER 时只信任认证网关写入的请求头；否则使用请求中的 user_id，
+    该值未经认证，只适用于可信调用方（内部服务）。
+    """
+    header = settings.LLM_PLAN_USER_HEADER
+    if header:
+        return headers.get(header)
+    return user_id
+
+
+def _overloaded() -> HTTPException:
+    """LLM 上游过载：503 并提示客户端稍后重试"""
+    return HTTPException(
+        status_code=503,
+        detail="服务繁忙，请稍后重试",
+        headers={"Retry-After": str(settings.LLM_OVERLOAD_RETRY_AFTER)}
+    )
+
+
 class ChatMessage(BaseModel):
     """对话消息请求"""
     message: str = Field(..., min_length=1, max_length=10000, description="用户消息")
@@ -34,6 +73,16 @@ class ChatMessage(BaseModel):
     stream: bool = Field(False, description="是否流式输出")
 
 
+class ChatBatchRequest(BaseModel):
+    """批量对话请求"""
+    items: List[ChatMessage] = Field(
+        ..., min_length=1, max_length=settings.CHAT_BATCH_MAX_ITEMS, description="对话消息列表"
+    )
+    concurrency: Optional[int] = Field(
+        None, ge=1, le=256, description="并发 LLM 调用数（默认使用服务端配置）"
+    )
+
+
 class ChatResponse(BaseModel):
     """对话响应"""
     response: str = Field(..., description="AI回复内容")
@@ -66,14 +115,12 @@ class SourcesResponse(BaseModel):
     total: int
 
 
-# 模拟的对话存储（备用，保持向后兼容）
-chat_sessions = {}
-
-
 @router.post("/chat", response_model=ChatResponse)
 async def send_message(
     request: ChatMessage,
-    chat_service: ChatService = Depends(get_chat_service_instance)
+    http_request: Request,
+    chat_service: ChatService = Depends(get_chat_service_instance),
+    user_plans: UserPlanCache = Depends(get_user_plans)
 ):
     """
     发送对话消息，获取AI回复
@@ -82,83 +129,254 @@ async def send_message(
     - session_id: 会话ID（可选，自动生成）
     - user_id: 用户ID（可选）
     - use_rag: 是否使用知识库检索（默认True）
-    - stream: 是否流式输出（默认False）
+    - stream: 是否流式输出（默认False）；为True时返回 SSE 事件流，
+      依次为 `delta` 增量事件和最终的 `done` 事件
 
     **功能说明：**
     - 自动检索知识库相关内容
     - 支持多轮对话记忆
     - 返回参考来源和置信度
+    - 上游繁忙时按用户套餐（UserModel.plan）排队；排队已满或超时返回 503（带 Retry-After），
+      该轮不写入历史。套餐按 LLM_PLAN_USER_HEADER 请求头中的用户ID查询，未配置该请求头时按
+      请求体的 user_id 查询（未经认证，仅限可信调用方）
     """
+    plan = await user_plans.get(_plan_user_id(http_request.headers, request.user_id))
+    if request.stream:
+        events = chat_service.astream_chat(
+            message=request.message,
+            session_id=request.session_id,
+            user_id=request.user_id,
+            use_rag=request.use_rag,
+            plan=plan
+        )
+        # 先取首个事件：过载拒绝发生在首个片段之前，此时还能返回 503
+        try:
+            first = await events.__anext__()
+        except LimiterOverloadedError:
+            raise _overloaded()
+        except Exception as e:
+            await events.aclose()
+            logging.error(f"流式对话处理失败: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        return StreamingResponse(
+            _stream_events(request, first, events),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
     try:
         # 调用对话服务
-        result = chat_service.chat(
+        result = await chat_service.achat(
             message=request.message,
             session_id=request.session_id,
             user_id=request.user_id,
             use_rag=request.use_rag,
-            stream=request.stream
+            plan=plan
         )
 
-        # 兼容旧格式：同时保存到模拟存储
-        session_id = result["session_id"]
-        if session_id not in chat_sessions:
-            chat_sessions[session_id] = {
-                "messages": [],
-                "created_at": datetime.now(),
-                "updated_at": datetime.now()
-            }
-
-        # 保存对话历史
-        chat_sessions[session_id]["messages"].append({
-            "role": "user",
-            "content": request.message,
-            "timestamp": datetime.now().isoformat()
-        })
-        chat_sessions[session_id]["messages"].append({
-            "role": "assistant",
-            "content": result["response"],
-            "timestamp": datetime.now().isoformat()
-        })
-        chat_sessions[session_id]["updated_at"] = datetime.now()
-
         return ChatResponse(
             response=result["response"],
-            session_id=session_id,
+            session_id=result["session_id"],
             sources=request.use_rag and result.get("sources", []) or [],
             confidence=result.get("confidence", 0.0),
             timestamp=datetime.now()
         )
 
+    except LimiterOverloadedError:
+        raise _overloaded()
     except Exception as e:
         logging.error(f"对话处理失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _stream_events(
+    request: ChatMessage,
+    first: dict,
+    events: AsyncIterator[dict]
+) -> AsyncIterator[str]:
+    """将流式对话事件（首个事件已取出）编码为 SSE"""
+    event = first
+    try:
+        while True:
+            if event["type"] == "done" and not request.use_rag:
+                event["sources"] = []
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            try:
+                event = await events.__anext__()
+            except StopAsyncIteration:
+                break
+    except Exception as e:
+        logging.error(f"流式对话处理失败: {e}")
+        error = {"type": "error", "detail": str(e)}
+        yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+    finally:
+        await events.aclose()
+
+
+@router.post("/chat/batch")
+async def send_batch(
+    request: ChatBatchRequest,
+    http_request: Request,
+    chat_service: ChatService = Depends(get_chat_service_instance),
+    user_plans: UserPlanCache = Depends(get_user_plans)
+):
+    """
+    批量发送对话消息（离线回放、批量预生成回答）
+
+    - items: 对话消息列表（`stream` 字段被忽略）
+    - concurrency: 并发 LLM 调用数（可选）
+
+    **返回：** NDJSON，每行一个结果，按完成顺序返回；
+    `index` 为消息在 items 中的位置，失败的消息返回 `error` 字段。
+    同一 session_id 的消息按提交顺序依次处理。
+    """
+    items = [item.model_dump(exclude={"stream"}) for item in request.items]
+    plan_users = [_plan_user_id(http_request.headers, item["user_id"]) for item in items]
+    plans = {user_id: await user_plans.get(user_id) for user_id in set(plan_users)}
+    for item, user_id in zip(items, plan_users):
+        item["plan"] = plans[user_id]
+    return StreamingResponse(
+        _batch_lines(request, items, chat_service),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"}
+    )
+
+
+async def _batch_lines(
+    request: ChatBatchRequest,
+    items: List[dict],
+    chat_service: ChatService
+) -> AsyncIterator[str]:
+    """将批量对话结果编码为 NDJSON"""
+    try:
+        async for result in chat_service.abatch_chat(items, concurrency=request.concurrency):
+            if "error" not in result and not items[result["index"]]["use_rag"]:
+                result["sources"] = []
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    except Exception as e:
+        logging.error(f"批量对话处理失败: {e}")
+        yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+
+@router.websocket("/chat/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    session_id: Optional[str] = Query(None, max_length=64, description="会话ID"),
+    user_id: Optional[str] = Query(None, max_length=64, description="用户ID"),
+    use_rag: bool = True,
+    chat_service: ChatService = Depends(get_chat_service_instance),
+    user_plans: UserPlanCache = Depends(get_user_plans)
+):
+    """
+    WebSocket 对话通道（会话历史和检索结果保存在连接上）
+
+    - 连接参数（Query）：session_id、user_id、use_rag；参数校验失败时以 1008 关闭连接
+    - 建立连接后服务端先发送 `{"type": "session", "session_id": ...}`
+    - 客户端发送 `{"type": "message", "message": "...", "use_rag": true}`，
+      服务端依次返回 `delta` 增量事件和 `done` 事件
+    - 生成过程中发送 `{"type": "cancel"}` 中止生成，服务端返回 `cancelled` 事件，
+      被中止的一轮不写入历史
+    - 同一连接同时只处理一条消息，生成过程中的新消息返回 `error` 事件
+    """
+    await websocket.accept()
+    channel = ChatChannel(
+        chat_service, session_id=session_id, user_id=user_id, use_rag=use_rag,
+        plan=await user_plans.get(_plan_user_id(websocket.headers, user_id))
+    )
+    await channel.open()
+    await _ws_send(websocket, {"type": "session", "session_id": channel.session_id})
+
+    task: Optional[asyncio.Task] = None
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except ValueError:
+                await _ws_send(websocket, {"type": "error", "detail": "无效的 JSON"})
+                continue
+
+            kind = data.get("type", "message")
+            if kind == "cancel":
+                if task is not None and not task.done():
+                    task.cancel()
+                continue
+            if kind != "message":
+                await _ws_send(websocket, {"type": "error", "detail": f"未知的消息类型: {kind}"})
+                continue
+            if task is not None and not task.done():
+                await _ws_send(websocket, {"type": "error", "detail": "上一条消息仍在生成中"})
+                continue
+
+            message = data.get("message")
+            if not isinstance(message, str) or not 1 <= len(message) <= 10000:
+                await _ws_send(websocket, {"type": "error", "detail": "消息长度应为 1-10000 个字符"})
+                continue
+            task = asyncio.create_task(_ws_generate(websocket, channel, message, data.get("use_rag")))
+    except WebSocketDisconnect:
+        logging.info(f"对话连接已断开: {channel.session_id}")
+    finally:
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def _ws_send(websocket: WebSocket, event: dict) -> None:
+    """发送一个 JSON 事件"""
+    await websocket.send_text(json.dumps(event, ensure_ascii=False))
+
+
+async def _ws_generate(
+    websocket: WebSocket,
+    channel: ChatChannel,
+    message: str,
+    use_rag: Optional[bool]
+) -> None:
+    """生成一条回复并逐个发送事件"""
+    try:
+        async for event in channel.stream(message, use_rag=use_rag):
+            await _ws_send(websocket, event)
+    except asyncio.CancelledError:
+        try:
+            await _ws_send(websocket, {"type": "cancelled"})
+        except Exception:
+            pass  # 连接已断开
+        raise
+    except LimiterOverloadedError:
+        await _ws_send(websocket, {
+            "type": "error",
+            "detail": "服务繁忙，请稍后重试",
+            "retry_after": settings.LLM_OVERLOAD_RETRY_AFTER
+        })
+    except Exception as e:
+        logging.error(f"WebSocket 对话处理失败: {e}")
+        await _ws_send(websocket, {"type": "error", "detail": str(e)})
+
+
 @router.get("/history/{session_id}", response_model=ChatHistoryResponse)
 async def get_history(
     session_id: str,
+    resolve_sources: bool = True,
     chat_service: ChatService = Depends(get_chat_service_instance)
 ):
     """
     获取对话历史
 
     - session_id: 会话ID
+    - resolve_sources: 是否展开助手消息的来源引用（文件名、片段内容），默认True
     """
-    # 尝试从真实服务获取
-    history = chat_service.get_history(session_id)
+    history = await chat_service.aget_history(session_id)
 
     if not history:
-        # 降级到模拟存储
-        if session_id not in chat_sessions:
-            raise HTTPException(status_code=404, detail="会话不存在")
-        history = chat_sessions[session_id]["messages"]
+        raise HTTPException(status_code=404, detail="会话不存在")
+
+    messages = chat_service.export_history(history, resolve_sources=resolve_sources)
 
     return ChatHistoryResponse(
         session_id=session_id,
-        messages=history,
-        message_count=len(history),
-        created_at=history[0]["timestamp"] if history else None,
-        updated_at=history[-1]["timestamp"] if history else None
+        messages=messages,
+        message_count=len(messages),
+        created_at=messages[0]["timestamp"],
+        updated_at=messages[-1]["timestamp"]
     )
 
 
@@ -170,12 +388,7 @@ async def clear_history(
     """
     清除对话历史
     """
-    # 清除真实服务历史
-    chat_service.clear_history(session_id)
-
-    # 清除模拟存储
-    if session_id in chat_sessions:
-        del chat_sessions[session_id]
+    await chat_service.aclear_history(session_id)
 
     return {"status": "cleared", "session_id": session_id}
 
@@ -185,8 +398,10 @@ async def get_session_count(
     chat_service: ChatService = Depends(get_chat_service_instance)
 ):
     """
-    获取当前会话数量
+    获取当前会话数量及会话存储的淘汰统计
     """
+    stats = await chat_service.aget_session_stats()
     return {
-        "count": chat_service.get_session_count()
+        "count": stats["sessions"],
+        "store": stats
     }
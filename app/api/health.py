@@ -2,9 +2,12 @@
 Health API - 健康检查接口
 """
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from datetime import datetime
 
+from app.api.chat import get_chat_service_instance
+from app.services.chat_service import ChatService
+
 router = APIRouter()
 
 
@@ -26,3 +29,14 @@ async def readiness_check():
         "ready": True,
         "timestamp": datetime.now().isoformat()
     }
+
+
+@router.get("/metrics")
+async def metrics(
+    chat_service: ChatService = Depends(get_chat_service_instance)
+):
+    """运行统计（LLM 缓存/请求合并/并发限制/路由、向量缓存/查询微批处理、会话存储等）"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        **(await chat_service.aget_stats())
+    }
@@ -0,0 +1,77 @@
+"""
+Concurrency - 并发工具
+
+将同步阻塞调用卸载到有界线程池，避免阻塞事件循环。
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+# 迭代结束标记
+_STOP = object()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """获取共享的有界线程池"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BLOCKING_POOL_MAX_WORKERS,
+            thread_name_prefix="blocking",
+        )
+        logger.info(f"阻塞调用线程池已创建，最大线程数: {settings.BLOCKING_POOL_MAX_WORKERS}")
+    return _executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    在线程池中执行同步函数
+
+    Args:
+        func: 同步函数
+        *args: 位置参数
+        **kwargs: 关键字参数
+
+    Returns:
+        函数返回值
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+async def iterate_blocking(iterator: Iterator[T]) -> AsyncIterator[T]:
+    """
+    在线程池中逐项消费同步迭代器
+
+    Args:
+        iterator: 同步迭代器（如同步流式生成）
+
+    Yields:
+        迭代器产出的每一项
+    """
+    while True:
+        item = await run_blocking(next, iterator, _STOP)
+        if item is _STOP:
+            return
+        yield item
+
+
+def shutdown_executor() -> None:
+    """关闭线程池（应用关闭时调用）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -13,20 +13,133 @@ class Settings(BaseSettings):
     # AI配置
     OPENAI_API_KEY: str = ""
     OPENAI_MODEL: str = "gpt-4-turbo-preview"
+    OPENAI_BASE_URL: str = "https://api.openai.com/v1"
     ANTHROPIC_API_KEY: str = ""
+    ANTHROPIC_MODEL: str = "claude-3-5-sonnet-latest"
+    ANTHROPIC_BASE_URL: str = "https://api.anthropic.com/v1"
+    ANTHROPIC_MAX_TOKENS: int = 1024
     
     # MiniMax配置（备用）
     MINIMAX_API_KEY: str = ""
     MINIMAX_MODEL: str = "MiniMax-M2.1"
+    MINIMAX_BASE_URL: str = "https://api.minimaxi.com/v1"
+    
+    # LLM HTTP 连接池
+    LLM_TIMEOUT: float = 60.0  # 秒
+    LLM_CONNECT_TIMEOUT: float = 10.0  # 秒
+    LLM_HTTP2: bool = True
+    LLM_POOL_MAX_CONNECTIONS: int = 100
+    LLM_POOL_MAX_KEEPALIVE: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 30.0  # 秒
+    
+    # LLM 响应缓存
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_SIZE: int = 1024
+    LLM_CACHE_TTL: float = 600.0  # 秒
+    LLM_COALESCE_ENABLED: bool = True  # 合并相同的并发请求
+    
+    # 多提供商路由（LLMService(provider="router")）
+    LLM_PROVIDERS: str = "minimax"  # 逗号分隔，如 "minimax,openai,anthropic"
+    LLM_ROUTER_WINDOW: int = 200  # 每个提供商保留的最近调用数
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 0.95  # 主请求超过该分位延迟时发出对冲请求
+    LLM_HEDGE_MIN_DELAY: float = 0.5  # 对冲等待下限（秒）
+    
+    # LLM 自适应并发限制（AIMD）
+    LLM_LIMITER_ENABLED: bool = True
+    LLM_LIMITER_INITIAL: int = 16
+    LLM_LIMITER_MIN: int = 1
+    LLM_LIMITER_MAX: int = 128
+    LLM_LIMITER_LATENCY_TARGET: float = 0.0  # 秒，<= 0 表示只根据 429/5xx/超时调整
+    LLM_LIMITER_MAX_QUEUE: int = 256
+    LLM_LIMITER_QUEUE_TIMEOUT: float = 30.0  # 秒
+    LLM_OVERLOAD_RETRY_AFTER: int = 5  # 过载拒绝时 503 响应的 Retry-After（秒）
+    # 认证网关写入的用户ID请求头（如 X-Authenticated-User），设置后只按该请求头查询套餐；
+    # 为空时按请求体中的 user_id 查询，只适用于可信调用方（客户端可冒用他人 user_id）
+    LLM_PLAN_USER_HEADER: str = ""
+    LLM_PLAN_CACHE_TTL: float = 60.0  # 用户套餐（排队优先级）缓存时间（秒）
+    
+    # Token 计数与提示词预算
+    TOKENIZER_ENCODING: str = "cl100k_base"
+    PROMPT_MAX_TOKENS: int = 6000  # 单次请求提示词的 token 上限
+    RAG_CONTEXT_MAX_TOKENS: int = 3000  # 其中知识库片段的 token 上限
+    
+    # 阻塞调用线程池（同步后端的卸载）
+    BLOCKING_POOL_MAX_WORKERS: int = 32
+    
+    # 会话存储：memory（单进程）/ sqlite（同机多 worker 共享）/ redis（多机共享）
+    SESSION_BACKEND: str = "memory"
+    SESSION_SQLITE_PATH: str = "./data/sessions.db"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    SESSION_REDIS_PREFIX: str = "session:"
+    SESSION_MAX_COUNT: int = 10000  # 最大会话数，超出时淘汰最久未访问的会话
+    SESSION_IDLE_TTL: float = 1800.0  # 会话空闲超时（秒），<= 0 表示不过期
+    SESSION_MAX_BYTES: int = 65536  # 单会话历史最大占用字节数（仅 memory）
+    SESSION_SWEEP_INTERVAL: float = 60.0  # 空闲会话清理间隔（秒）
+    
+    # 对话历史持久化（write-behind 写入 DATABASE_URL）
+    CHAT_HISTORY_PERSIST: bool = False
+    CHAT_HISTORY_FLUSH_INTERVAL_MS: int = 50  # 批量写入间隔（毫秒）
+    CHAT_HISTORY_FLUSH_SIZE: int = 500  # 累计多少条消息立即写入
+    CHAT_HISTORY_MAX_BUFFER: int = 50000  # 未落库消息的最大缓冲数
+    CHAT_HISTORY_MAX_ATTEMPTS: int = 8  # 单条消息最大写入次数，超过后转入死信文件
+    CHAT_HISTORY_DEAD_LETTER_PATH: str = "./data/history_dead_letter.jsonl"  # 为空时只记录日志
+    
+    # 长对话滚动摘要（较早的消息折叠为摘要，回复返回后在后台生成）
+    CHAT_SUMMARY_ENABLED: bool = False
+    CHAT_SUMMARY_TRIGGER_TOKENS: int = 2000  # 摘要之后的历史超过该 token 数时触发压缩
+    CHAT_SUMMARY_KEEP_MESSAGES: int = 4  # 压缩时保留的最近消息数
+    CHAT_SUMMARY_MAX_TOKENS: int = 300  # 摘要的 token 上限
+    
+    # 闲聊意图识别（问候/道别/致谢等直接模板回复，不走检索和 LLM）
+    INTENT_CLASSIFIER_ENABLED: bool = True
+    INTENT_CONFIDENCE_THRESHOLD: float = 0.8  # 闲聊意图概率达到该值才直接回复
+    INTENT_TRAINING_FILE: str = ""  # 标注数据（TSV），为空时使用内置数据
+    
+    # 标准问答（命中时直接返回整理好的答案，不调用 LLM）
+    FAQ_FILE: str = ""  # CSV 文件（question, answer[, source]），为空时不启用
+    FAQ_MATCH_THRESHOLD: float = 0.92  # 语义匹配的最低余弦相似度
+    
+    # 批量对话接口
+    CHAT_BATCH_MAX_ITEMS: int = 1000  # 单次请求的最大消息数
+    CHAT_BATCH_CONCURRENCY: int = 16  # 并发 LLM 调用数
     
     # 向量数据库配置
+    VECTOR_DB_TYPE: str = ""  # milvus / chroma / numpy，为空时不启用知识库检索
+    VECTOR_COLLECTION_NAME: str = "knowledge_base"
     MILVUS_HOST: str = "localhost"
     MILVUS_PORT: int = 19530
-    MILVUS_COLLECTION_NAME: str = "knowledge_base"
+    MILVUS_URI: str = ""  # 为空时使用 http://MILVUS_HOST:MILVUS_PORT
+    MILVUS_COLLECTION_NAME: str = ""  # 旧配置，设置时覆盖 Milvus 的 VECTOR_COLLECTION_NAME
+    MILVUS_TOKEN: str = ""
+    
+    # 知识库检索
+    KNOWLEDGE_BASE_DIR: str = "."  # 知识库文档根目录，文档ID取相对该目录的路径
+    EMBEDDING_MODEL: str = "text-embedding-3-small"  # OpenAI 兼容的向量模型
+    EMBEDDING_CACHE_DIR: str = "./data/embeddings"  # 文档向量磁盘缓存，为空时不缓存
+    EMBEDDING_QUERY_CACHE_SIZE: int = 1024  # 查询向量 LRU 条目数
+    EMBEDDING_BATCH_ENABLED: bool = True  # 并发查询合并为批量向量化请求
+    EMBEDDING_BATCH_MAX_SIZE: int = 32  # 每批最多条数
+    EMBEDDING_BATCH_MAX_DELAY: float = 0.005  # 最长等待（秒）
+    RAG_SCORE_THRESHOLD: float = 0.3  # 最低相关度分数（0~1）
+    RAG_TIMEOUT: float = 3.0  # 异步检索超时（秒），超时后本轮不使用知识库
+    RAG_HYBRID_ENABLED: bool = True  # 向量检索 + BM25 关键词检索（RRF 融合）
+    RAG_KEYWORD_INDEX_PATH: str = "./data/keyword_index.npz"  # 关键词索引文件，为空时只在内存中
+    RAG_RRF_K: int = 60  # RRF 平滑常数
+    RAG_KEYWORD_THRESHOLD: float = 0.1  # 关键词命中的最低相关度（BM25 归一化到 0~1，与向量分数不同尺度）
     
     # Chroma配置（备选）
     CHROMA_PERSIST_DIR: str = "./data/chroma"
     
+    # 嵌入式向量索引（VECTOR_DB_TYPE=numpy，无需外部服务）
+    NUMPY_VECTOR_DIR: str = "./data/vectors"
+    NUMPY_VECTOR_DTYPE: str = "float32"  # float32 / float16
+    NUMPY_VECTOR_NLIST: int = 0  # IVF 簇数，0 表示全量扫描
+    NUMPY_VECTOR_NPROBE: int = 8  # 检索时扫描的簇数
+    NUMPY_VECTOR_QUANTIZATION: str = "none"  # none / int8（1/4 内存）/ pq（默认 1/16 内存）
+    NUMPY_VECTOR_PQ_SUBSPACES: int = 0  # PQ 子空间数（每条向量的编码字节数），0 表示维度 / 4
+    NUMPY_VECTOR_RERANK: int = 10  # 量化检索取 k * rerank 个候选按原始向量重排
+    
     # 数据库配置
     DATABASE_URL: str = "sqlite+aiosqlite:///./data/app.db"
     
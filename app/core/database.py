@@ -0,0 +1,113 @@
+"""
+Database - 异步数据库引擎
+
+基于 SQLAlchemy 异步引擎（默认 SQLite + aiosqlite），进程内共享一个引擎和会话工厂。
+
+启动时创建缺失的表，并补齐旧版本数据库的表结构（create_all 不修改已有表）：
+- 缺少的列（如 chat_messages.metadata）用 ALTER TABLE ADD COLUMN 补上
+- 缺少的索引（如 chat_messages.session_id）补建
+- 变长的字符串列（如会话ID 36 -> 64）在 PostgreSQL 上放宽；SQLite 不检查长度，无需修改；
+  其他数据库只记录需要手动执行的 ALTER 语句
+"""
+
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import String, inspect, text
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.models.database import Base
+
+logger = logging.getLogger(__name__)
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+
+
+def get_engine() -> AsyncEngine:
+    """获取共享的异步引擎（首次调用时创建）"""
+    global _engine
+    if _engine is None:
+        url = make_url(settings.DATABASE_URL)
+        if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+            # SQLite 数据文件所在目录不存在时自动创建
+            os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        _engine = create_async_engine(url, pool_pre_ping=True)
+        logger.info(f"数据库引擎已创建: {url.render_as_string(hide_password=True)}")
+    return _engine
+
+
+def get_session_factory() -> async_sessionmaker:
+    """获取共享的异步会话工厂"""
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = async_sessionmaker(get_engine(), expire_on_commit=False)
+    return _session_factory
+
+
+async def init_db(engine: Optional[AsyncEngine] = None) -> None:
+    """
+    创建缺失的表
+
+    Args:
+        engine: 异步引擎（默认使用共享引擎）
+    """
+    async with (engine or get_engine()).begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+
+def upgrade_schema(conn: Connection) -> None:
+    """
+    补齐已有表缺少的列和索引，放宽变长的字符串列
+
+    Args:
+        conn: 同步连接（通过 `AsyncConnection.run_sync` 调用）
+    """
+    inspector = inspect(conn)
+    dialect = conn.dialect
+    quote = dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            ddl_type = column.type.compile(dialect=dialect)
+            current = existing.get(column.name)
+            if current is None:
+                conn.execute(text(
+                    f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {ddl_type}"
+                ))
+                logger.warning(f"数据库表结构升级: {table.name} 新增列 {column.name}")
+                continue
+            length = getattr(current["type"], "length", None)
+            if not (isinstance(column.type, String) and column.type.length and length):
+                continue
+            if length >= column.type.length or dialect.name == "sqlite":
+                continue
+            statement = (
+                f"ALTER TABLE {quote(table.name)} ALTER COLUMN {quote(column.name)} TYPE {ddl_type}"
+            )
+            if dialect.name == "postgresql":
+                conn.execute(text(statement))
+                logger.warning(f"数据库表结构升级: {table.name}.{column.name} 长度 {length} -> {column.type.length}")
+            else:
+                logger.warning(f"{table.name}.{column.name} 长度不足，请手动修改为 {ddl_type}: {statement}")
+
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(conn)
+                logger.warning(f"数据库表结构升级: {table.name} 新增索引 {index.name}")
+
+
+async def close_db() -> None:
+    """释放引擎连接池"""
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _session_factory = None
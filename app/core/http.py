@@ -0,0 +1,96 @@
+"""
+HTTP Client - 共享 HTTP 客户端
+
+为 LLM 等外部服务调用提供进程内共享的 httpx 客户端：
+- 连接池 + keep-alive，避免每次请求重新握手
+- 可选 HTTP/2（需要安装 h2）
+- 由应用生命周期统一创建和关闭
+"""
+
+import logging
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+
+
+def _http2_enabled() -> bool:
+    """是否启用 HTTP/2（未安装 h2 时自动降级为 HTTP/1.1）"""
+    if not settings.LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("未安装 h2，LLM 客户端降级为 HTTP/1.1")
+        return False
+    return True
+
+
+def _build_limits() -> httpx.Limits:
+    """连接池限制"""
+    return httpx.Limits(
+        max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+def _build_timeout() -> httpx.Timeout:
+    """超时配置"""
+    return httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    获取共享的异步 HTTP 客户端
+
+    首次调用（或客户端已关闭）时创建。
+
+    Returns:
+        httpx.AsyncClient 实例
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            http2=_http2_enabled(),
+            limits=_build_limits(),
+            timeout=_build_timeout(),
+        )
+        logger.info("共享异步 HTTP 客户端已创建")
+    return _async_client
+
+
+def get_sync_client() -> httpx.Client:
+    """
+    获取共享的同步 HTTP 客户端
+
+    Returns:
+        httpx.Client 实例
+    """
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        _sync_client = httpx.Client(
+            http2=_http2_enabled(),
+            limits=_build_limits(),
+            timeout=_build_timeout(),
+        )
+        logger.info("共享同步 HTTP 客户端已创建")
+    return _sync_client
+
+
+async def close_http_clients() -> None:
+    """关闭共享 HTTP 客户端（应用关闭时调用）"""
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+    logger.info("共享 HTTP 客户端已关闭")
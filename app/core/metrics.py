@@ -0,0 +1,56 @@
+"""
+Metrics - 轻量进程内指标
+
+提供固定分桶直方图，用于记录排队耗时、批大小等分布。
+"""
+
+import bisect
+from typing import Any, Dict, List, Sequence
+
+# 默认耗时分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    固定分桶直方图
+
+    Example:
+        ```python
+        hist = Histogram(LATENCY_BUCKETS)
+        hist.observe(0.12)
+        print(hist.snapshot())
+        ```
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        初始化直方图
+
+        Args:
+            buckets: 升序的分桶上界，最后隐含一个 +Inf 桶
+        """
+        self.buckets: List[float] = sorted(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """记录一个观测值"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """直方图快照（各桶为非累计计数）"""
+        labels = [f"le_{b:g}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": dict(zip(labels, self.counts)),
+        }
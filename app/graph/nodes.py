@@ -10,6 +10,12 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI
 
 from app.services.vector_store import VectorStoreService
+from app.services.intent_classifier import (
+    IntentClassifier,
+    SMALL_TALK_REPLIES,
+    get_intent_classifier,
+    small_talk_reply,
+)
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -24,6 +30,8 @@ class ChatGraphNodes:
         vector_store: VectorStoreService,
         similarity_top_k: int = 5,
         confidence_threshold: float = 0.7,
+        intent_classifier: Optional[IntentClassifier] = None,
+        intent_threshold: float = 0.8,
     ):
         """
         初始化节点类
@@ -33,11 +41,50 @@ class ChatGraphNodes:
             vector_store: 向量存储服务
             similarity_top_k: 检索返回的最大文档数
             confidence_threshold: 置信度阈值
+            intent_classifier: 意图分类器（默认使用共享实例）
+            intent_threshold: 闲聊意图直接回复的概率阈值
         """
         self.llm = llm
         self.vector_store = vector_store
         self.similarity_top_k = similarity_top_k
         self.confidence_threshold = confidence_threshold
+        self.intent_classifier = intent_classifier or get_intent_classifier()
+        self.intent_threshold = intent_threshold
+    
+    def classify_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        意图识别节点：在检索之前识别闲聊意图
+        
+        高置信度的闲聊（问候、道别、致谢等）直接填入模板回复，
+        并标记 skip_retrieval，后续跳过检索和生成。
+        
+        Args:
+            state: 当前状态
+            
+        Returns:
+            更新后的状态，包含 intent 和 intent_confidence
+        """
+        logger.info("Executing classify_node")
+        
+        question = state.get("messages", [])[-1].content if state.get("messages") else ""
+        
+        prediction = self.intent_classifier.classify(question)
+        state["intent"] = prediction.intent
+        state["intent_confidence"] = prediction.confidence
+        state["skip_retrieval"] = False
+        
+        if prediction.is_small_talk and prediction.confidence >= self.intent_threshold:
+            state["generated_answer"] = small_talk_reply(prediction.intent)
+            state["skip_retrieval"] = True
+            state["last_node"] = "classify"
+        
+        logger.info(f"Intent: {prediction.intent} ({prediction.confidence:.2f})")
+        
+        return state
+    
+    def route_after_classify(self, state: Dict[str, Any]) -> str:
+        """意图识别之后的路由：闲聊直接响应，其余进入检索"""
+        return "respond" if state.get("skip_retrieval") else "retrieve"
     
     def retrieve_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -201,8 +248,8 @@ class ChatGraphNodes:
         
         # 5. 简单的问题类型检查
         intent = state.get("intent", "")
-        if intent in ["greeting", "farewell"]:
-            score = 1.0  # 问候语总是高置信度
+        if intent in SMALL_TALK_REPLIES:
+            score = 1.0  # 闲聊意图（问候、道别、致谢等）总是高置信度
         
         # 归一化分数到 0-1
         confidence = min(score, 1.0)
@@ -372,4 +419,6 @@ def create_nodes(
         vector_store=vector_store,
         similarity_top_k=kwargs.get("similarity_top_k", 5),
         confidence_threshold=kwargs.get("confidence_threshold", 0.7),
+        intent_classifier=kwargs.get("intent_classifier"),
+        intent_threshold=kwargs.get("intent_threshold", settings.INTENT_CONFIDENCE_THRESHOLD),
     )
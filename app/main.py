@@ -9,6 +9,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
+from app.core.http import get_async_client, close_http_clients
+from app.core.concurrency import run_blocking, shutdown_executor
+from app.services.tokenizer import get_tokenizer
 from app.api import chat, knowledge, health
 
 # 配置日志
@@ -26,11 +29,19 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 AI Customer Service Bot 启动中...")
     logger.info(f"📡 API文档: http://{settings.APP_HOST}:{settings.APP_PORT}/docs")
     logger.info(f"🔧 调试模式: {settings.DEBUG}")
+    get_async_client()
+    # 在线程池中加载分词器，首个请求不在事件循环中加载编码表
+    await run_blocking(get_tokenizer().warm_up)
+    chat_service = chat.get_chat_service_instance()
+    await chat_service.start()
     
     yield
     
     # 关闭时
     logger.info("👋 AI Customer Service Bot 关闭中...")
+    await chat_service.stop()
+    await close_http_clients()
+    shutdown_executor()
 
 
 # 创建FastAPI应用
@@ -3,7 +3,7 @@ Database Models - 数据库模型
 """
 
 from sqlalchemy import Column, String, Integer, Float, DateTime, Text, Boolean, JSON
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import declarative_base
 from datetime import datetime
 
 Base = declarative_base()
@@ -20,7 +20,8 @@ class DocumentModel(Base):
     status = Column(String(20), default="pending")
     chunk_count = Column(Integer, default=0)
     content_hash = Column(String(64))
-    metadata = Column(JSON, default={})
+    # `metadata` 是 Declarative 保留属性名，列名保持不变
+    metadata_ = Column("metadata", JSON, default={})
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -29,8 +30,8 @@ class ChatSessionModel(Base):
     """对话会话模型"""
     __tablename__ = "chat_sessions"
     
-    id = Column(String(36), primary_key=True)
-    user_id = Column(String(36))
+    id = Column(String(64), primary_key=True)
+    user_id = Column(String(64))
     title = Column(String(255))
     message_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -42,12 +43,13 @@ class ChatMessageModel(Base):
     __tablename__ = "chat_messages"
     
     id = Column(String(36), primary_key=True)
-    session_id = Column(String(36), nullable=False)
+    session_id = Column(String(64), nullable=False, index=True)
     role = Column(String(20), nullable=False)
     content = Column(Text, nullable=False)
+    metadata_ = Column("metadata", JSON, default={})
     tokens = Column(Integer, default=0)
     latency_ms = Column(Float)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
 
 class UserModel(Base):
@@ -0,0 +1,126 @@
+"""
+Chat Channel - 连接级对话状态
+
+WebSocket 连接建立时加载一次会话历史，之后每条消息直接使用连接持有的
+历史和检索结果，不再经过服务实例查找、请求校验和会话存储读取。
+"""
+
+import logging
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from app.services.chat_service import ChatService
+from app.services.rag_service import RetrievalResult
+from app.services.session_store import MessageRecord
+
+logger = logging.getLogger(__name__)
+
+
+class ChatChannel:
+    """
+    单个连接的对话状态（会话历史 + 最近的检索结果）
+
+    连接存续期间认为该会话由此连接独占；会话仍写入会话存储和持久化历史，
+    断线重连后从存储恢复。
+
+    Example:
+        ```python
+        channel = ChatChannel(chat_service, session_id="user-123")
+        await channel.open()
+
+        async for event in channel.stream("你们的服务怎么收费？"):
+            print(event)
+        ```
+    """
+
+    def __init__(
+        self,
+        chat_service: ChatService,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        use_rag: bool = True,
+        top_k: int = 5,
+        plan: Optional[str] = None,
+        retrieval_cache_size: int = 32
+    ):
+        """
+        初始化连接状态
+
+        Args:
+            chat_service: 对话服务
+            session_id: 会话ID（可选，自动生成）
+            user_id: 用户ID（可选）
+            use_rag: 默认是否使用 RAG 检索
+            top_k: RAG 检索返回的最大结果数
+            plan: 用户套餐（UserModel.plan），上游繁忙时决定排队优先级
+            retrieval_cache_size: 连接内缓存的检索结果数（重复提问不再检索）
+        """
+        self.chat_service = chat_service
+        self.session_id = session_id or f"session_{uuid.uuid4().hex[:8]}"
+        self.user_id = user_id
+        self.use_rag = use_rag
+        self.top_k = top_k
+        self.plan = plan
+        self.retrieval_cache_size = retrieval_cache_size
+
+        self.history: Deque[MessageRecord] = deque(maxlen=chat_service.max_history)
+        self._retrievals: "OrderedDict[str, List[RetrievalResult]]" = OrderedDict()
+
+    async def open(self) -> None:
+        """加载会话历史（热会话缓存未命中时从持久化存储加载）"""
+        history = await self.chat_service.aget_history(self.session_id, limit=self.history.maxlen)
+        self.history.extend(history)
+        logger.info(f"对话连接已建立: {self.session_id}, 历史 {len(self.history)} 条")
+
+    async def stream(
+        self,
+        message: str,
+        use_rag: Optional[bool] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式对话（事件格式同 `ChatService.astream_chat`）
+
+        Args:
+            message: 用户消息
+            use_rag: 是否使用 RAG 检索（默认使用连接的设置）
+
+        Yields:
+            Dict[str, Any]: delta 增量事件，最后是 done 结束事件
+        """
+        use_rag = self.use_rag if use_rag is None else use_rag
+        retrieval = None
+        if use_rag:
+            retrieval = await self._retrieve(message)
+            use_rag = retrieval is not None  # 检索失败时降级为不使用 RAG
+
+        events = self.chat_service.astream_chat(
+            message=message,
+            session_id=self.session_id,
+            user_id=self.user_id,
+            use_rag=use_rag,
+            top_k=self.top_k,
+            plan=self.plan,
+            retrieval=retrieval,
+            history=self.history
+        )
+        try:
+            async for event in events:
+                yield event
+        finally:
+            # 取消生成时立即关闭上游流
+            await events.aclose()
+
+    async def _retrieve(self, message: str) -> Optional[List[RetrievalResult]]:
+        """检索知识库，连接内相同的问题复用上次的结果"""
+        results = self._retrievals.get(message)
+        if results is not None:
+            self._retrievals.move_to_end(message)
+            return results
+
+        results = await self.chat_service.aretrieve(message, self.top_k)
+        if results is not None:
+            self._retrievals[message] = results
+            while len(self._retrievals) > self.retrieval_cache_size:
+                self._retrievals.popitem(last=False)
+        return results
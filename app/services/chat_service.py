@@ -4,18 +4,34 @@ Chat Service - 对话服务
 整合 RAG 检索和 LLM 生成，提供完整的对话功能。
 """
 
+import asyncio
 import logging
+import time
 import uuid
-from typing import Optional, List, Dict, Any
-from datetime import datetime
 from collections import defaultdict
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator, Iterable, Sequence, MutableSequence
+from datetime import datetime
 
 from app.core.config import settings
-from app.services.rag_service import RAGService, RetrievalResult
+from app.core.concurrency import run_blocking, iterate_blocking
+from app.services.rag_service import RAGService, RetrievalResult, document_id, source_ref
 from app.services.llm_service import LLMService, DEFAULT_SYSTEM_PROMPT
+from app.services.llm_limiter import LimiterOverloadedError
+from app.services.context_packer import ContextPacker
+from app.services.tokenizer import TOKENS_PER_MESSAGE
+from app.services.session_store import (
+    BaseSessionStore, ConversationSummary, MessageRecord, create_session_store
+)
+from app.services.history_store import DatabaseHistoryStore
+from app.services.history_compactor import HistoryCompactor
+from app.services.intent_classifier import IntentClassifier, get_intent_classifier, small_talk_reply
+from app.services.faq_index import FAQIndex, FAQMatch
 
 logger = logging.getLogger(__name__)
 
+# LLM 不可用时的兜底回复
+FALLBACK_RESPONSE = "抱歉，我现在无法回答您的问题。请稍后再试。"
+
 
 class ChatService:
     """
@@ -48,7 +64,14 @@ class ChatService:
         llm_service: Optional[LLMService] = None,
         rag_service: Optional[RAGService] = None,
         max_history: int = 10,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        max_prompt_tokens: Optional[int] = None,
+        max_context_tokens: Optional[int] = None,
+        history_store: Optional[DatabaseHistoryStore] = None,
+        session_store: Optional[BaseSessionStore] = None,
+        compactor: Optional[HistoryCompactor] = None,
+        intent_classifier: Optional[IntentClassifier] = None,
+        faq_index: Optional[FAQIndex] = None
     ):
         """
         初始化对话服务
@@ -58,6 +81,13 @@ class ChatService:
             rag_service: RAG 服务实例
             max_history: 最大对话历史轮数
             system_prompt: 系统提示词
+            max_prompt_tokens: 提示词 token 上限（默认使用配置 PROMPT_MAX_TOKENS）
+            max_context_tokens: 知识库片段 token 上限（默认使用配置 RAG_CONTEXT_MAX_TOKENS）
+            history_store: 持久化历史存储（默认按配置 CHAT_HISTORY_PERSIST 创建）
+            session_store: 会话存储（默认按配置 SESSION_BACKEND 创建）
+            compactor: 对话历史压缩器（默认按配置 CHAT_SUMMARY_ENABLED 创建）
+            intent_classifier: 闲聊意图分类器（默认按配置 INTENT_CLASSIFIER_ENABLED 使用共享实例）
+            faq_index: 标准问答索引（默认按配置 FAQ_FILE 加载）
         """
         self.llm_service = llm_service or LLMService(
             provider="minimax",  # 使用 MiniMax（用户已配置）
@@ -68,9 +98,48 @@ class ChatService:
         
         self.max_history = max_history
         self.system_prompt = system_prompt or DEFAULT_SYSTEM_PROMPT
+        self.max_prompt_tokens = max_prompt_tokens or settings.PROMPT_MAX_TOKENS
+        self.max_context_tokens = max_context_tokens or settings.RAG_CONTEXT_MAX_TOKENS
+        self.context_packer = ContextPacker()
         
-        # 对话历史存储（内存，生产环境应使用数据库）
-        self._sessions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # 会话存储（近期对话，多 worker 部署时使用 sqlite / redis 共享）
+        # 空的内存存储 len() 为 0，不能用 or 判断是否传入
+        self._sessions = session_store if session_store is not None else create_session_store(
+            max_messages=(self.max_history + 1) * 2  # user + assistant pairs
+        )
+        
+        # 持久化历史（write-behind），会话存储作为热会话缓存
+        if history_store is None and settings.CHAT_HISTORY_PERSIST:
+            history_store = DatabaseHistoryStore(
+                flush_interval=settings.CHAT_HISTORY_FLUSH_INTERVAL_MS / 1000,
+                flush_size=settings.CHAT_HISTORY_FLUSH_SIZE,
+                max_buffer=settings.CHAT_HISTORY_MAX_BUFFER,
+                max_attempts=settings.CHAT_HISTORY_MAX_ATTEMPTS,
+                dead_letter_path=settings.CHAT_HISTORY_DEAD_LETTER_PATH or None
+            )
+        self.history_store = history_store
+        
+        # 长对话的滚动摘要：较早的消息折叠为摘要，提示词只带摘要 + 近期消息
+        if compactor is None and settings.CHAT_SUMMARY_ENABLED:
+            compactor = HistoryCompactor(
+                generate=self._agenerate,
+                store=self._sessions,
+                trigger_tokens=settings.CHAT_SUMMARY_TRIGGER_TOKENS,
+                keep_messages=settings.CHAT_SUMMARY_KEEP_MESSAGES,
+                max_summary_tokens=settings.CHAT_SUMMARY_MAX_TOKENS
+            )
+        self.compactor = compactor
+        
+        # 闲聊意图识别：高置信度的问候/道别/致谢直接模板回复
+        if intent_classifier is None and settings.INTENT_CLASSIFIER_ENABLED:
+            intent_classifier = get_intent_classifier()
+        self.intent_classifier = intent_classifier
+        self.intent_threshold = settings.INTENT_CONFIDENCE_THRESHOLD
+        
+        # 标准问答：命中时直接返回整理好的答案
+        if faq_index is None and settings.FAQ_FILE:
+            faq_index = self._load_faq(settings.FAQ_FILE)
+        self.faq_index = faq_index
         
         logger.info("ChatService 初始化完成")
     
@@ -110,50 +179,30 @@ class ChatService:
         # 生成或使用会话ID
         session_id = session_id or f"session_{uuid.uuid4().hex[:8]}"
         
-        # 检索知识库
-        context = ""
-        sources = []
-        confidence = 0.0
+        # 闲聊 / 标准问答：直接回复，不检索、不调用 LLM
+        direct = self._small_talk(message) or self._faq_reply(message, use_rag)
+        if direct is not None:
+            response_text, sources, confidence = direct
+            self._save_turn(
+                session_id, message, response_text, bool(sources), sources, confidence, user_id=user_id
+            )
+            return self._direct_result(session_id, *direct)
         
-        if use_rag:
-            try:
-                results = self.rag_service.retrieve_documents(
-                    query=message,
-                    top_k=top_k
-                )
-                
-                # 构建上下文
-                context_parts = []
-                for result in results:
-                    context_parts.append(
-                        f"[来源: {result.metadata.get('filename', '未知')}]\n"
-                        f"{result.content}"
-                    )
-                    sources.append({
-                        "content": result.content,
-                        "score": result.score,
-                        "filename": result.metadata.get("filename", "未知"),
-                        "chunk_id": result.chunk_id
-                    })
-                
-                context = "\n\n".join(context_parts)
-                confidence = results[0].score if results else 0.0
-                
-                logger.info(f"RAG 检索完成，找到 {len(results)} 个相关文档")
-                
-            except Exception as e:
-                logger.warning(f"RAG 检索失败: {e}")
-                use_rag = False  # 降级处理
+        # 检索知识库
+        chunks, sources, confidence, use_rag = self._retrieve_context(
+            message, top_k, use_rag
+        )
         
         # 构建消息
         messages = self._build_messages(
             user_message=message,
             session_id=session_id,
-            context=context,
+            chunks=chunks,
             use_rag=use_rag
         )
         
         # 生成回复
+        start = time.monotonic()
         try:
             if stream:
                 # 流式生成
@@ -164,23 +213,104 @@ class ChatService:
                 # 普通生成
                 response_text = self.llm_service.generate(messages)
                 
+        except LimiterOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"LLM 生成失败: {e}")
-            response_text = "抱歉，我现在无法回答您的问题。请稍后再试。"
+            response_text = FALLBACK_RESPONSE
+        latency_ms = (time.monotonic() - start) * 1000
         
         # 保存对话历史
-        self._save_message(
-            session_id=session_id,
-            role="user",
-            content=message,
-            metadata={"use_rag": use_rag, "sources_count": len(sources)}
+        self._save_turn(
+            session_id, message, response_text, use_rag, sources, confidence,
+            user_id=user_id, latency_ms=latency_ms
         )
-        self._save_message(
+        
+        logger.info(f"对话完成，会话: {session_id}")
+        
+        return {
+            "response": response_text,
+            "session_id": session_id,
+            "sources": sources,
+            "confidence": confidence,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    async def achat(
+        self,
+        message: str,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        use_rag: bool = True,
+        top_k: int = 5,
+        plan: Optional[str] = None,
+        retrieval: Optional[List[RetrievalResult]] = None
+    ) -> Dict[str, Any]:
+        """
+        发送对话消息（异步）
+        
+        与 `chat` 相同的流程，但检索和生成都不会阻塞事件循环：
+        原生异步的后端直接 await，仅有同步接口的后端卸载到有界线程池。
+        
+        Args:
+            message: 用户消息
+            session_id: 会话ID（可选，自动生成）
+            user_id: 用户ID（可选）
+            use_rag: 是否使用 RAG 检索
+            top_k: RAG 检索返回的最大结果数
+            plan: 用户套餐（UserModel.plan），上游繁忙时决定排队优先级
+            retrieval: 已完成的检索结果（批量对话预先批量检索），提供时不再检索
+            
+        Returns:
+            Dict[str, Any]: 包含响应、会话ID、时间戳等
+            
+        Raises:
+            LimiterOverloadedError: LLM 上游过载，请求被拒绝（不写入历史）
+        """
+        session_id = session_id or f"session_{uuid.uuid4().hex[:8]}"
+        await self._load_session(session_id)
+        
+        direct = await self._adirect_reply(message, use_rag)
+        if direct is not None:
+            response_text, sources, confidence = direct
+            await self._call_store(
+                self._save_turn, session_id, message, response_text, bool(sources), sources,
+                confidence, user_id=user_id
+            )
+            return self._direct_result(session_id, *direct)
+        
+        if use_rag and retrieval is not None:
+            chunks, sources, confidence, use_rag = self._format_results(retrieval)
+        else:
+            chunks, sources, confidence, use_rag = await self._aretrieve_context(
+                message, top_k, use_rag
+            )
+        summary, history = await self._call_store(self._read_history, session_id)
+        messages = self._build_messages(
+            user_message=message,
             session_id=session_id,
-            role="assistant",
-            content=response_text,
-            metadata={"confidence": confidence, "sources": sources}
+            chunks=chunks,
+            use_rag=use_rag,
+            history=history,
+            summary=summary
+        )
+        
+        start = time.monotonic()
+        try:
+            response_text = await self._agenerate(messages, plan)
+        except LimiterOverloadedError:
+            # 过载拒绝交给调用方（返回 503），本轮不写入历史
+            raise
+        except Exception as e:
+            logger.error(f"LLM 生成失败: {e}")
+            response_text = FALLBACK_RESPONSE
+        latency_ms = (time.monotonic() - start) * 1000
+        
+        await self._call_store(
+            self._save_turn, session_id, message, response_text, use_rag, sources, confidence,
+            user_id=user_id, latency_ms=latency_ms
         )
+        self._schedule_compaction(session_id)
         
         logger.info(f"对话完成，会话: {session_id}")
         
@@ -192,47 +322,577 @@ class ChatService:
             "timestamp": datetime.now().isoformat()
         }
     
+    async def abatch_chat(
+        self,
+        requests: Sequence[Dict[str, Any]],
+        top_k: int = 5,
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        批量对话（离线回放、批量预生成回答）
+        
+        所有需要 RAG 的消息合并为一次批量检索；LLM 调用并发执行，
+        并发数不超过 concurrency。同一会话的消息按提交顺序依次执行，
+        以保证多轮对话的历史正确；不同会话之间互不等待。
+        
+        Args:
+            requests: 请求列表，每项为 `achat` 的参数（message、session_id、user_id、use_rag、plan）
+            top_k: RAG 检索返回的最大结果数
+            concurrency: 最大并发 LLM 调用数（默认使用配置 CHAT_BATCH_CONCURRENCY）
+            
+        Yields:
+            Dict[str, Any]: 按完成顺序产出，`index` 为请求在列表中的位置；
+            成功时与 `achat` 的返回相同，失败时为 `{"index": ..., "error": ...}`
+        """
+        requests = [dict(request) for request in requests]
+        
+        # 一次批量检索（相同问题只检索一次）
+        queries = list(dict.fromkeys(
+            request["message"] for request in requests if request.get("use_rag", True)
+        ))
+        retrievals = await self._aretrieve_batch(queries, top_k) if queries else {}
+        for request in requests:
+            if request.get("use_rag", True):
+                retrieval = retrievals.get(request["message"]) if retrievals is not None else None
+                if retrieval is None:
+                    request["use_rag"] = False  # 检索失败或超时，降级为不使用 RAG
+                else:
+                    request["retrieval"] = retrieval
+        
+        # 同一会话的消息串行，未指定会话的消息各自独立
+        groups: Dict[Any, List[int]] = defaultdict(list)
+        for index, request in enumerate(requests):
+            groups[request.get("session_id") or ("__single__", index)].append(index)
+        
+        semaphore = asyncio.Semaphore(concurrency or settings.CHAT_BATCH_CONCURRENCY)
+        results: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        
+        async def run_group(indexes: List[int]) -> None:
+            for index in indexes:
+                async with semaphore:
+                    try:
+                        result = await self.achat(top_k=top_k, **requests[index])
+                        result = {"index": index, **result}
+                    except Exception as e:
+                        logger.error(f"批量对话第 {index} 条失败: {e}")
+                        result = {"index": index, "error": str(e)}
+                await results.put(result)
+        
+        tasks = [asyncio.create_task(run_group(indexes)) for indexes in groups.values()]
+        try:
+            for _ in range(len(requests)):
+                yield await results.get()
+        finally:
+            # 客户端断开时取消尚未完成的请求
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _aretrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int
+    ) -> Optional[Dict[str, Optional[List[RetrievalResult]]]]:
+        """
+        批量检索（异步），RAG 服务没有异步接口时在线程池中执行
+        
+        Returns:
+            查询 -> 检索结果（单个查询失败或超时为 None）；整批失败时返回 None
+        """
+        try:
+            if hasattr(self.rag_service, "aretrieve_batch"):
+                results = await self.rag_service.aretrieve_batch(queries, top_k=top_k)
+            else:
+                results = await run_blocking(self.rag_service.retrieve_batch, queries, top_k=top_k)
+        except Exception as e:
+            logger.warning(f"RAG 批量检索失败: {e}")
+            return None
+        
+        failed = sum(1 for result in results if result is None)
+        logger.info(f"RAG 批量检索完成，{len(queries)} 个查询，{failed} 个失败")
+        return dict(zip(queries, results))
+    
+    async def astream_chat(
+        self,
+        message: str,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        use_rag: bool = True,
+        top_k: int = 5,
+        plan: Optional[str] = None,
+        retrieval: Optional[List[RetrievalResult]] = None,
+        history: Optional[MutableSequence[MessageRecord]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式对话
+        
+        逐个产出增量事件，生成结束后产出一个 done 事件并保存对话历史。
+        
+        Args:
+            message: 用户消息
+            session_id: 会话ID（可选，自动生成）
+            user_id: 用户ID（可选）
+            use_rag: 是否使用 RAG 检索
+            top_k: RAG 检索返回的最大结果数
+            plan: 用户套餐（UserModel.plan），上游繁忙时决定排队优先级
+            retrieval: 已完成的检索结果，提供时不再检索
+            history: 调用方持有的会话历史（WebSocket 连接级状态），提供时不再
+                从会话存储读取，本轮对话保存后追加到其中
+            
+        Yields:
+            Dict[str, Any]: `{"type": "delta", "content": ...}` 增量事件，
+            最后是 `{"type": "done", ...}` 结束事件（含会话ID、来源、置信度）
+            
+        Raises:
+            LimiterOverloadedError: LLM 上游过载，请求被拒绝（不写入历史）
+        """
+        session_id = session_id or f"session_{uuid.uuid4().hex[:8]}"
+        if history is None:
+            await self._load_session(session_id)
+        
+        direct = await self._adirect_reply(message, use_rag)
+        if direct is not None:
+            response_text, sources, confidence = direct
+            turn = await self._call_store(
+                self._save_turn, session_id, message, response_text, bool(sources), sources,
+                confidence, user_id=user_id
+            )
+            if history is not None:
+                history.extend(turn)
+            yield {"type": "delta", "content": response_text}
+            yield {"type": "done", **self._direct_result(session_id, *direct)}
+            return
+        
+        if use_rag and retrieval is not None:
+            chunks, sources, confidence, use_rag = self._format_results(retrieval)
+        else:
+            chunks, sources, confidence, use_rag = await self._aretrieve_context(
+                message, top_k, use_rag
+            )
+        # 检索完成后再读取历史，紧接着构建提示词（包含等待期间同一会话写入的消息）
+        summary, recent = await self._call_store(
+            self._read_history, session_id,
+            None if history is None else list(history)[-self.max_history:]
+        )
+        messages = self._build_messages(
+            user_message=message,
+            session_id=session_id,
+            chunks=chunks,
+            use_rag=use_rag,
+            history=recent,
+            summary=summary
+        )
+        
+        pieces: List[str] = []
+        start = time.monotonic()
+        stream = self._astream(messages, plan)
+        try:
+            async for piece in stream:
+                pieces.append(piece)
+                yield {"type": "delta", "content": piece}
+        except LimiterOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"LLM 流式生成失败: {e}")
+            if not pieces:
+                pieces.append(FALLBACK_RESPONSE)
+                yield {"type": "delta", "content": FALLBACK_RESPONSE}
+        finally:
+            # 调用方中止（取消、断开）时立即关闭上游流
+            await stream.aclose()
+        
+        response_text = "".join(pieces)
+        latency_ms = (time.monotonic() - start) * 1000
+        turn = await self._call_store(
+            self._save_turn, session_id, message, response_text, use_rag, sources, confidence,
+            user_id=user_id, latency_ms=latency_ms
+        )
+        if history is not None:
+            history.extend(turn)
+        self._schedule_compaction(session_id)
+        
+        logger.info(f"流式对话完成，会话: {session_id}")
+        
+        yield {
+            "type": "done",
+            "response": response_text,
+            "session_id": session_id,
+            "sources": sources,
+            "confidence": confidence,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    def _small_talk(self, message: str) -> Optional[Tuple[str, List[Dict[str, Any]], float]]:
+        """
+        识别闲聊意图
+        
+        Returns:
+            高置信度的闲聊意图返回 (模板回复, [], 置信度)，否则返回 None
+        """
+        if self.intent_classifier is None:
+            return None
+        try:
+            prediction = self.intent_classifier.classify(message)
+        except Exception as e:
+            logger.warning(f"意图识别失败: {e}")
+            return None
+        if not prediction.is_small_talk or prediction.confidence < self.intent_threshold:
+            return None
+        logger.info(f"闲聊意图 {prediction.intent}（{prediction.confidence:.2f}），使用模板回复")
+        return small_talk_reply(prediction.intent), [], prediction.confidence
+    
+    def _faq_reply(
+        self,
+        message: str,
+        use_rag: bool
+    ) -> Optional[Tuple[str, List[Dict[str, Any]], float]]:
+        """
+        匹配标准问答（不使用知识库时跳过）
+        
+        Returns:
+            命中时返回 (标准答案, 来源列表, 相似度)，否则返回 None
+        """
+        if self.faq_index is None or not use_rag:
+            return None
+        try:
+            match = self.faq_index.match(message)
+        except Exception as e:
+            logger.warning(f"FAQ 匹配失败: {e}")
+            return None
+        return self._format_faq(match)
+    
+    async def _adirect_reply(
+        self,
+        message: str,
+        use_rag: bool
+    ) -> Optional[Tuple[str, List[Dict[str, Any]], float]]:
+        """闲聊 / 标准问答直接回复（异步，外部向量模型的匹配在线程池中执行）"""
+        direct = self._small_talk(message)
+        if direct is not None:
+            return direct
+        if self.faq_index is not None and self.faq_index.blocking:
+            return await run_blocking(self._faq_reply, message, use_rag)
+        return self._faq_reply(message, use_rag)
+    
+    @staticmethod
+    def _format_faq(match: Optional[FAQMatch]) -> Optional[Tuple[str, List[Dict[str, Any]], float]]:
+        """整理 FAQ 匹配结果的来源"""
+        if match is None:
+            return None
+        entry = match.entry
+        logger.info(f"命中标准问答 {entry.faq_id}（{match.score:.2f}），直接返回答案")
+        source = {
+            "content": entry.answer,
+            "score": match.score,
+            "filename": entry.source,
+            "chunk_id": entry.faq_id,
+            "doc_id": entry.source
+        }
+        return entry.answer, [source], match.score
+    
+    @staticmethod
+    def _direct_result(
+        session_id: str,
+        response_text: str,
+        sources: List[Dict[str, Any]],
+        confidence: float
+    ) -> Dict[str, Any]:
+        """直接回复（闲聊模板、标准问答）的返回结果"""
+        return {
+            "response": response_text,
+            "session_id": session_id,
+            "sources": sources,
+            "confidence": confidence,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    def _load_faq(self, path: str) -> Optional[FAQIndex]:
+        """
+        按配置加载标准问答，文件不存在或格式错误时不启用
+        
+        配置了 OPENAI_API_KEY 时与知识库共用向量模型（EMBEDDING_MODEL，共享查询缓存和
+        微批处理），否则或创建失败时使用字符 n-gram 哈希向量（只能匹配字面相近的问法）。
+        """
+        embeddings = None
+        if settings.OPENAI_API_KEY and hasattr(self.rag_service, "embeddings"):
+            try:
+                embeddings = self.rag_service.embeddings
+            except Exception as e:
+                logger.warning(f"向量模型不可用，标准问答使用哈希向量: {e}")
+        try:
+            return FAQIndex.from_csv(
+                path, embeddings=embeddings, threshold=settings.FAQ_MATCH_THRESHOLD
+            )
+        except Exception as e:
+            logger.warning(f"加载标准问答失败: {path}, {e}")
+            return None
+    
+    def _retrieve_context(
+        self,
+        message: str,
+        top_k: int,
+        use_rag: bool
+    ) -> Tuple[List[RetrievalResult], List[Dict[str, Any]], float, bool]:
+        """
+        检索知识库
+        
+        Args:
+            message: 用户消息
+            top_k: 最大结果数
+            use_rag: 是否使用 RAG 检索
+            
+        Returns:
+            (检索结果, 来源列表, 置信度, 是否使用 RAG)，检索失败时降级为不使用 RAG
+        """
+        if not use_rag:
+            return [], [], 0.0, False
+        
+        try:
+            results = self.rag_service.retrieve_documents(
+                query=message,
+                top_k=top_k
+            )
+        except Exception as e:
+            logger.warning(f"RAG 检索失败: {e}")
+            return [], [], 0.0, False  # 降级处理
+        
+        return self._format_results(results)
+    
+    async def _aretrieve_context(
+        self,
+        message: str,
+        top_k: int,
+        use_rag: bool
+    ) -> Tuple[List[RetrievalResult], List[Dict[str, Any]], float, bool]:
+        """
+        检索知识库（异步）
+        
+        RAG 服务没有异步接口时，在线程池中执行同步检索。
+        """
+        if not use_rag:
+            return [], [], 0.0, False
+        
+        results = await self.aretrieve(message, top_k)
+        if results is None:
+            return [], [], 0.0, False  # 降级处理
+        
+        return self._format_results(results)
+    
+    async def aretrieve(
+        self,
+        message: str,
+        top_k: int = 5
+    ) -> Optional[List[RetrievalResult]]:
+        """
+        检索知识库（异步），RAG 服务没有异步接口时在线程池中执行
+        
+        Args:
+            message: 查询文本
+            top_k: 最大结果数
+            
+        Returns:
+            检索结果；检索失败时返回 None
+        """
+        try:
+            if hasattr(self.rag_service, "aretrieve_documents"):
+                return await self.rag_service.aretrieve_documents(
+                    query=message,
+                    top_k=top_k
+                )
+            return await run_blocking(
+                self.rag_service.retrieve_documents,
+                query=message,
+                top_k=top_k
+            )
+        except Exception as e:
+            logger.warning(f"RAG 检索失败: {e}")
+            return None
+    
+    def _format_results(
+        self,
+        results: List[RetrievalResult]
+    ) -> Tuple[List[RetrievalResult], List[Dict[str, Any]], float, bool]:
+        """整理检索结果的来源列表和置信度"""
+        sources = [
+            {
+                "content": result.content,
+                "score": result.score,
+                "filename": result.metadata.get("filename", "未知"),
+                "chunk_id": result.chunk_id,
+                "doc_id": document_id(result)
+            }
+            for result in results
+        ]
+        confidence = results[0].score if results else 0.0
+        
+        logger.info(f"RAG 检索完成，找到 {len(results)} 个相关文档")
+        
+        return results, sources, confidence, True
+    
+    async def _agenerate(
+        self,
+        messages: List[Dict[str, str]],
+        plan: Optional[str] = None
+    ) -> str:
+        """生成回复（异步），同步后端在线程池中执行"""
+        if hasattr(self.llm_service, "agenerate"):
+            return await self.llm_service.agenerate(messages, plan=plan)
+        return await run_blocking(self.llm_service.generate, messages)
+    
+    def _astream(
+        self,
+        messages: List[Dict[str, str]],
+        plan: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """流式生成（异步），同步后端在线程池中逐块消费"""
+        if hasattr(self.llm_service, "astream"):
+            return self.llm_service.astream(messages, plan=plan)
+        return iterate_blocking(self.llm_service.stream(messages))
+    
+    def _save_turn(
+        self,
+        session_id: str,
+        message: str,
+        response_text: str,
+        use_rag: bool,
+        sources: List[Dict[str, Any]],
+        confidence: float,
+        user_id: Optional[str] = None,
+        latency_ms: Optional[float] = None
+    ) -> List[MessageRecord]:
+        """
+        保存一轮对话（用户消息 + 助手回复），一次写入会话存储
+        
+        Returns:
+            List[MessageRecord]: 本轮保存的消息
+        """
+        user = self._make_message(
+            "user", message, {"use_rag": use_rag, "sources_count": len(sources)}
+        )
+        # 历史中只保存来源引用，片段内容在读取历史时按需展开
+        assistant = self._make_message(
+            "assistant", response_text,
+            {"confidence": confidence, "sources": [source_ref(s) for s in sources]}
+        )
+        self._sessions.extend(session_id, [user, assistant])
+        
+        if self.history_store is not None:
+            self.history_store.record(session_id, user, user_id=user_id)
+            self.history_store.record(session_id, assistant, user_id=user_id, latency_ms=latency_ms)
+        return [user, assistant]
+    
+    def _schedule_compaction(self, session_id: str) -> None:
+        """回复完成后在后台检查是否需要压缩对话历史（不阻塞本次请求）"""
+        if self.compactor is None:
+            return
+        self.compactor.schedule(
+            session_id, lambda: self._call_store(self.get_history, session_id)
+        )
+    
+    async def _call_store(self, func, *args, **kwargs) -> Any:
+        """调用会话存储相关操作，涉及 I/O 的后端卸载到线程池"""
+        if self._sessions.blocking:
+            return await run_blocking(func, *args, **kwargs)
+        return func(*args, **kwargs)
+    
+    def _read_history(
+        self,
+        session_id: str,
+        history: Optional[Iterable[MessageRecord]] = None
+    ) -> Tuple[Optional[ConversationSummary], List[MessageRecord]]:
+        """
+        读取会话的近期消息；启用压缩器时一并读取摘要，只返回摘要之后的消息
+
+        Args:
+            session_id: 会话ID
+            history: 已读取的会话历史（默认从会话存储读取）
+
+        Returns:
+            (会话摘要, 摘要之后的消息)
+        """
+        if history is None:
+            history = self._sessions.iter_messages(session_id, self.max_history)
+        if self.compactor is None:
+            return None, list(history)
+        return self.compactor.split(session_id, history)
+    
     def _build_messages(
         self,
         user_message: str,
         session_id: str,
         context: str = "",
-        use_rag: bool = True
+        use_rag: bool = True,
+        chunks: Optional[List[RetrievalResult]] = None,
+        history: Optional[Iterable[MessageRecord]] = None,
+        summary: Optional[ConversationSummary] = None
     ) -> List[Dict[str, str]]:
         """
         构建消息列表
         
+        总 token 数控制在 max_prompt_tokens 以内：系统提示词和当前用户消息必须保留；
+        检索片段按相关度贪心打包（去重、去除分块重叠），不超过 max_context_tokens；
+        启用压缩器时，已折叠的历史以摘要代替；
+        对话历史从最近的消息开始放入剩余预算。
+        
         Args:
             user_message: 用户消息
             session_id: 会话ID
-            context: RAG 检索的上下文
+            context: 已拼接好的知识库上下文（超出预算时截断）
             use_rag: 是否使用 RAG
+            chunks: RAG 检索结果（提供时由打包器生成上下文）
+            history: 已由 _read_history 读取的摘要之后的消息（默认从会话存储读取）
+            summary: 与 history 一起读取的会话摘要
             
         Returns:
             List[Dict]: 消息列表
         """
-        messages = []
+        tokenizer = self.context_packer.tokenizer
+        budget = self.max_prompt_tokens
         
-        # 系统提示词
-        if use_rag and context:
-            system_msg = (
-                f"{self.system_prompt}\n\n"
-                f"=== 知识库内容 ===\n{context}\n"
-                f"=== 知识库结束 ===\n\n"
-                f"请根据上面的知识库内容回答用户的问题。"
-                f"如果知识库中没有相关信息，请说\"抱歉，我没有找到相关信息\"。"
-            )
-        else:
-            system_msg = self.system_prompt
+        def required_tokens(ctx: str) -> int:
+            """系统提示词 + 当前用户消息的 token 数"""
+            return tokenizer.count_messages([
+                {"role": "system", "content": self._system_message(ctx, use_rag)},
+                {"role": "user", "content": user_message}
+            ])
+        
+        # 检索片段：在剩余预算内按相关度打包
+        if use_rag and chunks:
+            available = min(self.max_context_tokens, budget - required_tokens(" "))
+            context = self.context_packer.pack_chunks(chunks, available).context
+        
+        used = required_tokens(context)
+        
+        # 直接传入的上下文超出预算时截断
+        if used > budget and use_rag and context:
+            context_tokens = tokenizer.count(context)
+            context = tokenizer.truncate(context, context_tokens - (used - budget))
+            used = required_tokens(context)
+            logger.info(f"知识库内容超出 token 预算，已截断至 {tokenizer.count(context)} tokens")
+        
+        if used > budget:
+            logger.warning(f"提示词超出 token 预算: {used} > {budget}")
         
-        messages.append({"role": "system", "content": system_msg})
+        messages = [{"role": "system", "content": self._system_message(context, use_rag)}]
         
-        # 对话历史
-        history = self._sessions.get(session_id, [])
-        for msg in history[-self.max_history:]:
+        if history is None:
+            summary, history = self._read_history(session_id)
+        history = list(history)
+        
+        # 已折叠的较早消息以摘要代替
+        if summary is not None:
+            summary_message = {"role": "system", "content": f"=== 此前对话摘要 ===\n{summary.text}"}
+            cost = tokenizer.count(summary_message["content"]) + TOKENS_PER_MESSAGE
+            if used + cost <= budget:
+                messages.append(summary_message)
+                used += cost
+        
+        # 对话历史：从最近的消息开始，放入剩余预算
+        history, _ = self.context_packer.pack_history(history, budget - used)
+        for msg in history:
             messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
+                "role": msg.role,
+                "content": msg.content
             })
         
         # 当前用户消息
@@ -240,56 +900,115 @@ class ChatService:
         
         return messages
     
-    def _save_message(
+    def _system_message(self, context: str, use_rag: bool) -> str:
+        """构建系统提示词（含知识库内容）"""
+        if use_rag and context:
+            return (
+                f"{self.system_prompt}\n\n"
+                f"=== 知识库内容 ===\n{context}\n"
+                f"=== 知识库结束 ===\n\n"
+                f"请根据上面的知识库内容回答用户的问题。"
+                f"如果知识库中没有相关信息，请说\"抱歉，我没有找到相关信息\"。"
+            )
+        return self.system_prompt
+    
+    @staticmethod
+    def _make_message(role: str, content: str, metadata: Optional[Dict] = None) -> MessageRecord:
+        """构建历史消息"""
+        return MessageRecord(role, content, metadata)
+    
+    async def _load_session(self, session_id: str) -> None:
+        """热会话缓存未命中时，从持久化存储加载最近的历史"""
+        if self.history_store is None:
+            return
+        if await self._call_store(self._sessions.__contains__, session_id):
+            return
+        try:
+            messages = await self.history_store.load(session_id, limit=self._sessions.max_messages)
+        except Exception as e:
+            logger.warning(f"加载对话历史失败: {session_id}, {e}")
+            return
+        if messages:
+            await self._call_store(self._sessions.populate, session_id, messages)
+    
+    def get_history(
         self,
         session_id: str,
-        role: str,
-        content: str,
-        metadata: Optional[Dict] = None
-    ) -> None:
+        limit: Optional[int] = None
+    ) -> List[MessageRecord]:
         """
-        保存消息到历史
+        获取对话历史
         
         Args:
             session_id: 会话ID
-            role: 角色 (user/assistant)
-            content: 消息内容
-            metadata: 元数据
-        """
-        self._sessions[session_id].append({
-            "role": role,
-            "content": content,
-            "metadata": metadata or {},
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # 限制历史长度
-        max_messages = (self.max_history + 1) * 2  # user + assistant pairs
-        if len(self._sessions[session_id]) > max_messages:
-            # 保留最近的历史
-            self._sessions[session_id] = self._sessions[session_id][-max_messages:]
+            limit: 最大返回消息数
+            
+        Returns:
+            List[MessageRecord]: 消息历史列表（按时间顺序）
+        """
+        return list(self._sessions.iter_messages(session_id, limit))
     
-    def get_history(
+    async def aget_history(
         self,
         session_id: str,
         limit: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> List[MessageRecord]:
         """
-        获取对话历史
+        获取对话历史（热会话缓存未命中时从持久化存储加载）
         
         Args:
             session_id: 会话ID
             limit: 最大返回消息数
             
         Returns:
-            List[Dict]: 消息历史列表
+            List[MessageRecord]: 消息历史列表（按时间顺序）
         """
-        history = self._sessions.get(session_id, [])
-        
-        if limit:
-            history = history[-limit:]
+        await self._load_session(session_id)
+        return await self._call_store(self.get_history, session_id, limit)
+    
+    def export_history(
+        self,
+        history: Iterable[MessageRecord],
+        resolve_sources: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        将消息历史序列化为字典（API 返回格式）
         
-        return history
+        Args:
+            history: 消息历史
+            resolve_sources: 是否展开助手消息的来源引用（从 RAG 服务的片段缓存中
+                补充文件名和片段内容，已失效的引用原样保留）
+            
+        Returns:
+            List[Dict]: 消息字典列表
+        """
+        get_chunk = getattr(self.rag_service, "get_chunk", None) if resolve_sources else None
+        exported = []
+        for record in history:
+            message = record.to_dict()
+            refs = message["metadata"].get("sources")
+            if refs and get_chunk is not None:
+                message["metadata"] = {
+                    **message["metadata"], "sources": self._resolve_refs(refs, get_chunk)
+                }
+            exported.append(message)
+        return exported
+    
+    @staticmethod
+    def _resolve_refs(refs: List[Dict[str, Any]], get_chunk) -> List[Dict[str, Any]]:
+        """展开来源引用"""
+        sources = []
+        for ref in refs:
+            chunk = get_chunk(ref["chunk_id"])
+            if chunk is None:
+                sources.append(dict(ref))
+            else:
+                sources.append({
+                    **ref,
+                    "filename": chunk.metadata.get("filename", "未知"),
+                    "content": chunk.content
+                })
+        return sources
     
     def clear_history(self, session_id: str) -> bool:
         """
@@ -301,12 +1020,28 @@ class ChatService:
         Returns:
             bool: 是否成功清除
         """
-        if session_id in self._sessions:
-            del self._sessions[session_id]
+        if self.compactor is not None:
+            self.compactor.forget(session_id)
+        if self._sessions.clear(session_id):
             logger.info(f"清除对话历史: {session_id}")
             return True
         return False
     
+    async def aclear_history(self, session_id: str) -> bool:
+        """
+        清除对话历史（含持久化存储）
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            bool: 会话存储中是否存在该会话
+        """
+        cleared = await self._call_store(self.clear_history, session_id)
+        if self.history_store is not None:
+            await self.history_store.delete(session_id)
+        return cleared
+    
     def get_session_count(self) -> int:
         """
         获取会话数量
@@ -314,7 +1049,55 @@ class ChatService:
         Returns:
             int: 会话数量
         """
-        return len(self._sessions)
+        return self._sessions.count()
+    
+    def get_session_stats(self) -> Dict[str, Any]:
+        """
+        获取会话存储统计（会话数、占用字节数、淘汰/过期/截断计数）
+        
+        Returns:
+            Dict: 统计信息
+        """
+        return self._sessions.stats()
+    
+    async def aget_session_stats(self) -> Dict[str, Any]:
+        """获取会话存储统计（异步，共享存储的查询在线程池中执行）"""
+        return await self._call_store(self.get_session_stats)
+    
+    async def aget_stats(self) -> Dict[str, Any]:
+        """
+        获取运行统计：LLM（缓存、请求合并、并发限制、路由）、知识库检索（向量缓存、
+        查询微批处理）、会话存储、历史落库、历史压缩和标准问答（未启用的部分为 None）
+        
+        Returns:
+            Dict: 统计信息
+        """
+        return {
+            "llm": self.llm_service.stats() if hasattr(self.llm_service, "stats") else None,
+            "rag": self.rag_service.stats() if hasattr(self.rag_service, "stats") else None,
+            "sessions": await self.aget_session_stats(),
+            "history_store": self.history_store.stats() if self.history_store is not None else None,
+            "compactor": self.compactor.stats() if self.compactor is not None else None,
+            "faq": self.faq_index.stats() if self.faq_index is not None else None,
+        }
+    
+    async def start(self) -> None:
+        """启动后台任务（空闲会话清理、历史批量落库），绑定检索服务的事件循环"""
+        await self._sessions.start()
+        if hasattr(self.rag_service, "start"):
+            await self.rag_service.start()
+        if self.history_store is not None:
+            await self.history_store.start()
+    
+    async def stop(self) -> None:
+        """停止后台任务（含检索服务的查询微批处理），写入剩余的历史"""
+        if self.compactor is not None:
+            await self.compactor.stop()
+        if hasattr(self.rag_service, "stop"):
+            await self.rag_service.stop()
+        await self._sessions.stop()
+        if self.history_store is not None:
+            await self.history_store.stop()
     
     def add_knowledge(
         self,
@@ -335,6 +1118,10 @@ class ChatService:
             chunk_count = self.rag_service.ingest_file(file_path)
             logger.info(f"知识库文档添加成功: {file_path}, {chunk_count} 个块")
             
+            # 知识库已变更，缓存的回复可能过时
+            if hasattr(self.llm_service, "invalidate_cache"):
+                self.llm_service.invalidate_cache()
+            
             return {
                 "status": "success",
                 "filename": file_path.split("/")[-1],
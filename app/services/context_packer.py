@@ -0,0 +1,197 @@
+"""
+Context Packer - 上下文打包
+
+在 token 预算内挑选要发给 LLM 的知识库片段和对话历史：
+- 知识库片段按相关度从高到低贪心放入，放不下的跳过
+- 去除重复片段，以及相邻分块之间的重叠部分（DocumentProcessor 默认 200 字符重叠）
+- 对话历史从最近的消息开始放入，超出预算时先丢弃最早的消息
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+from app.services.rag_service import RetrievalResult
+from app.services.session_store import MessageRecord
+from app.services.tokenizer import Tokenizer, get_tokenizer, TOKENS_PER_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# 片段之间的分隔符
+CHUNK_SEPARATOR = "\n\n"
+
+
+@dataclass
+class PackedChunks:
+    """打包后的知识库片段"""
+    context: str = ""
+    chunks: List[RetrievalResult] = field(default_factory=list)
+    tokens: int = 0
+    dropped: int = 0
+
+
+def boundary_overlap(left: str, right: str, min_overlap: int = 20) -> int:
+    """
+    计算 left 的后缀与 right 的前缀的最长重合长度
+
+    Args:
+        left: 前一个分块
+        right: 后一个分块
+        min_overlap: 低于该长度的重合忽略（避免误判常见短语）
+
+    Returns:
+        重合字符数，无重合时为 0
+    """
+    for size in range(min(len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextPacker:
+    """
+    知识库片段与对话历史的 token 预算打包器
+
+    Example:
+        ```python
+        packer = ContextPacker()
+        packed = packer.pack_chunks(results, budget=2000)
+        history = packer.pack_history(history, budget=1000)
+        ```
+    """
+
+    def __init__(
+        self,
+        tokenizer: Optional[Tokenizer] = None,
+        min_overlap: int = 20,
+        min_remaining_chars: int = 50
+    ):
+        """
+        初始化打包器
+
+        Args:
+            tokenizer: token 计数器（默认使用全局计数器）
+            min_overlap: 判定为分块重叠的最小字符数
+            min_remaining_chars: 去除重叠后剩余内容少于该长度的片段直接丢弃
+        """
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.min_overlap = min_overlap
+        self.min_remaining_chars = min_remaining_chars
+
+    @staticmethod
+    def format_chunk(result: RetrievalResult) -> str:
+        """格式化单个片段（带来源文件名）"""
+        return f"[来源: {result.metadata.get('filename', '未知')}]\n{result.content}"
+
+    def _dedupe(
+        self,
+        result: RetrievalResult,
+        selected: Sequence[RetrievalResult]
+    ) -> Optional[RetrievalResult]:
+        """
+        去除与已选片段重复/重叠的内容
+
+        Returns:
+            去重后的片段；完全重复或剩余过短时返回 None
+        """
+        content = result.content.strip()
+        source = result.metadata.get("filename")
+
+        for other in selected:
+            other_content = other.content.strip()
+            if content in other_content:
+                return None
+            if other.metadata.get("filename") != source:
+                continue
+            if other_content in content:
+                # 新片段完整包含已选片段：去掉已选部分
+                content = content.replace(other_content, "", 1).strip()
+                continue
+            # 相邻分块的首尾重叠
+            overlap = boundary_overlap(other_content, content, self.min_overlap)
+            if overlap:
+                content = content[overlap:].lstrip()
+            overlap = boundary_overlap(content, other_content, self.min_overlap)
+            if overlap:
+                content = content[:-overlap].rstrip()
+
+        if len(content) < min(self.min_remaining_chars, len(result.content.strip())):
+            return None
+        if content == result.content:
+            return result
+        return RetrievalResult(
+            content=content,
+            metadata=result.metadata,
+            score=result.score,
+            chunk_id=result.chunk_id,
+            rank_score=result.rank_score
+        )
+
+    def pack_chunks(
+        self,
+        results: Sequence[RetrievalResult],
+        budget: int
+    ) -> PackedChunks:
+        """
+        按检索排序（混合检索的融合分数，其次相关度）贪心打包知识库片段
+
+        Args:
+            results: 检索结果
+            budget: 可用 token 数
+
+        Returns:
+            PackedChunks: 拼接好的上下文、入选片段、占用 token 数
+        """
+        packed = PackedChunks()
+        separator_tokens = self.tokenizer.count(CHUNK_SEPARATOR)
+        parts: List[str] = []
+
+        for result in sorted(results, key=lambda r: (r.rank_score, r.score), reverse=True):
+            deduped = self._dedupe(result, packed.chunks)
+            if deduped is None:
+                packed.dropped += 1
+                continue
+
+            text = self.format_chunk(deduped)
+            cost = self.tokenizer.count(text) + (separator_tokens if parts else 0)
+            if packed.tokens + cost > budget:
+                packed.dropped += 1
+                continue
+
+            parts.append(text)
+            packed.chunks.append(deduped)
+            packed.tokens += cost
+
+        packed.context = CHUNK_SEPARATOR.join(parts)
+        if packed.dropped:
+            logger.info(f"上下文打包：保留 {len(packed.chunks)} 个片段，丢弃 {packed.dropped} 个")
+        return packed
+
+    def pack_history(
+        self,
+        history: Sequence[MessageRecord],
+        budget: int
+    ) -> Tuple[List[MessageRecord], int]:
+        """
+        从最近的消息开始打包对话历史
+
+        Args:
+            history: 按时间顺序的消息列表
+            budget: 可用 token 数
+
+        Returns:
+            (保留的消息（按时间顺序）, 占用 token 数)
+        """
+        counts = self.tokenizer.count_batch([msg.content for msg in history])
+        used = 0
+        kept = 0
+        for count in reversed(counts):
+            cost = count + TOKENS_PER_MESSAGE
+            if used + cost > budget:
+                break
+            used += cost
+            kept += 1
+
+        if kept < len(history):
+            logger.info(f"对话历史超出 token 预算，保留最近 {kept}/{len(history)} 条")
+        return list(history[len(history) - kept:]), used
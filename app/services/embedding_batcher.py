@@ -0,0 +1,195 @@
+"""
+Embedding Batcher - 查询向量微批处理
+
+高峰期大量并发对话各自发起单条查询的向量化请求，批量接口（或本地模型）按条计算的
+开销低得多。批处理器在事件循环中收集查询，最多等待 max_delay 秒或凑满 max_batch_size
+条后一次调用 embed_documents，再把向量分发给各调用方：
+- 异步调用方：await aembed_query(text)
+- 线程池中的同步调用方（VectorStoreService 检索时）：embed_query(text) 提交到绑定的
+  事件循环并等待结果（超过 timeout 秒取消并抛出 TimeoutError）；未绑定事件循环时直接调用模型
+- 指标：批大小、排队耗时直方图
+
+只适用于查询和文档使用同一编码方式的向量模型（如 OpenAI 向量接口）。
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.concurrency import run_blocking
+from app.core.metrics import Histogram, LATENCY_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# 批大小分桶
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class EmbeddingBatcher:
+    """
+    查询向量微批处理器（接口与 LangChain Embeddings 相同）
+
+    Example:
+        ```python
+        batcher = EmbeddingBatcher(OpenAIEmbeddings(), max_batch_size=32, max_delay=0.005)
+        batcher.attach(asyncio.get_running_loop())
+        vector = await batcher.aembed_query("怎么退款")
+        ```
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        max_batch_size: int = 32,
+        max_delay: float = 0.005,
+        timeout: Optional[float] = None
+    ):
+        """
+        初始化批处理器
+
+        Args:
+            embeddings: 被包装的向量模型
+            max_batch_size: 每批最多条数，凑满立即发送
+            max_delay: 第一条查询入队后最多等待的秒数
+            timeout: 同步调用等待结果的最长秒数（None 表示不限制）
+        """
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # (查询文本, 等待者, 入队时间)
+        self._pending: List[Tuple[str, "asyncio.Future[List[float]]", float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_delay = Histogram(LATENCY_BUCKETS)
+        self.batches = 0
+        self.failures = 0
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """绑定事件循环（线程池中的同步调用提交到该循环合并）"""
+        self._loop = loop
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        向量化查询（与同一时间窗口内的其他查询合并为一次调用）
+
+        Args:
+            text: 查询文本
+
+        Returns:
+            查询向量
+
+        Raises:
+            Exception: 向量模型调用失败（同批的调用方都收到该异常）
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+        future: "asyncio.Future[List[float]]" = loop.create_future()
+        self._pending.append((text, future, time.monotonic()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        向量化查询（同步，供线程池中的调用方使用）
+
+        Args:
+            text: 查询文本
+
+        Returns:
+            查询向量
+
+        Raises:
+            TimeoutError: 超过 timeout 秒未返回（已从批次中取消）
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed() or not loop.is_running() or self._on_loop(loop):
+            # 没有可提交的事件循环，或在事件循环线程中（不能阻塞等待）时直接调用
+            return self.embeddings.embed_query(text)
+        future = asyncio.run_coroutine_threadsafe(self.aembed_query(text), loop)
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            # 事件循环停止或批次卡住时不让线程池中的线程一直等待
+            future.cancel()
+            logger.warning(f"查询向量化超时（{self.timeout} 秒）: {text[:50]}")
+            raise
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量向量化文档（摄入本身已成批，直接调用模型）"""
+        return self.embeddings.embed_documents(texts)
+
+    @staticmethod
+    def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+        try:
+            return asyncio.get_running_loop() is loop
+        except RuntimeError:
+            return False
+
+    def _flush(self) -> None:
+        """发送当前批次"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, "asyncio.Future[List[float]]", float]]) -> None:
+        """调用向量模型并分发结果"""
+        now = time.monotonic()
+        for _, _, queued_at in batch:
+            self.queue_delay.observe(now - queued_at)
+        # 同一批内的相同查询只计算一次
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        self.batch_size.observe(len(texts))
+        self.batches += 1
+
+        try:
+            if hasattr(self.embeddings, "aembed_documents"):
+                vectors = await self.embeddings.aembed_documents(texts)
+            else:
+                vectors = await run_blocking(self.embeddings.embed_documents, texts)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"查询向量化失败（{len(texts)} 条）: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text: Dict[str, List[float]] = dict(zip(texts, vectors))
+        for text, future, _ in batch:
+            # 调用方可能已取消
+            if not future.done():
+                future.set_result(list(by_text[text]))
+
+    async def stop(self) -> None:
+        """发送剩余查询并等待进行中的批次完成"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """批处理统计"""
+        return {
+            "batches": self.batches,
+            "failures": self.failures,
+            "pending": len(self._pending),
+            "batch_size": self.batch_size.snapshot(),
+            "queue_delay": self.queue_delay.snapshot(),
+        }
@@ -0,0 +1,321 @@
+"""
+Embedding Cache - 向量缓存
+
+包装向量模型（LangChain Embeddings 接口），减少重复的向量化调用：
+- 查询向量：内存 LRU，相同问题不再请求向量接口
+- 文档向量：按片段文本的 SHA-256 持久化到磁盘，重新摄入时未变化的片段不再向量化
+- 磁盘格式：每个模型一个目录，vectors.f32（float32 行向量，只追加，内存映射读取）、
+  index.txt（每行一个内容哈希，行号即向量行号）、meta.json（向量维度）
+
+多个进程（uvicorn 多 worker）可共享同一目录：写入时持有目录下 .lock 文件的排他锁（fcntl），
+追加位置以文件实际长度为准，其他进程追加的条目在读取未命中或写入前从 index.txt 增量加载。
+没有 fcntl 的平台上只支持单进程写入。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE_NAME_PATTERN = re.compile(r"[^\w.-]+")
+
+
+def content_hash(text: str) -> str:
+    """片段文本的内容哈希（SHA-256 十六进制摘要）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingDiskStore:
+    """
+    按内容哈希持久化的向量存储（线程安全，多进程共享目录时以文件锁串行写入）
+
+    向量文件只追加：先写向量、再写索引，读取时只加载索引中以换行结束的条目，
+    不会读到写了一半的向量；写入中断留下的残余数据由下一次写入截掉。
+    """
+
+    def __init__(self, directory: str):
+        """
+        打开（或创建）存储目录
+
+        Args:
+            directory: 存储目录
+        """
+        self.directory = directory
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._index_path = os.path.join(directory, "index.txt")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._lock = threading.Lock()
+
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._vectors: Optional[np.ndarray] = None
+        # 已加载的索引行数和对应的 index.txt 字节数
+        self._count = 0
+        self._index_offset = 0
+
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._refresh()
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """跨进程排他锁（写入时持有）"""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """增量加载 index.txt 中新增的完整条目（包括其他进程写入的），调用方持有 _lock"""
+        if self.dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path, encoding="utf-8") as f:
+                self.dim = int(json.load(f)["dim"])
+        if not os.path.exists(self._index_path):
+            return
+
+        with open(self._index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        data = data[:data.rfind(b"\n") + 1]
+        if not data:
+            return
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        available = size // (self.dim * 4) - self._count
+        lines = data.splitlines(keepends=True)[:max(0, available)]
+        if not lines:
+            return
+
+        rows = dict(self._rows)
+        for i, line in enumerate(lines):
+            rows.setdefault(line.decode("utf-8").strip(), self._count + i)
+        self._count += len(lines)
+        self._index_offset += sum(len(line) for line in lines)
+        self._rows = rows
+        self._remap(self._count)
+
+    def _discard_partial_writes(self) -> None:
+        """截掉中断的写入留下的残余数据，使追加位置与已加载的条目对齐（持有文件锁时调用）"""
+        truncated = False
+        if os.path.exists(self._index_path) and os.path.getsize(self._index_path) > self._index_offset:
+            with open(self._index_path, "ab") as f:
+                f.truncate(self._index_offset)
+            truncated = True
+        end = self._count * self.dim * 4
+        if os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) > end:
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(end)
+            truncated = True
+        if truncated:
+            logger.warning(f"向量缓存文件不完整，保留前 {self._count} 条: {self.directory}")
+
+    def _remap(self, rows: int) -> None:
+        """重新映射向量文件（追加后调用）"""
+        if rows == 0:
+            self._vectors = None
+            return
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._rows
+
+    def get_many(self, digests: List[str]) -> Dict[str, np.ndarray]:
+        """
+        批量读取向量（未命中时先加载其他进程新写入的条目）
+
+        Args:
+            digests: 内容哈希列表
+
+        Returns:
+            命中的 {内容哈希: 向量}
+        """
+        with self._lock:
+            if any(digest not in self._rows for digest in digests):
+                self._refresh()
+            rows, vectors = self._rows, self._vectors
+        found = {digest: rows[digest] for digest in digests if digest in rows}
+        if not found:
+            return {}
+        matrix = np.asarray(vectors[list(found.values())])
+        return dict(zip(found.keys(), matrix))
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """
+        批量写入向量（已存在的哈希跳过）
+
+        Args:
+            items: {内容哈希: 向量}
+
+        Raises:
+            ValueError: 向量维度与已有数据不一致
+        """
+        with self._lock, self._file_lock():
+            self._refresh()
+            items = {digest: vector for digest, vector in items.items() if digest not in self._rows}
+            if not items:
+                return
+            matrix = np.asarray(list(items.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致: {matrix.shape[1]} != {self.dim}")
+
+            self._discard_partial_writes()
+            with open(self._vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self._index_path, "a", encoding="utf-8") as f:
+                f.writelines(f"{digest}\n" for digest in items)
+            self._refresh()
+
+
+class CachedEmbeddings:
+    """
+    带缓存的向量模型（接口与 LangChain Embeddings 相同，可直接传给 VectorStoreService）
+
+    Example:
+        ```python
+        embeddings = CachedEmbeddings(OpenAIEmbeddings(), directory="./data/embeddings")
+        vector_store = VectorStoreService(embeddings)
+        ```
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        directory: Optional[str] = None,
+        namespace: Optional[str] = None,
+        query_cache_size: int = 1024
+    ):
+        """
+        初始化缓存
+
+        Args:
+            embeddings: 被包装的向量模型
+            directory: 文档向量的磁盘缓存目录（None 表示只缓存查询向量）
+            namespace: 子目录名，默认取模型名（不同模型的向量不能混用）
+            query_cache_size: 查询向量 LRU 的最大条目数
+        """
+        self.embeddings = embeddings
+        self.query_cache_size = query_cache_size
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.store: Optional[EmbeddingDiskStore] = None
+        if directory:
+            namespace = namespace or str(
+                getattr(embeddings, "model", None) or type(embeddings).__name__
+            )
+            self.store = EmbeddingDiskStore(
+                os.path.join(directory, _UNSAFE_NAME_PATTERN.sub("_", namespace))
+            )
+
+        self.query_hits = 0
+        self.query_misses = 0
+        self.document_hits = 0
+        self.document_misses = 0
+
+    def embed_query(self, text: str) -> List[float]:
+        """向量化查询（内存 LRU 缓存）"""
+        with self._lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+                self.query_hits += 1
+                return vector
+            self.query_misses += 1
+
+        vector = list(self.embeddings.embed_query(text))
+        with self._lock:
+            self._queries[text] = vector
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量向量化查询（内存 LRU 缓存，未命中的查询合并为一次调用，不写入磁盘缓存）"""
+        vectors: Dict[str, List[float]] = {}
+        with self._lock:
+            for text in texts:
+                vector = self._queries.get(text)
+                if vector is not None:
+                    self._queries.move_to_end(text)
+                    vectors[text] = vector
+            missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+            self.query_hits += len(texts) - len(missing)
+            self.query_misses += len(missing)
+
+        if missing:
+            embedded = [list(vector) for vector in self.embeddings.embed_documents(missing)]
+            with self._lock:
+                for text, vector in zip(missing, embedded):
+                    vectors[text] = vector
+                    self._queries[text] = vector
+                while len(self._queries) > self.query_cache_size:
+                    self._queries.popitem(last=False)
+        return [vectors[text] for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量向量化文档（按内容哈希读写磁盘缓存，缺失的片段合并为一次调用）"""
+        if self.store is None:
+            return self.embeddings.embed_documents(texts)
+
+        digests = [content_hash(text) for text in texts]
+        vectors = self.store.get_many(digests)
+
+        missing: Dict[str, str] = {}
+        for digest, text in zip(digests, texts):
+            if digest not in vectors:
+                missing.setdefault(digest, text)
+        self.document_hits += len(texts) - len(missing)
+        self.document_misses += len(missing)
+
+        if missing:
+            embedded = self.embeddings.embed_documents(list(missing.values()))
+            new = {
+                digest: np.asarray(vector, dtype=np.float32)
+                for digest, vector in zip(missing, embedded)
+            }
+            self.store.put_many(new)
+            vectors.update(new)
+            logger.info(f"文档向量化: {len(missing)} 个新片段，{len(texts) - len(missing)} 个命中缓存")
+
+        return [vectors[digest].tolist() for digest in digests]
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        return {
+            "queries": len(self._queries),
+            "query_hits": self.query_hits,
+            "query_misses": self.query_misses,
+            "documents": len(self.store) if self.store is not None else 0,
+            "document_hits": self.document_hits,
+            "document_misses": self.document_misses,
+        }
@@ -0,0 +1,185 @@
+"""
+FAQ Index - 标准问答索引
+
+大部分流量集中在几百个标准问题上。命中标准问答时直接返回人工整理的答案，
+不检索、不调用 LLM：
+- 精确匹配：规范化问题文本（小写、去除空白和标点）-> 条目的哈希表
+- 语义匹配：预先计算的问题向量矩阵（单位向量），一次矩阵乘法求最相似的问题
+- 问答对从 CSV 加载（question, answer[, source]）
+"""
+
+import csv
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.text_features import HashingEmbeddings, normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FAQEntry:
+    """标准问答"""
+    faq_id: str
+    question: str
+    answer: str
+    source: str = ""
+
+
+@dataclass
+class FAQMatch:
+    """匹配结果"""
+    entry: FAQEntry
+    score: float
+    exact: bool = False
+
+
+class FAQIndex:
+    """
+    标准问答索引（线程安全，重新加载时整体替换）
+
+    Example:
+        ```python
+        index = FAQIndex.from_csv("data/faq.csv", threshold=0.9)
+        match = index.match("怎么申请退款？")
+        if match:
+            print(match.entry.answer, match.score)
+        ```
+    """
+
+    def __init__(self, embeddings: Any = None, threshold: float = 0.92):
+        """
+        初始化索引
+
+        Args:
+            embeddings: 向量模型（LangChain Embeddings 接口：embed_documents / embed_query），
+                默认使用字符 n-gram 哈希向量
+            threshold: 语义匹配的最低余弦相似度
+        """
+        self.embeddings = embeddings or HashingEmbeddings()
+        self.threshold = threshold
+
+        self._entries: List[FAQEntry] = []
+        self._exact: Dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+
+    @property
+    def blocking(self) -> bool:
+        """匹配是否可能阻塞（外部向量模型需要网络/模型推理，哈希向量只做本地计算）"""
+        return not isinstance(self.embeddings, HashingEmbeddings)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, entries: Sequence[FAQEntry]) -> int:
+        """
+        用给定的问答替换索引内容
+
+        Args:
+            entries: 标准问答列表
+
+        Returns:
+            int: 条目数
+        """
+        entries = list(entries)
+        exact = {normalize_text(entry.question): i for i, entry in enumerate(entries)}
+        if entries:
+            matrix = np.asarray(
+                self.embeddings.embed_documents([entry.question for entry in entries]),
+                dtype=np.float32
+            )
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms > 0, norms, 1.0)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        with self._lock:
+            self._entries, self._exact, self._matrix = entries, exact, matrix
+        logger.info(f"FAQ 索引已加载: {len(entries)} 条")
+        return len(entries)
+
+    def load_csv(self, path: str) -> int:
+        """
+        从 CSV 加载问答（表头 question, answer，可选 source；source 缺省为文件名）
+
+        Args:
+            path: CSV 文件路径
+
+        Returns:
+            int: 条目数
+        """
+        default_source = os.path.basename(path)
+        entries = []
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for i, row in enumerate(csv.DictReader(f)):
+                question = (row.get("question") or "").strip()
+                answer = (row.get("answer") or "").strip()
+                if not question or not answer:
+                    continue
+                entries.append(FAQEntry(
+                    faq_id=f"{default_source}:{i}",
+                    question=question,
+                    answer=answer,
+                    source=(row.get("source") or "").strip() or default_source
+                ))
+        return self.load(entries)
+
+    @classmethod
+    def from_csv(cls, path: str, **kwargs) -> "FAQIndex":
+        """从 CSV 创建索引"""
+        index = cls(**kwargs)
+        index.load_csv(path)
+        return index
+
+    def match(self, query: str) -> Optional[FAQMatch]:
+        """
+        匹配标准问题
+
+        Args:
+            query: 用户问题
+
+        Returns:
+            FAQMatch: 精确匹配或相似度不低于阈值的最佳条目；未命中时返回 None
+        """
+        with self._lock:
+            entries, exact, matrix = self._entries, self._exact, self._matrix
+        if not entries:
+            return None
+
+        index = exact.get(normalize_text(query))
+        if index is not None:
+            self.hits += 1
+            self.exact_hits += 1
+            return FAQMatch(entries[index], 1.0, exact=True)
+
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            self.misses += 1
+            return None
+        scores = matrix @ (vector / norm)
+        best = int(scores.argmax())
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return FAQMatch(entries[best], float(scores[best]))
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "misses": self.misses,
+        }
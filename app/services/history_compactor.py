@@ -0,0 +1,234 @@
+"""
+History Compactor - 对话历史滚动摘要
+
+长对话每轮都会重发最近的完整消息，提示词 token 数和延迟随会话变长而增长。
+历史超过 token 阈值后，较早的消息被折叠进该会话的滚动摘要：
+- 摘要在回复返回之后异步生成（asyncio.create_task），不占用请求路径
+- 每个会话一份摘要，记录其覆盖到的最后一条消息的时间戳；摘要与会话历史存放在同一个
+  会话存储中，多个 worker 共享，并随会话一起过期和删除
+- 构建提示词时发送「摘要 + 摘要之后的近期消息」
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.concurrency import run_blocking
+from app.services.session_store import BaseSessionStore, ConversationSummary, MessageRecord
+from app.services.tokenizer import TOKENS_PER_MESSAGE, Tokenizer, get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "你是客服对话记录员。请把下面的客服对话压缩成一段简洁的中文摘要，"
+    "保留用户的诉求、关键信息（订单号、账号、金额、时间等）以及客服已给出的答复和结论，"
+    "不要编造对话中没有的内容。只输出摘要本身。"
+)
+
+ROLE_LABELS = {"user": "用户", "assistant": "客服"}
+
+
+class HistoryCompactor:
+    """
+    对话历史压缩器
+
+    Example:
+        ```python
+        compactor = HistoryCompactor(llm_service.agenerate, session_store, trigger_tokens=2000)
+
+        # 构建提示词：摘要 + 摘要之后的消息
+        summary, recent = compactor.split("user-123", history)
+
+        # 回复返回后：超过阈值时在后台折叠较早的消息
+        compactor.schedule("user-123", load_history)
+        ```
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[List[Dict[str, str]]], Awaitable[str]],
+        store: BaseSessionStore,
+        trigger_tokens: int = 2000,
+        keep_messages: int = 4,
+        max_summary_tokens: int = 300,
+        tokenizer: Optional[Tokenizer] = None
+    ):
+        """
+        初始化压缩器
+
+        Args:
+            generate: 生成摘要的异步 LLM 调用（参数为消息列表）
+            store: 保存摘要的会话存储（与对话历史相同）
+            trigger_tokens: 摘要之后的消息超过该 token 数时触发压缩
+            keep_messages: 压缩时保留的最近消息数（不折叠进摘要）
+            max_summary_tokens: 摘要的 token 上限（超出时截断）
+            tokenizer: token 计数器（默认使用共享实例）
+        """
+        self.generate = generate
+        self.store = store
+        self.trigger_tokens = trigger_tokens
+        self.keep_messages = keep_messages
+        self.max_summary_tokens = max_summary_tokens
+        self.tokenizer = tokenizer or get_tokenizer()
+
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+        self.compactions = 0
+        self.failures = 0
+        self.folded_messages = 0
+
+    def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
+        """获取会话的摘要（不存在时返回 None；共享存储的后端涉及 I/O）"""
+        return self.store.get_summary(session_id)
+
+    def split(
+        self,
+        session_id: str,
+        history: Sequence[MessageRecord]
+    ) -> Tuple[Optional[ConversationSummary], List[MessageRecord]]:
+        """
+        拆分会话历史（读取会话存储，共享存储的后端涉及 I/O）
+
+        Args:
+            session_id: 会话ID
+            history: 按时间顺序的消息
+
+        Returns:
+            (会话摘要, 摘要之后的消息)，没有摘要时返回 (None, 全部消息)
+        """
+        summary = self.get_summary(session_id)
+        if summary is None:
+            return None, list(history)
+        return summary, [msg for msg in history if msg.timestamp > summary.until]
+
+    def forget(self, session_id: str) -> bool:
+        """
+        取消会话进行中的压缩（清除对话历史时调用，摘要随会话由会话存储删除）
+
+        Returns:
+            是否有进行中的压缩
+        """
+        task = self._tasks.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+        return task is not None
+
+    async def _call_store(self, func, *args) -> Any:
+        """调用会话存储，涉及 I/O 的后端卸载到线程池"""
+        if self.store.blocking:
+            return await run_blocking(func, *args)
+        return func(*args)
+
+    def schedule(
+        self,
+        session_id: str,
+        load: Callable[[], Awaitable[Sequence[MessageRecord]]]
+    ) -> Optional[asyncio.Task]:
+        """
+        在后台检查并压缩会话历史
+
+        同一会话已有进行中的压缩时不重复创建任务。
+
+        Args:
+            session_id: 会话ID
+            load: 读取会话历史的异步函数
+
+        Returns:
+            创建的任务；已有进行中的任务时返回 None
+        """
+        if session_id in self._tasks:
+            return None
+        task = asyncio.create_task(self._run(session_id, load))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda t: self._discard(session_id, t))
+        return task
+
+    def _discard(self, session_id: str, task: asyncio.Task) -> None:
+        """任务结束后移除记录"""
+        if self._tasks.get(session_id) is task:
+            del self._tasks[session_id]
+
+    async def _run(
+        self,
+        session_id: str,
+        load: Callable[[], Awaitable[Sequence[MessageRecord]]]
+    ) -> None:
+        """读取历史并在超过阈值时压缩"""
+        try:
+            await self.compact(session_id, await load())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"对话历史压缩失败: {session_id}, {e}")
+
+    async def compact(self, session_id: str, history: Sequence[MessageRecord]) -> bool:
+        """
+        摘要之后的消息超过阈值时，把较早的消息折叠进摘要
+
+        Args:
+            session_id: 会话ID
+            history: 按时间顺序的消息
+
+        Returns:
+            bool: 是否生成了新的摘要
+        """
+        previous, pending = await self._call_store(self.split, session_id, history)
+        counts = self.tokenizer.count_batch([msg.content for msg in pending])
+        if sum(counts) + TOKENS_PER_MESSAGE * len(counts) <= self.trigger_tokens:
+            return False
+
+        cut = len(pending) - self.keep_messages
+        # 时间戳相同的消息不能跨越摘要边界
+        while 0 < cut < len(pending) and pending[cut].timestamp <= pending[cut - 1].timestamp:
+            cut += 1
+        if cut <= 0:
+            return False
+        folded = pending[:cut]
+
+        text = await self.generate(self._summary_messages(previous, folded))
+        text = self.tokenizer.truncate(text.strip(), self.max_summary_tokens)
+        summary = ConversationSummary(text, folded[-1].timestamp, self.tokenizer.count(text))
+
+        # 会话已被删除，或其他 worker 已写入覆盖范围更新的摘要时放弃
+        if not await self._call_store(self.store.set_summary, session_id, summary):
+            return False
+
+        self.compactions += 1
+        self.folded_messages += len(folded)
+        logger.info(f"对话历史已压缩: {session_id}, 折叠 {len(folded)} 条消息, 摘要 {summary.tokens} tokens")
+        return True
+
+    @staticmethod
+    def _summary_messages(
+        previous: Optional[ConversationSummary],
+        folded: Sequence[MessageRecord]
+    ) -> List[Dict[str, str]]:
+        """构建生成摘要的提示词（已有摘要 + 新折叠的消息）"""
+        lines = []
+        if previous is not None:
+            lines.append(f"此前的对话摘要：\n{previous.text}\n")
+        lines.append("对话记录：")
+        for msg in folded:
+            lines.append(f"{ROLE_LABELS.get(msg.role, msg.role)}：{msg.content}")
+        return [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": "\n".join(lines)}
+        ]
+
+    async def stop(self) -> None:
+        """取消进行中的压缩任务"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        return {
+            "pending": len(self._tasks),
+            "compactions": self.compactions,
+            "failures": self.failures,
+            "folded_messages": self.folded_messages,
+        }
@@ -0,0 +1,394 @@
+"""
+History Store - 对话历史持久化
+
+将对话消息写入数据库（ChatSessionModel / ChatMessageModel），采用 write-behind：
+- 请求路径只把消息放入内存缓冲区，不等待数据库
+- 后台任务每隔 N 毫秒或累计 M 条消息时批量写入（一次事务）
+- 写入失败时消息退回缓冲区，按指数退避重试；缓冲区有上限，超出时丢弃最早的消息
+- 同一条消息重试 max_attempts 次仍失败时，逐条写入以隔离无法写入的消息（如超长字段），
+  其余消息正常落库，无法写入的消息追加到死信文件（JSON Lines），不再阻塞后续写入
+- 读取时合并数据库中的消息和尚未落库的消息
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.concurrency import run_blocking
+from app.core.database import get_session_factory, init_db
+from app.models.database import ChatMessageModel, ChatSessionModel
+from app.services.session_store import MessageRecord
+from app.services.tokenizer import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+_messages = ChatMessageModel.__table__
+_sessions = ChatSessionModel.__table__
+
+# 会话标题取首条用户消息的前若干字符
+TITLE_MAX_CHARS = 50
+
+
+class DatabaseHistoryStore:
+    """
+    write-behind 的数据库对话历史
+
+    Example:
+        ```python
+        store = DatabaseHistoryStore()
+        await store.start()
+        store.record("user-123", MessageRecord("user", "你好"))
+        messages = await store.load("user-123", limit=20)
+        await store.stop()
+        ```
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[async_sessionmaker] = None,
+        flush_interval: float = 0.05,
+        flush_size: int = 500,
+        max_buffer: int = 50000,
+        create_tables: bool = True,
+        max_attempts: int = 8,
+        retry_delay: float = 1.0,
+        dead_letter_path: Optional[str] = None
+    ):
+        """
+        初始化历史存储
+
+        Args:
+            session_factory: 异步会话工厂（默认使用全局数据库引擎）
+            flush_interval: 批量写入间隔（秒）
+            flush_size: 缓冲消息数达到该值时立即写入
+            max_buffer: 缓冲区最大消息数
+            create_tables: 启动时是否创建缺失的表（并补齐旧版本表结构）
+            max_attempts: 单条消息的最大写入次数，超过后逐条写入，仍失败的写入死信文件
+            retry_delay: 写入失败后的首次重试间隔（秒），之后每次翻倍，最长 60 秒
+            dead_letter_path: 死信文件路径（为空时只记录日志）
+        """
+        self._session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_buffer = max_buffer
+        self.create_tables = create_tables
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.dead_letter_path = dead_letter_path
+
+        self._pending: List[Dict[str, Any]] = []
+        # 正在写入的批次（读取时也需要合并）
+        self._inflight: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+        self.flushes = 0
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        # 连续失败次数（决定后台重试的退避间隔）
+        self._failures = 0
+
+    @property
+    def session_factory(self) -> async_sessionmaker:
+        if self._session_factory is None:
+            self._session_factory = get_session_factory()
+        return self._session_factory
+
+    def record(
+        self,
+        session_id: str,
+        message: MessageRecord,
+        user_id: Optional[str] = None,
+        latency_ms: Optional[float] = None
+    ) -> None:
+        """
+        记录一条消息（只写缓冲区，不阻塞；可在任意线程调用）
+
+        Args:
+            session_id: 会话ID
+            message: 消息
+            user_id: 用户ID
+            latency_ms: 生成耗时（毫秒，助手消息）
+        """
+        row = {
+            "id": uuid.uuid4().hex,
+            "session_id": session_id,
+            "user_id": user_id,
+            "role": message.role,
+            "content": message.content,
+            "metadata": message.metadata or {},
+            "latency_ms": latency_ms,
+            "created_at": datetime.fromtimestamp(message.timestamp),
+            "attempts": 0,
+        }
+
+        with self._lock:
+            self._pending.append(row)
+            overflow = len(self._pending) - self.max_buffer
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+                logger.error(f"对话历史缓冲区已满，丢弃 {overflow} 条消息")
+            full = len(self._pending) >= self.flush_size
+
+        if full:
+            self._notify()
+
+    def _notify(self) -> None:
+        """唤醒后台写入任务"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wakeup.set()
+        else:
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def flush(self) -> int:
+        """
+        立即写入缓冲区中的消息
+
+        Returns:
+            写入的消息数（失败时为 0）
+        """
+        async with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                self._inflight = rows
+            if not rows:
+                return 0
+
+            try:
+                await self._write(rows)
+            except Exception as e:
+                self.failed_flushes += 1
+                self._failures += 1
+                for row in rows:
+                    row["attempts"] += 1
+                exhausted = [row for row in rows if row["attempts"] >= self.max_attempts]
+                retry = [row for row in rows if row["attempts"] < self.max_attempts]
+                logger.error(f"对话历史写入失败，{len(retry)} 条消息稍后重试: {e}")
+                written = await self._isolate(exhausted) if exhausted else 0
+                with self._lock:
+                    self._pending[:0] = retry
+                    self._inflight = []
+                    overflow = len(self._pending) - self.max_buffer
+                    if overflow > 0:
+                        del self._pending[:overflow]
+                        self.dropped += overflow
+                return written
+
+            with self._lock:
+                self._inflight = []
+            self._failures = 0
+            self.flushes += 1
+            self.flushed += len(rows)
+            return len(rows)
+
+    async def _isolate(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        逐条写入多次失败的消息，仍失败的写入死信文件
+
+        Returns:
+            写入成功的消息数
+        """
+        failed = []
+        for row in rows:
+            try:
+                await self._write([row])
+            except Exception as e:
+                logger.error(f"对话历史消息无法写入，转入死信: {row['session_id']}, {e}")
+                failed.append(row)
+        written = len(rows) - len(failed)
+        self.flushed += written
+        if failed:
+            self.dead_lettered += len(failed)
+            if self.dead_letter_path:
+                try:
+                    await run_blocking(self._append_dead_letters, failed)
+                except Exception as e:
+                    logger.error(f"写入死信文件失败，丢弃 {len(failed)} 条消息: {e}")
+        return written
+
+    def _append_dead_letters(self, rows: List[Dict[str, Any]]) -> None:
+        """追加到死信文件（每行一条 JSON，可在修复后手动重放）"""
+        directory = os.path.dirname(os.path.abspath(self.dead_letter_path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        """在一个事务中批量写入消息并更新会话"""
+        tokens = await run_blocking(get_tokenizer().count_batch, [r["content"] for r in rows])
+
+        counts: Dict[str, int] = defaultdict(int)
+        first: Dict[str, Dict[str, Any]] = {}
+        last: Dict[str, datetime] = {}
+        for row in rows:
+            sid = row["session_id"]
+            counts[sid] += 1
+            first.setdefault(sid, row)
+            last[sid] = row["created_at"]
+
+        async with self.session_factory() as session, session.begin():
+            result = await session.execute(
+                select(_sessions.c.id).where(_sessions.c.id.in_(list(counts)))
+            )
+            existing = set(result.scalars())
+            new_sessions = [
+                {
+                    "id": sid,
+                    "user_id": row["user_id"],
+                    "title": row["content"][:TITLE_MAX_CHARS],
+                    "message_count": 0,
+                    "created_at": row["created_at"],
+                    "updated_at": row["created_at"],
+                }
+                for sid, row in first.items() if sid not in existing
+            ]
+            if new_sessions:
+                await session.execute(insert(_sessions), new_sessions)
+
+            await session.execute(insert(_messages), [
+                {
+                    "id": row["id"],
+                    "session_id": row["session_id"],
+                    "role": row["role"],
+                    "content": row["content"],
+                    "metadata": row["metadata"],
+                    "tokens": count,
+                    "latency_ms": row["latency_ms"],
+                    "created_at": row["created_at"],
+                }
+                for row, count in zip(rows, tokens)
+            ])
+
+            await session.execute(
+                update(_sessions)
+                .where(_sessions.c.id == bindparam("b_id"))
+                .values(
+                    message_count=_sessions.c.message_count + bindparam("b_count"),
+                    updated_at=bindparam("b_updated"),
+                ),
+                [
+                    {"b_id": sid, "b_count": count, "b_updated": last[sid]}
+                    for sid, count in counts.items()
+                ]
+            )
+
+    async def load(self, session_id: str, limit: Optional[int] = None) -> List[MessageRecord]:
+        """
+        读取会话的最近消息（含尚未落库的消息）
+
+        Args:
+            session_id: 会话ID
+            limit: 最多返回的消息数
+
+        Returns:
+            按时间顺序的消息列表
+        """
+        stmt = (
+            select(
+                _messages.c.id,
+                _messages.c.role,
+                _messages.c.content,
+                _messages.c.metadata,
+                _messages.c.created_at,
+            )
+            .where(_messages.c.session_id == session_id)
+            .order_by(_messages.c.created_at.desc())
+        )
+        if limit:
+            stmt = stmt.limit(limit)
+
+        async with self.session_factory() as session:
+            rows = [dict(row._mapping) for row in await session.execute(stmt)]
+        rows.reverse()
+
+        seen = {row["id"] for row in rows}
+        with self._lock:
+            rows.extend(
+                row for row in self._inflight + self._pending
+                if row["session_id"] == session_id and row["id"] not in seen
+            )
+        if limit:
+            rows = rows[-limit:]
+
+        return [
+            MessageRecord(
+                row["role"], row["content"], row["metadata"], row["created_at"].timestamp()
+            )
+            for row in rows
+        ]
+
+    async def delete(self, session_id: str) -> None:
+        """删除会话及其全部消息"""
+        async with self._flush_lock:
+            with self._lock:
+                self._pending = [r for r in self._pending if r["session_id"] != session_id]
+            async with self.session_factory() as session, session.begin():
+                await session.execute(delete(_messages).where(_messages.c.session_id == session_id))
+                await session.execute(delete(_sessions).where(_sessions.c.id == session_id))
+
+    async def start(self) -> None:
+        """启动后台写入任务"""
+        if self.create_tables:
+            await init_db(self.session_factory.kw["bind"])
+        self._loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台写入任务并写入剩余消息"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._loop = None
+
+    async def _run(self) -> None:
+        while True:
+            if self._failures:
+                # 写入失败后退避（期间不被新消息唤醒）
+                await asyncio.sleep(min(self.retry_delay * 2 ** (self._failures - 1), 60.0))
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """写入统计"""
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "dead_lettered": self.dead_lettered,
+        }
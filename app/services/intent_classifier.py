@@ -0,0 +1,230 @@
+"""
+Intent Classifier - 轻量意图识别
+
+识别问候、道别、致谢等闲聊意图，命中时直接用模板回复，跳过 RAG 检索和 LLM 调用：
+- 特征：字符 n-gram（1~3 元）哈希到固定维度，L2 归一化
+- 模型：多分类逻辑回归（softmax），NumPy 全批量梯度下降训练
+- 训练数据：本地标注文件（TSV：`意图<TAB>文本`），包含业务问题作为 other 类
+"""
+
+import logging
+import os
+import random
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.text_features import hashed_ngrams, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# 内置训练数据
+DEFAULT_TRAINING_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge", "intents.tsv"
+)
+
+# 非闲聊的兜底类别
+OTHER_INTENT = "other"
+
+# 闲聊意图的模板回复
+SMALL_TALK_REPLIES: Dict[str, List[str]] = {
+    "greeting": [
+        "您好！我是智能客服，请问有什么可以帮您？",
+        "您好，很高兴为您服务！请问遇到了什么问题？",
+    ],
+    "farewell": [
+        "感谢您的咨询，祝您生活愉快，再见！",
+        "再见！如有其他问题，随时来找我。",
+    ],
+    "thanks": [
+        "不客气！还有其他问题可以随时问我。",
+        "很高兴能帮到您！还有什么需要吗？",
+    ],
+    "identity": [
+        "我是智能客服助手，可以解答产品、价格、账户和售后等问题。",
+    ],
+}
+
+
+def small_talk_reply(intent: str) -> Optional[str]:
+    """闲聊意图的模板回复（非闲聊意图返回 None）"""
+    replies = SMALL_TALK_REPLIES.get(intent)
+    return random.choice(replies) if replies else None
+
+
+class IntentPrediction:
+    """意图识别结果"""
+
+    __slots__ = ("intent", "confidence")
+
+    def __init__(self, intent: str, confidence: float):
+        self.intent = intent
+        self.confidence = confidence
+
+    @property
+    def is_small_talk(self) -> bool:
+        """是否为闲聊意图"""
+        return self.intent in SMALL_TALK_REPLIES
+
+    def __repr__(self) -> str:
+        return f"IntentPrediction(intent={self.intent!r}, confidence={self.confidence:.3f})"
+
+
+class IntentClassifier:
+    """
+    字符 n-gram 线性意图分类器
+
+    Example:
+        ```python
+        classifier = IntentClassifier.from_file("app/knowledge/intents.tsv")
+        prediction = classifier.classify("谢谢你")
+        if prediction.is_small_talk and prediction.confidence >= 0.8:
+            print(small_talk_reply(prediction.intent))
+        ```
+    """
+
+    def __init__(
+        self,
+        dim: int = 1 << 14,
+        ngram_range: Tuple[int, int] = (1, 3),
+        max_chars: int = 24
+    ):
+        """
+        初始化分类器
+
+        Args:
+            dim: 特征哈希维度
+            ngram_range: 字符 n-gram 的最小/最大长度
+            max_chars: 规范化后超过该长度的文本直接判为 other（闲聊都很短）
+        """
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.max_chars = max_chars
+
+        self.labels: List[str] = []
+        self.weights: Optional[np.ndarray] = None  # (dim, 类别数)
+        self.bias: Optional[np.ndarray] = None
+
+    def _features(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """提取哈希特征（稀疏表示）"""
+        return hashed_ngrams(text, self.dim, self.ngram_range)
+
+    def fit(
+        self,
+        samples: Sequence[Tuple[str, str]],
+        epochs: int = 500,
+        learning_rate: float = 4.0,
+        l2: float = 1e-4
+    ) -> "IntentClassifier":
+        """
+        训练模型
+
+        Args:
+            samples: (意图, 文本) 列表
+            epochs: 梯度下降轮数
+            learning_rate: 学习率
+            l2: L2 正则系数
+
+        Returns:
+            self
+        """
+        self.labels = sorted({label for label, _ in samples})
+        label_index = {label: i for i, label in enumerate(self.labels)}
+
+        rows = [self._features(text) for _, text in samples]
+        # 只在训练数据出现过的特征列上训练，其余列权重为 0
+        columns, inverse = np.unique(
+            np.concatenate([indices for indices, _ in rows]), return_inverse=True
+        )
+        features = np.zeros((len(samples), len(columns)), dtype=np.float32)
+        targets = np.zeros((len(samples), len(self.labels)), dtype=np.float32)
+        offset = 0
+        for row, ((label, _), (indices, values)) in enumerate(zip(samples, rows)):
+            features[row, inverse[offset:offset + len(indices)]] = values
+            offset += len(indices)
+            targets[row, label_index[label]] = 1.0
+
+        weights = np.zeros((len(columns), len(self.labels)), dtype=np.float32)
+        bias = np.zeros(len(self.labels), dtype=np.float32)
+        for _ in range(epochs):
+            probs = self._softmax(features @ weights + bias)
+            grad = (probs - targets) / len(samples)
+            weights -= learning_rate * (features.T @ grad + l2 * weights)
+            bias -= learning_rate * grad.sum(axis=0)
+
+        self.weights = np.zeros((self.dim, len(self.labels)), dtype=np.float32)
+        self.weights[columns] = weights
+        self.bias = bias
+        logger.info(f"意图分类器训练完成: {len(samples)} 条样本, 意图 {self.labels}")
+        return self
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def classify(self, text: str) -> IntentPrediction:
+        """
+        识别意图
+
+        Args:
+            text: 用户消息
+
+        Returns:
+            IntentPrediction: 概率最高的意图及其概率
+        """
+        if self.weights is None:
+            raise RuntimeError("意图分类器尚未训练")
+        normalized = normalize_text(text)
+        if not normalized or len(normalized) > self.max_chars:
+            return IntentPrediction(OTHER_INTENT, 1.0)
+
+        indices, values = self._features(text)
+        probs = self._softmax(values @ self.weights[indices] + self.bias)
+        best = int(probs.argmax())
+        return IntentPrediction(self.labels[best], float(probs[best]))
+
+    @staticmethod
+    def load_samples(path: str) -> List[Tuple[str, str]]:
+        """
+        读取训练数据
+
+        Args:
+            path: TSV 文件路径（`意图<TAB>文本`，# 开头为注释）
+
+        Returns:
+            (意图, 文本) 列表
+        """
+        samples = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                label, _, text = line.partition("\t")
+                if text:
+                    samples.append((label.strip(), text.strip()))
+        return samples
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_TRAINING_FILE, **kwargs) -> "IntentClassifier":
+        """从标注文件训练分类器"""
+        return cls(**kwargs).fit(cls.load_samples(path))
+
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """获取共享的意图分类器（首次调用时按配置 INTENT_TRAINING_FILE 训练）"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = IntentClassifier.from_file(
+                settings.INTENT_TRAINING_FILE or DEFAULT_TRAINING_FILE
+            )
+        return _classifier
@@ -0,0 +1,345 @@
+"""
+Keyword Index - BM25 关键词倒排索引
+
+向量检索对订单号、SKU、产品型号等精确字符串不敏感，关键词索引补上这部分召回：
+- 分词：中日韩文字按相邻两字（bigram），英文/数字按词；带连接符的编码（SKU-1024、
+  v2.3.1）同时保留整体和各段
+- 打分：BM25，每个查询词一次 NumPy 向量运算累加到所有命中片段
+- 融合：倒数排名融合（RRF），与向量检索结果合并排序
+- 持久化：单个 .npz 文件（词表、按词连续存放的倒排表、片段长度、片段内容）
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(
+    r"(?P<cjk>[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)"
+    r"|(?P<word>[a-z0-9]+(?:[-_./:#][a-z0-9]+)*)"
+)
+_CODE_SEPARATORS = re.compile(r"[-_./:#]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词
+
+    Args:
+        text: 文本
+
+    Returns:
+        词列表（中日韩文字为相邻两字，单字成段时保留单字；英文小写）
+    """
+    tokens: List[str] = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        run = match.group("cjk")
+        if run:
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            continue
+        word = match.group("word")
+        tokens.append(word)
+        parts = _CODE_SEPARATORS.split(word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> Dict[str, float]:
+    """
+    倒数排名融合：每个列表中排名第 r（从 1 开始）的条目得 1 / (k + r)
+
+    Args:
+        rankings: 多个按相关度降序的 ID 列表
+        k: 平滑常数（越大，排名靠后的条目影响越大）
+
+    Returns:
+        {ID: 融合分数}
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+@dataclass
+class KeywordHit:
+    """关键词检索结果"""
+    chunk_id: str
+    content: str
+    metadata: Dict[str, Any]
+    score: float
+    # 归一化相关度（0~1）：BM25 分数 / 单词项上限之和（idf * (k1 + 1)）
+    relevance: float = 0.0
+
+
+@dataclass
+class _Chunk:
+    chunk_id: str
+    content: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    length: int = 0
+
+
+class BM25Index:
+    """
+    BM25 倒排索引（线程安全，进程内）
+
+    Example:
+        ```python
+        index = BM25Index.open("./data/keyword_index.npz")
+        index.add([("售后.md:0", "退货请联系客服，订单号 SO-20240101", {"doc_id": "售后.md"})])
+        index.save()
+        hits = index.search("SO-20240101", top_k=5)
+        ```
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        """
+        初始化空索引
+
+        Args:
+            path: 持久化文件路径（None 表示只在内存中）
+            k1: 词频饱和参数
+            b: 长度归一化参数
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        # 片段按下标存放，删除后留空，保存时压缩
+        self._chunks: List[Optional[_Chunk]] = []
+        self._positions: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+        # 查询时使用的数组缓存（索引变更后清空）
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lengths: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._positions
+
+    def add(self, chunks: Iterable[Tuple[str, str, Dict[str, Any]]]) -> int:
+        """
+        添加片段（已存在的 chunk_id 整体替换）
+
+        Args:
+            chunks: (chunk_id, 内容, 元数据) 列表
+
+        Returns:
+            int: 添加的片段数
+        """
+        count = 0
+        with self._lock:
+            for chunk_id, content, metadata in chunks:
+                self._remove(chunk_id)
+                tokens = tokenize(content)
+                position = len(self._chunks)
+                self._chunks.append(_Chunk(chunk_id, content, dict(metadata), len(tokens)))
+                self._positions[chunk_id] = position
+                self._total_length += len(tokens)
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, tf in counts.items():
+                    self._postings.setdefault(token, {})[position] = tf
+                count += 1
+            self._invalidate()
+        return count
+
+    def remove_document(self, doc_id: str) -> int:
+        """
+        删除文档的全部片段（重新摄入前调用）
+
+        Args:
+            doc_id: 文档ID（片段元数据中的 doc_id）
+
+        Returns:
+            int: 删除的片段数
+        """
+        with self._lock:
+            chunk_ids = [
+                chunk.chunk_id for chunk in self._chunks
+                if chunk is not None and chunk.metadata.get("doc_id") == doc_id
+            ]
+            for chunk_id in chunk_ids:
+                self._remove(chunk_id)
+            if chunk_ids:
+                self._invalidate()
+        return len(chunk_ids)
+
+    def _remove(self, chunk_id: str) -> None:
+        position = self._positions.pop(chunk_id, None)
+        if position is None:
+            return
+        chunk = self._chunks[position]
+        self._chunks[position] = None
+        self._total_length -= chunk.length
+        for token in set(tokenize(chunk.content)):
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.pop(position, None)
+                if not posting:
+                    del self._postings[token]
+
+    def _invalidate(self) -> None:
+        self._arrays = {}
+        self._lengths = None
+
+    def _term_arrays(self, token: str) -> Tuple[np.ndarray, np.ndarray]:
+        """词的倒排表（片段下标、词频）"""
+        arrays = self._arrays.get(token)
+        if arrays is None:
+            posting = self._postings[token]
+            arrays = (
+                np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float32, count=len(posting)),
+            )
+            self._arrays[token] = arrays
+        return arrays
+
+    def search(self, query: str, top_k: int = 5) -> List[KeywordHit]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回的最大结果数
+
+        Returns:
+            按 BM25 分数降序的结果
+        """
+        with self._lock:
+            terms = [token for token in dict.fromkeys(tokenize(query)) if token in self._postings]
+            if not terms or not self._positions:
+                return []
+            if self._lengths is None:
+                self._lengths = np.array(
+                    [chunk.length if chunk is not None else 0 for chunk in self._chunks],
+                    dtype=np.float32
+                )
+            lengths = self._lengths
+            total = len(self._positions)
+            avg_length = max(self._total_length / total, 1.0)
+            norms = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+
+            scores = np.zeros(len(self._chunks), dtype=np.float32)
+            # 每个查询词的贡献上限为 idf * (k1 + 1)，相关度按上限之和归一化
+            max_score = 0.0
+            for token in terms:
+                docs, tfs = self._term_arrays(token)
+                idf = math.log(1.0 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norms[docs])
+                max_score += idf * (self.k1 + 1.0)
+
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+            hits = []
+            for position in candidates:
+                chunk = self._chunks[position]
+                score = float(scores[position])
+                hits.append(KeywordHit(
+                    chunk_id=chunk.chunk_id,
+                    content=chunk.content,
+                    metadata=dict(chunk.metadata),
+                    score=score,
+                    relevance=min(score / max_score, 1.0) if max_score > 0 else 0.0
+                ))
+            return hits
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        保存到磁盘（先写临时文件再替换，删除留下的空位在此压缩）
+
+        Args:
+            path: 文件路径（默认使用打开时的路径）
+        """
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            live = [chunk for chunk in self._chunks if chunk is not None]
+            renumber = {self._positions[chunk.chunk_id]: i for i, chunk in enumerate(live)}
+            terms = sorted(self._postings)
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            docs: List[int] = []
+            tfs: List[int] = []
+            for i, term in enumerate(terms):
+                posting = sorted((renumber[position], tf) for position, tf in self._postings[term].items())
+                docs.extend(doc for doc, _ in posting)
+                tfs.extend(tf for _, tf in posting)
+                offsets[i + 1] = len(docs)
+            chunks = json.dumps(
+                [[chunk.chunk_id, chunk.content, chunk.metadata] for chunk in live],
+                ensure_ascii=False
+            )
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                offsets=offsets,
+                docs=np.asarray(docs, dtype=np.uint32),
+                tfs=np.minimum(np.asarray(tfs, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16),
+                lengths=np.asarray([chunk.length for chunk in live], dtype=np.uint32),
+                chunks=np.frombuffer(chunks.encode("utf-8"), dtype=np.uint8),
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"关键词索引已保存: {path}, {len(live)} 个片段, {len(terms)} 个词")
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> "BM25Index":
+        """
+        从磁盘加载索引（文件不存在时返回空索引，之后保存到该路径）
+
+        Args:
+            path: 文件路径
+            **kwargs: BM25 参数
+
+        Returns:
+            BM25Index: 索引
+        """
+        index = cls(path=path, **kwargs)
+        if not os.path.exists(path):
+            return index
+
+        with np.load(path) as data:
+            raw_terms = data["terms"].tobytes().decode("utf-8")
+            terms = raw_terms.split("\n") if raw_terms else []
+            offsets, docs, tfs = data["offsets"], data["docs"], data["tfs"]
+            lengths = data["lengths"]
+            chunks = json.loads(data["chunks"].tobytes().decode("utf-8"))
+
+        for i, (chunk_id, content, metadata) in enumerate(chunks):
+            index._chunks.append(_Chunk(chunk_id, content, metadata, int(lengths[i])))
+            index._positions[chunk_id] = i
+        index._total_length = int(lengths.sum())
+        for i, term in enumerate(terms):
+            start, end = offsets[i], offsets[i + 1]
+            index._postings[term] = dict(zip(docs[start:end].tolist(), tfs[start:end].tolist()))
+        logger.info(f"关键词索引已加载: {path}, {len(index)} 个片段")
+        return index
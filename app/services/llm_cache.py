@@ -0,0 +1,147 @@
+"""
+LLM Cache - LLM 响应缓存
+
+以完整消息列表（系统提示词、知识库上下文、历史、用户消息）+ 模型 + 温度的
+规范化哈希为键，缓存 LLM 回复，支持 LRU 淘汰和 TTL 过期。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(
+    messages: Union[str, List[Dict[str, str]]],
+    model: str,
+    temperature: float
+) -> str:
+    """
+    计算请求指纹
+
+    Args:
+        messages: 提示词或消息列表
+        model: 模型名称
+        temperature: 采样温度
+
+    Returns:
+        SHA-256 十六进制摘要
+    """
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    canonical = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "messages": [
+                {"role": m.get("role", ""), "content": m.get("content", "")}
+                for m in messages
+            ],
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    LLM 响应缓存（线程安全）
+
+    - 容量上限：超出时淘汰最久未使用的条目
+    - TTL：条目写入后超过 ttl 秒即失效
+    - 命中/未命中/淘汰计数
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 600.0):
+        """
+        初始化缓存
+
+        Args:
+            max_size: 最大条目数
+            ttl: 过期时间（秒），<= 0 表示不过期
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存
+
+        Args:
+            key: 请求指纹
+
+        Returns:
+            缓存的回复；未命中或已过期时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if self.ttl > 0 and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        写入缓存
+
+        Args:
+            key: 请求指纹
+            value: LLM 回复
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> int:
+        """
+        清空缓存（知识库变更时调用）
+
+        Returns:
+            被清除的条目数
+        """
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+        logger.info(f"LLM 响应缓存已清空，共 {count} 条")
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
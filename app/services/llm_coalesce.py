@@ -0,0 +1,244 @@
+"""
+LLM Coalesce - 相同请求合并（single-flight）
+
+指纹相同的并发请求共享同一次上游调用：
+- SingleFlight: 非流式调用，所有调用方拿到同一个结果（或同一个异常）
+- StreamFanout: 流式调用，上游只请求一次，每个订阅者各自完整收到一份 token 流；
+  所有订阅者都离开（客户端断开、取消）时取消上游
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _SyncCall:
+    """进行中的同步调用"""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    非流式请求合并
+
+    第一个调用方（leader）发起上游调用，其余调用方等待并共享结果。
+    异步调用以独立任务运行，leader 被取消（如客户端断开）不影响其他等待者。
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, "asyncio.Task[Any]"] = {}
+        self._calls: Dict[str, _SyncCall] = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行（或加入）一次异步调用
+
+        Args:
+            key: 请求指纹
+            func: 发起上游调用的协程工厂
+
+        Returns:
+            上游调用结果
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: "asyncio.Task[Any]") -> None:
+        """调用完成后移除，并取走异常避免未处理告警"""
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()
+
+    def do_sync(self, key: str, func: Callable[[], T]) -> T:
+        """
+        执行（或加入）一次同步调用（多线程场景）
+
+        Args:
+            key: 请求指纹
+            func: 发起上游调用的函数
+
+        Returns:
+            上游调用结果
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _SyncCall()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self) -> Dict[str, int]:
+        """合并统计"""
+        return {
+            "in_flight": len(self._tasks) + len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+
+class _Broadcast:
+    """一路上游流的广播缓冲"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self._updated = asyncio.Event()
+        # 上游任务和仍在读取的订阅者数
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.subscribers = 0
+        self.abandoned = False
+
+    def publish(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.finished = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """
+        从头回放已收到的片段，再跟随后续片段
+
+        订阅者在 `StreamFanout.subscribe` 时计数；迭代结束、出错或被关闭时减一，
+        最后一个订阅者离开而上游尚未结束时取消上游任务。
+        """
+        index = 0
+        try:
+            while True:
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._updated.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished and self.task is not None:
+                self.abandoned = True
+                self.task.cancel()
+
+
+class StreamFanout:
+    """
+    流式请求合并
+
+    同一指纹的并发流只向上游请求一次，片段广播给所有订阅者；
+    后加入的订阅者先回放已收到的片段，因此每个订阅者都拿到完整的流。
+    最后一个订阅者离开时取消上游调用（释放连接和并发名额）。
+    """
+
+    def __init__(self):
+        self._broadcasts: Dict[str, _Broadcast] = {}
+
+        self.leaders = 0
+        self.followers = 0
+
+    def subscribe(
+        self,
+        key: str,
+        source: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """
+        订阅（或发起）一路流
+
+        Args:
+            key: 请求指纹
+            source: 创建上游流的工厂
+
+        Returns:
+            该订阅者专属的片段迭代器
+        """
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None or broadcast.abandoned:
+            # 已被放弃的上游正在取消，不再加入
+            self.leaders += 1
+            broadcast = _Broadcast()
+            self._broadcasts[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, source))
+        else:
+            self.followers += 1
+        broadcast.subscribers += 1
+        return broadcast.subscribe()
+
+    async def _pump(
+        self,
+        key: str,
+        broadcast: _Broadcast,
+        source: Callable[[], AsyncIterator[str]]
+    ) -> None:
+        """消费上游流并广播"""
+        try:
+            async for chunk in source():
+                broadcast.publish(chunk)
+        except asyncio.CancelledError as e:
+            logger.info("订阅者均已离开，上游流式生成已取消")
+            broadcast.finish(e)
+            raise
+        except Exception as e:
+            logger.warning(f"上游流式生成失败: {e}")
+            broadcast.finish(e)
+        else:
+            broadcast.finish()
+        finally:
+            if self._broadcasts.get(key) is broadcast:
+                del self._broadcasts[key]
+
+    def stats(self) -> Dict[str, int]:
+        """合并统计"""
+        return {
+            "in_flight": len(self._broadcasts),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
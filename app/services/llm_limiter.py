@@ -0,0 +1,265 @@
+"""
+LLM Limiter - 自适应并发限制
+
+对上游 LLM 调用做 AIMD 式并发控制：
+- 调用成功且延迟正常时，并发上限缓慢加性增长（每轮约 +1）
+- 出现 429 / 5xx / 超时或延迟超出目标时，上限乘性下降
+- 超出上限的调用进入优先级队列（按用户套餐），队列满或排队超时时优先淘汰低优先级请求
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.core.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# 套餐 -> 优先级（数值越小越优先），对应 UserModel.plan
+PLAN_PRIORITIES = {
+    "enterprise": 0,
+    "pro": 1,
+    "free": 2,
+}
+DEFAULT_PLAN = "free"
+
+
+class LimiterOverloadedError(Exception):
+    """请求因过载被拒绝（排队已满或排队超时）"""
+
+
+def plan_priority(plan: Optional[str]) -> int:
+    """套餐对应的优先级，未知套餐按免费版处理"""
+    return PLAN_PRIORITIES.get(plan or DEFAULT_PLAN, PLAN_PRIORITIES[DEFAULT_PLAN])
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """是否为上游过载信号（429 / 5xx / 超时）"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError))
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发限制器
+
+    Example:
+        ```python
+        limiter = AdaptiveLimiter()
+        async with limiter.slot(plan="pro"):
+            reply = await llm.agenerate(messages)
+        ```
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 128,
+        backoff: float = 0.5,
+        latency_target: float = 0.0,
+        max_queue: int = 256,
+        queue_timeout: float = 30.0,
+        decrease_interval: float = 1.0
+    ):
+        """
+        初始化限制器
+
+        Args:
+            initial_limit: 初始并发上限
+            min_limit: 并发上限下限
+            max_limit: 并发上限上限
+            backoff: 过载时上限乘以该系数
+            latency_target: 延迟目标（秒），超出视为过载信号；<= 0 表示只看错误信号
+            max_queue: 最大排队数
+            queue_timeout: 最长排队时间（秒）
+            decrease_interval: 两次下调之间的最小间隔（秒），避免同一波失败把上限压到底
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.decrease_interval = decrease_interval
+
+        self.in_flight = 0
+        # (优先级, 序号, 等待者, 套餐)，序号保证同优先级先进先出
+        self._queue: List[Tuple[int, int, "asyncio.Future[None]", str]] = []
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+
+        self.queue_time = Histogram()
+        self.queue_time_by_plan: Dict[str, Histogram] = {
+            plan: Histogram() for plan in PLAN_PRIORITIES
+        }
+        self.shed = 0
+        self.shed_by_plan: Dict[str, int] = {plan: 0 for plan in PLAN_PRIORITIES}
+
+    @property
+    def queued(self) -> int:
+        """排队中的请求数"""
+        return sum(1 for entry in self._queue if not entry[2].done())
+
+    async def acquire(self, plan: Optional[str] = None) -> None:
+        """
+        获取一个并发名额
+
+        Args:
+            plan: 用户套餐（决定排队优先级）
+
+        Raises:
+            LimiterOverloadedError: 排队已满（且本请求优先级最低）或排队超时
+        """
+        plan = plan if plan in PLAN_PRIORITIES else DEFAULT_PLAN
+        start = time.monotonic()
+
+        if self.in_flight < int(self.limit) and not self.queued:
+            self.in_flight += 1
+            self._observe_wait(plan, 0.0)
+            return
+
+        priority = plan_priority(plan)
+        if self.queued >= self.max_queue and not self._shed_lowest(priority):
+            self._record_shed(plan)
+            raise LimiterOverloadedError("LLM 调用排队已满")
+
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future, plan))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # 超时的同时恰好被唤醒：归还名额
+                self.release()
+            else:
+                future.cancel()
+            self._record_shed(plan)
+            raise LimiterOverloadedError("LLM 调用排队超时")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()
+            else:
+                future.cancel()
+            raise
+
+        self._observe_wait(plan, time.monotonic() - start)
+
+    def _shed_lowest(self, priority: int) -> bool:
+        """
+        队列已满时淘汰优先级低于 priority 的最末请求
+
+        Returns:
+            是否腾出了位置
+        """
+        waiting = [entry for entry in self._queue if not entry[2].done()]
+        if not waiting:
+            return False
+        worst = max(waiting, key=lambda entry: (entry[0], entry[1]))
+        if worst[0] <= priority:
+            return False
+        worst[2].set_exception(LimiterOverloadedError("LLM 调用被更高优先级请求挤出队列"))
+        self._record_shed(worst[3])
+        return True
+
+    def release(
+        self,
+        latency: Optional[float] = None,
+        error: Optional[BaseException] = None
+    ) -> None:
+        """
+        归还名额并根据调用结果调整上限
+
+        Args:
+            latency: 调用耗时（秒），None 表示不参与调整
+            error: 调用异常
+        """
+        self.in_flight -= 1
+
+        if error is not None and is_overload_error(error):
+            self._decrease()
+        elif error is None and latency is not None:
+            if self.latency_target > 0 and latency > self.latency_target:
+                self._decrease()
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+        self._wake()
+
+    def _decrease(self) -> None:
+        """乘性下调上限"""
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_interval:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        logger.warning(f"LLM 上游过载，并发上限下调至 {int(self.limit)}")
+
+    def _wake(self) -> None:
+        """按优先级唤醒排队中的请求"""
+        while self._queue and self.in_flight < int(self.limit):
+            future = heapq.heappop(self._queue)[2]
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _observe_wait(self, plan: str, wait: float) -> None:
+        self.queue_time.observe(wait)
+        self.queue_time_by_plan[plan].observe(wait)
+
+    def _record_shed(self, plan: str) -> None:
+        self.shed += 1
+        self.shed_by_plan[plan] += 1
+        logger.warning(f"LLM 调用被拒绝（套餐: {plan}）")
+
+    @asynccontextmanager
+    async def slot(self, plan: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        占用一个并发名额执行上游调用
+
+        Args:
+            plan: 用户套餐
+        """
+        await self.acquire(plan)
+        start = time.monotonic()
+        error: Optional[BaseException] = None
+        completed = False
+        try:
+            yield
+            completed = True
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # 取消或流式调用方提前关闭（GeneratorExit）时只归还名额，不参与调整
+            if error is not None:
+                self.release(time.monotonic() - start, error=error)
+            elif completed:
+                self.release(time.monotonic() - start)
+            else:
+                self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """限制器统计"""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "shed": self.shed,
+            "shed_by_plan": dict(self.shed_by_plan),
+            "queue_time": self.queue_time.snapshot(),
+            "queue_time_by_plan": {
+                plan: hist.snapshot() for plan, hist in self.queue_time_by_plan.items()
+            },
+        }
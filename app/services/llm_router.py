@@ -0,0 +1,345 @@
+"""
+LLM Router - 多提供商路由
+
+按滚动窗口内的延迟分位数和错误率在多个 LLM 提供商之间选择：
+- 优先选择健康且 p50 最低的提供商；未配置 API Key 的提供商不参与路由
+- 可选对冲请求：主请求超过延迟预算仍未返回时，向次优提供商并发第二个请求，
+  先成功者胜出，另一个被取消
+- 失败自动切换到下一个提供商
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderStats:
+    """单个提供商的滚动统计"""
+
+    def __init__(self, window: int = 200, cooldown: float = 30.0):
+        """
+        初始化统计
+
+        Args:
+            window: 保留的最近调用数
+            cooldown: 连续失败后暂停路由的时间（秒）
+        """
+        self.cooldown = cooldown
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self._unhealthy_until = 0.0
+
+    def record(self, latency: float, ok: bool) -> None:
+        """
+        记录一次调用
+
+        Args:
+            latency: 耗时（秒）
+            ok: 是否成功
+        """
+        self._outcomes.append(ok)
+        if ok:
+            self._latencies.append(latency)
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= 3:
+                self._unhealthy_until = time.monotonic() + self.cooldown
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        成功调用的延迟分位数
+
+        Args:
+            q: 分位（0-1）
+
+        Returns:
+            延迟（秒）；尚无样本时返回 None
+        """
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        """窗口内错误率"""
+        if not self._outcomes:
+            return 0.0
+        return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    @property
+    def healthy(self) -> bool:
+        """是否健康（未处于连续失败后的冷却期）"""
+        return time.monotonic() >= self._unhealthy_until
+
+    def snapshot(self) -> Dict[str, Any]:
+        """统计快照"""
+        return {
+            "calls": len(self._outcomes),
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "error_rate": self.error_rate,
+            "healthy": self.healthy,
+        }
+
+
+class LLMRouter:
+    """
+    多提供商路由
+
+    对外提供与单个提供商相同的接口（generate / agenerate / stream / astream），
+    可直接作为 LLMService 的后端。
+
+    Example:
+        ```python
+        router = LLMRouter(
+            {"minimax": MiniMaxLLM(), "openai": OpenAILLM()},
+            hedge=True,
+        )
+        answer = await router.agenerate(messages)
+        print(router.stats())
+        ```
+    """
+
+    name = "router"
+
+    def __init__(
+        self,
+        providers: Dict[str, Any],
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_min_delay: float = 0.5,
+        window: int = 200,
+        max_error_rate: float = 0.5
+    ):
+        """
+        初始化路由
+
+        Args:
+            providers: 提供商名称 -> 提供商实例（按优先级排列）
+            hedge: 是否启用对冲请求
+            hedge_percentile: 对冲预算取主提供商延迟的该分位数
+            hedge_min_delay: 对冲预算下限（秒），样本不足时也使用该值
+            window: 每个提供商的统计窗口
+            max_error_rate: 错误率超过该值的提供商排到最后
+        """
+        if not providers:
+            raise ValueError("至少需要一个 LLM 提供商")
+
+        self.providers = providers
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.max_error_rate = max_error_rate
+        self._stats = {name: ProviderStats(window=window) for name in providers}
+
+        self.hedges = 0
+        self.hedge_wins = 0
+
+        missing = [name for name in providers if not self._configured(name)]
+        if missing:
+            logger.warning(f"LLM 提供商未配置 API Key，不参与路由: {', '.join(missing)}")
+        logger.info(f"LLM 路由初始化完成，提供商: {', '.join(providers)}")
+
+    @property
+    def model(self) -> str:
+        """组合模型名（用于缓存指纹）"""
+        return ",".join(f"{name}:{p.model}" for name, p in self.providers.items())
+
+    @property
+    def temperature(self) -> float:
+        return next(iter(self.providers.values())).temperature
+
+    def _configured(self, name: str) -> bool:
+        """提供商是否已配置 API Key（未配置时只返回占位回复，延迟低但不可用）"""
+        return bool(getattr(self.providers[name], "api_key", True))
+
+    def ranked(self) -> List[str]:
+        """
+        按优先级排序的提供商
+
+        只包含已配置 API Key 的提供商（全部未配置时保留全部，返回占位回复）；
+        健康且错误率未超限的排在前面，其中 p50 低者优先；
+        尚无样本的提供商按配置顺序排在有样本者之前，以便收集统计。
+        """
+        order = {name: i for i, name in enumerate(self.providers)}
+        candidates = [name for name in self.providers if self._configured(name)]
+
+        def key(name: str) -> Tuple[int, float, int]:
+            stats = self._stats[name]
+            degraded = not stats.healthy or stats.error_rate > self.max_error_rate
+            p50 = stats.percentile(0.5)
+            return (int(degraded), -1.0 if p50 is None else p50, order[name])
+
+        return sorted(candidates or self.providers, key=key)
+
+    def _hedge_delay(self, name: str) -> float:
+        """主请求的对冲预算"""
+        budget = self._stats[name].percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, budget or 0.0)
+
+    async def _timed(self, name: str, prompt: Any) -> str:
+        """调用提供商并记录耗时与结果（被取消的调用不计入统计）"""
+        start = time.monotonic()
+        try:
+            result = await self.providers[name].agenerate(prompt)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._stats[name].record(time.monotonic() - start, ok=False)
+            raise
+        self._stats[name].record(time.monotonic() - start, ok=True)
+        return result
+
+    async def agenerate(self, prompt: Any) -> str:
+        """
+        生成回复（异步）
+
+        按优先级调用提供商；启用对冲时，主请求超过预算仍未返回则并发请求次优提供商。
+        任一请求失败时切换到下一个提供商。
+
+        Args:
+            prompt: 提示词或消息列表
+
+        Returns:
+            最先成功的回复
+
+        Raises:
+            Exception: 所有提供商均失败时抛出最后一个错误
+        """
+        candidates = iter(self.ranked())
+        pending: Dict["asyncio.Task[str]", str] = {}
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch() -> bool:
+            name = next(candidates, None)
+            if name is None:
+                return False
+            pending[asyncio.ensure_future(self._timed(name, prompt))] = name
+            return True
+
+        launch()
+        primary = next(iter(pending.values()))
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and not hedged and len(pending) == 1:
+                    timeout = self._hedge_delay(next(iter(pending.values())))
+
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    hedged = True
+                    if launch():
+                        self.hedges += 1
+                        logger.info("主请求超出延迟预算，发出对冲请求")
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if hedged and name != primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    logger.warning(f"LLM 提供商 {name} 调用失败: {error}")
+                    last_error = error
+
+                if not pending:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error or RuntimeError("没有可用的 LLM 提供商")
+
+    def generate(self, prompt: Any) -> str:
+        """
+        生成回复（同步，按优先级依次尝试，不做对冲）
+
+        Args:
+            prompt: 提示词或消息列表
+
+        Returns:
+            生成的文本
+        """
+        last_error: Optional[BaseException] = None
+        for name in self.ranked():
+            start = time.monotonic()
+            try:
+                result = self.providers[name].generate(prompt)
+            except Exception as e:
+                self._stats[name].record(time.monotonic() - start, ok=False)
+                logger.warning(f"LLM 提供商 {name} 调用失败: {e}")
+                last_error = e
+                continue
+            self._stats[name].record(time.monotonic() - start, ok=True)
+            return result
+        raise last_error or RuntimeError("没有可用的 LLM 提供商")
+
+    def stream(self, prompt: Any) -> Iterator[str]:
+        """流式生成（同步），首个片段到达前失败则切换提供商"""
+        last_error: Optional[BaseException] = None
+        for name in self.ranked():
+            start = time.monotonic()
+            started = False
+            try:
+                for chunk in self.providers[name].stream(prompt):
+                    if not started:
+                        started = True
+                        self._stats[name].record(time.monotonic() - start, ok=True)
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                self._stats[name].record(time.monotonic() - start, ok=False)
+                logger.warning(f"LLM 提供商 {name} 流式调用失败: {e}")
+                last_error = e
+        raise last_error or RuntimeError("没有可用的 LLM 提供商")
+
+    async def astream(self, prompt: Any) -> AsyncIterator[str]:
+        """
+        流式生成（异步），首个片段到达前失败则切换提供商
+
+        流式调用按首个片段的到达时间记录延迟。
+        """
+        last_error: Optional[BaseException] = None
+        for name in self.ranked():
+            start = time.monotonic()
+            started = False
+            try:
+                async for chunk in self.providers[name].astream(prompt):
+                    if not started:
+                        started = True
+                        self._stats[name].record(time.monotonic() - start, ok=True)
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                self._stats[name].record(time.monotonic() - start, ok=False)
+                logger.warning(f"LLM 提供商 {name} 流式调用失败: {e}")
+                last_error = e
+        raise last_error or RuntimeError("没有可用的 LLM 提供商")
+
+    def count_tokens(self, text: str) -> int:
+        """估算 token 数量（使用首选提供商的估算）"""
+        return self.providers[self.ranked()[0]].count_tokens(text)
+
+    def stats(self) -> Dict[str, Any]:
+        """各提供商统计及对冲次数"""
+        return {
+            "providers": {name: s.snapshot() for name, s in self._stats.items()},
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
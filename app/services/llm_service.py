@@ -1,78 +1,387 @@
 """
 LLM Service - 大语言模型服务
 
-提供 LLM 调用封装，支持 MiniMax（已配置）。
+提供 LLM 调用封装，支持 MiniMax（已配置）、OpenAI、Anthropic，
+以及多提供商路由（见 llm_router）。
 """
 
 import os
+import abc
+import json
 import logging
+import contextlib
 import httpx
-from typing import Optional, Iterator
+from typing import Optional, Iterator, AsyncIterator, List, Dict, Any, Union
 from datetime import datetime
 
 from app.core.config import settings
+from app.core.http import get_async_client, get_sync_client
+from app.services.llm_cache import LLMResponseCache, fingerprint
+from app.services.llm_coalesce import SingleFlight, StreamFanout
+from app.services.llm_router import LLMRouter
+from app.services.llm_limiter import AdaptiveLimiter
+from app.services.tokenizer import get_tokenizer
 
 logger = logging.getLogger(__name__)
 
+# 提示词：纯文本，或 OpenAI 格式的消息列表
+Prompt = Union[str, List[Dict[str, str]]]
 
-class MiniMaxLLM:
-    """MiniMax LLM 服务"""
+
+def to_messages(prompt: Prompt) -> List[Dict[str, str]]:
+    """将提示词统一转换为消息列表"""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return list(prompt)
+
+
+def last_user_content(prompt: Prompt) -> str:
+    """提取最后一条用户消息内容"""
+    if isinstance(prompt, str):
+        return prompt
+    for message in reversed(prompt):
+        if message.get("role") == "user":
+            return message.get("content", "")
+    return ""
+
+
+def parse_sse_event(line: str) -> Optional[Dict[str, Any]]:
+    """
+    解析一行 SSE 数据
+    
+    Args:
+        line: SSE 原始行，如 `data: {...}`
+        
+    Returns:
+        JSON 事件；非数据行、结束标记或无法解析时返回 None
+    """
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError:
+        logger.warning(f"无法解析的 SSE 数据: {data[:100]}")
+        return None
+
+
+def parse_sse_delta(line: str) -> Optional[str]:
+    """
+    解析一行 OpenAI 格式的 SSE 数据，提取增量文本
+    
+    Args:
+        line: SSE 原始行，如 `data: {"choices": [{"delta": {"content": "你"}}]}`
+        
+    Returns:
+        增量文本；非数据行、结束标记或无内容时返回 None
+    """
+    event = parse_sse_event(line)
+    if not event:
+        return None
+    choices = event.get("choices") or []
+    if not choices:
+        return None
+    delta = choices[0].get("delta") or {}
+    return delta.get("content") or None
+
+
+class BaseChatLLM(abc.ABC):
+    """
+    HTTP 对话模型基类
+    
+    默认实现 OpenAI 兼容的 chat completions 协议，子类实现 `_default_model` /
+    `_default_base_url` / `_default_api_key` 提供默认的模型、地址和密钥（调用时读取配置），
+    协议不同的提供商覆盖 `_headers` / `_build_payload` / `_parse_response` / `_parse_delta`。
+    """
+    
+    name = "base"
+    path = "/chat/completions"
     
     def __init__(
         self,
-        model: str = "MiniMax-M2.1",
+        model: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None
     ):
-        """初始化 MiniMax LLM"""
-        self.model = model
+        """
+        初始化对话模型
+        
+        Args:
+            model: 模型名称（默认使用配置）
+            temperature: 采样温度
+            max_tokens: 最大生成 token 数
+            base_url: API 地址（默认使用配置）
+            api_key: API Key（默认使用配置）
+            client: 异步 HTTP 客户端（默认使用进程共享的连接池）
+        """
+        self.model = model or self._default_model()
         self.temperature = temperature
         self.max_tokens = max_tokens
-        self.api_key = settings.MINIMAX_API_KEY or os.getenv("MINIMAX_API_KEY")
+        self.base_url = (base_url or self._default_base_url()).rstrip("/")
+        self.api_key = api_key or self._default_api_key()
+        self._client = client
         
         if not self.api_key:
-            logger.warning("MiniMax API Key 未设置")
+            logger.warning(f"{self.name} API Key 未设置")
         
-        logger.info(f"MiniMax LLM 初始化完成，模型: {self.model}")
+        logger.info(f"{self.name} LLM 初始化完成，模型: {self.model}")
     
-    def generate(self, prompt: str) -> str:
-        """生成回复"""
+    @abc.abstractmethod
+    def _default_model(self) -> str:
+        """未指定 model 时使用的模型名称"""
+    
+    @abc.abstractmethod
+    def _default_base_url(self) -> str:
+        """未指定 base_url 时使用的 API 地址"""
+    
+    @abc.abstractmethod
+    def _default_api_key(self) -> Optional[str]:
+        """未指定 api_key 时使用的 API Key"""
+    
+    @property
+    def endpoint(self) -> str:
+        """对话补全接口地址"""
+        return f"{self.base_url}{self.path}"
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """异步 HTTP 客户端"""
+        return self._client or get_async_client()
+    
+    def _headers(self) -> Dict[str, str]:
+        """请求头"""
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+    
+    def _build_payload(self, prompt: Prompt, stream: bool = False) -> Dict[str, Any]:
+        """构建请求体"""
+        payload = {
+            "model": self.model,
+            "messages": to_messages(prompt),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+    
+    def _parse_response(self, result: Dict[str, Any]) -> str:
+        """从响应体中提取回复文本"""
+        return result["choices"][0]["message"]["content"]
+    
+    def _parse_delta(self, line: str) -> Optional[str]:
+        """从一行 SSE 数据中提取增量文本"""
+        return parse_sse_delta(line)
+    
+    def _no_key_reply(self, prompt: Prompt) -> str:
+        """未配置 API Key 时的占位回复"""
+        return f"[无API密钥] {last_user_content(prompt)}"
+    
+    def generate(self, prompt: Prompt) -> str:
+        """
+        生成回复（同步）
+        
+        Args:
+            prompt: 提示词，或 OpenAI 格式的消息列表
+            
+        Returns:
+            生成的文本
+            
+        Raises:
+            httpx.HTTPError: 请求失败
+        """
         if not self.api_key:
-            return f"[无API密钥] {prompt}"
+            return self._no_key_reply(prompt)
         
         try:
-            response = httpx.post(
-                "https://api.minimaxi.com/v1/text/chatcompletion_v2",
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": self.temperature,
-                    "max_tokens": self.max_tokens
-                },
-                timeout=60.0
+            response = get_sync_client().post(
+                self.endpoint,
+                headers=self._headers(),
+                json=self._build_payload(prompt)
             )
-            
             response.raise_for_status()
-            result = response.json()
+            return self._parse_response(response.json())
+            
+        except Exception as e:
+            logger.error(f"{self.name} 生成失败: {e}")
+            raise
+    
+    async def agenerate(self, prompt: Prompt) -> str:
+        """
+        生成回复（异步，复用连接池）
+        
+        Args:
+            prompt: 提示词，或 OpenAI 格式的消息列表
+            
+        Returns:
+            生成的文本
             
-            return result["choices"][0]["message"]["content"]
+        Raises:
+            httpx.HTTPError: 请求失败
+        """
+        if not self.api_key:
+            return self._no_key_reply(prompt)
+        
+        try:
+            response = await self.client.post(
+                self.endpoint,
+                headers=self._headers(),
+                json=self._build_payload(prompt)
+            )
+            response.raise_for_status()
+            return self._parse_response(response.json())
             
         except Exception as e:
-            logger.error(f"MiniMax 生成失败: {e}")
-            return f"生成失败: {str(e)}"
+            logger.error(f"{self.name} 生成失败: {e}")
+            raise
     
-    def stream(self, prompt: str) -> Iterator[str]:
-        """流式生成"""
-        content = self.generate(prompt)
-        yield content
+    def stream(self, prompt: Prompt) -> Iterator[str]:
+        """
+        流式生成（同步）
+        
+        Args:
+            prompt: 提示词，或 OpenAI 格式的消息列表
+            
+        Yields:
+            增量文本片段
+        """
+        if not self.api_key:
+            yield self._no_key_reply(prompt)
+            return
+        
+        with get_sync_client().stream(
+            "POST",
+            self.endpoint,
+            headers=self._headers(),
+            json=self._build_payload(prompt, stream=True)
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                delta = self._parse_delta(line)
+                if delta:
+                    yield delta
+    
+    async def astream(self, prompt: Prompt) -> AsyncIterator[str]:
+        """
+        流式生成（异步）
+        
+        逐行解析上游 SSE 增量，收到即转发。
+        
+        Args:
+            prompt: 提示词，或 OpenAI 格式的消息列表
+            
+        Yields:
+            增量文本片段
+        """
+        if not self.api_key:
+            yield self._no_key_reply(prompt)
+            return
+        
+        async with self.client.stream(
+            "POST",
+            self.endpoint,
+            headers=self._headers(),
+            json=self._build_payload(prompt, stream=True)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                delta = self._parse_delta(line)
+                if delta:
+                    yield delta
     
     def count_tokens(self, text: str) -> int:
-        """估算 token 数量"""
-        return len(text) // 2
+        """计算 token 数量"""
+        return get_tokenizer().count(text)
+
+
+class MiniMaxLLM(BaseChatLLM):
+    """MiniMax LLM 服务"""
+    
+    name = "minimax"
+    path = "/text/chatcompletion_v2"
+    
+    def _default_model(self) -> str:
+        return settings.MINIMAX_MODEL or "MiniMax-M2.1"
+    
+    def _default_base_url(self) -> str:
+        return settings.MINIMAX_BASE_URL
+    
+    def _default_api_key(self) -> Optional[str]:
+        return settings.MINIMAX_API_KEY or os.getenv("MINIMAX_API_KEY")
+
+
+class OpenAILLM(BaseChatLLM):
+    """OpenAI LLM 服务（也适用于 OpenAI 兼容的网关）"""
+    
+    name = "openai"
+    
+    def _default_model(self) -> str:
+        return settings.OPENAI_MODEL
+    
+    def _default_base_url(self) -> str:
+        return settings.OPENAI_BASE_URL
+    
+    def _default_api_key(self) -> Optional[str]:
+        return settings.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
+
+
+class AnthropicLLM(BaseChatLLM):
+    """Anthropic LLM 服务（Messages API）"""
+    
+    name = "anthropic"
+    path = "/messages"
+    
+    def _default_model(self) -> str:
+        return settings.ANTHROPIC_MODEL
+    
+    def _default_base_url(self) -> str:
+        return settings.ANTHROPIC_BASE_URL
+    
+    def _default_api_key(self) -> Optional[str]:
+        return settings.ANTHROPIC_API_KEY or os.getenv("ANTHROPIC_API_KEY")
+    
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json"
+        }
+    
+    def _build_payload(self, prompt: Prompt, stream: bool = False) -> Dict[str, Any]:
+        # Anthropic 的系统提示词是独立字段，max_tokens 为必填
+        messages = to_messages(prompt)
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        payload = {
+            "model": self.model,
+            "messages": [m for m in messages if m["role"] != "system"],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens or settings.ANTHROPIC_MAX_TOKENS
+        }
+        if system:
+            payload["system"] = system
+        if stream:
+            payload["stream"] = True
+        return payload
+    
+    def _parse_response(self, result: Dict[str, Any]) -> str:
+        return "".join(
+            block.get("text", "")
+            for block in result.get("content", [])
+            if block.get("type") == "text"
+        )
+    
+    def _parse_delta(self, line: str) -> Optional[str]:
+        event = parse_sse_event(line)
+        if not event or event.get("type") != "content_block_delta":
+            return None
+        return (event.get("delta") or {}).get("text") or None
 
 
 class LLMService:
@@ -80,6 +389,8 @@ class LLMService:
     
     PROVIDERS = {
         "minimax": MiniMaxLLM,
+        "openai": OpenAILLM,
+        "anthropic": AnthropicLLM,
     }
     
     def __init__(
@@ -87,34 +398,225 @@ class LLMService:
         provider: str = "minimax",
         model: Optional[str] = None,
         temperature: float = 0.7,
+        cache: Optional[LLMResponseCache] = None,
         **kwargs
     ):
-        """初始化 LLM 服务"""
-        provider_class = self.PROVIDERS.get(provider, MiniMaxLLM)
-        self.llm = provider_class(
-            model=model or settings.MINIMAX_MODEL or "MiniMax-M2.1",
-            temperature=temperature,
-            **kwargs
-        )
+        """
+        初始化 LLM 服务
+        
+        Args:
+            provider: 提供商名称（minimax / openai / anthropic），
+                或 "router" 表示按 LLM_PROVIDERS 在多个提供商间路由
+            model: 模型名称（默认使用各提供商的配置）
+            temperature: 采样温度
+            cache: 响应缓存（默认按配置创建，LLM_CACHE_ENABLED=false 时不缓存）
+            **kwargs: 传给提供商的其他参数
+            
+        Raises:
+            ValueError: 未知的提供商
+        """
+        if provider == "router":
+            self.llm = self._build_router(temperature=temperature, **kwargs)
+        elif provider in self.PROVIDERS:
+            self.llm = self.PROVIDERS[provider](
+                model=model,
+                temperature=temperature,
+                **kwargs
+            )
+        else:
+            raise ValueError(f"未知的 LLM 提供商: {provider}")
+        
+        if cache is None and settings.LLM_CACHE_ENABLED:
+            cache = LLMResponseCache(
+                max_size=settings.LLM_CACHE_MAX_SIZE,
+                ttl=settings.LLM_CACHE_TTL
+            )
+        self.cache = cache
+        
+        # 相同请求合并
+        self._flights = SingleFlight() if settings.LLM_COALESCE_ENABLED else None
+        self._streams = StreamFanout() if settings.LLM_COALESCE_ENABLED else None
+        
+        # 上游并发控制（仅异步路径）
+        self.limiter = AdaptiveLimiter(
+            initial_limit=settings.LLM_LIMITER_INITIAL,
+            min_limit=settings.LLM_LIMITER_MIN,
+            max_limit=settings.LLM_LIMITER_MAX,
+            latency_target=settings.LLM_LIMITER_LATENCY_TARGET,
+            max_queue=settings.LLM_LIMITER_MAX_QUEUE,
+            queue_timeout=settings.LLM_LIMITER_QUEUE_TIMEOUT
+        ) if settings.LLM_LIMITER_ENABLED else None
         
         self.provider = provider
         logger.info(f"LLM 服务初始化完成，提供商: {provider}")
     
-    def generate(self, prompt: str) -> str:
+    @classmethod
+    def _build_router(cls, temperature: float = 0.7, **kwargs) -> LLMRouter:
+        """按 LLM_PROVIDERS 构建多提供商路由"""
+        names = [n.strip() for n in settings.LLM_PROVIDERS.split(",") if n.strip()]
+        unknown = [n for n in names if n not in cls.PROVIDERS]
+        if unknown:
+            raise ValueError(f"未知的 LLM 提供商: {', '.join(unknown)}")
+        if not names:
+            raise ValueError("LLM_PROVIDERS 未配置")
+        
+        providers = {
+            name: cls.PROVIDERS[name](temperature=temperature, **kwargs)
+            for name in names
+        }
+        return LLMRouter(
+            providers,
+            hedge=settings.LLM_HEDGE_ENABLED,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            hedge_min_delay=settings.LLM_HEDGE_MIN_DELAY,
+            window=settings.LLM_ROUTER_WINDOW
+        )
+    
+    def _cache_key(self, prompt: Prompt) -> str:
+        """请求指纹：消息列表 + 模型 + 温度"""
+        return fingerprint(prompt, self.llm.model, self.llm.temperature)
+    
+    def _cache_get(self, key: str) -> Optional[str]:
+        """读取缓存（未启用缓存时返回 None）"""
+        return self.cache.get(key) if self.cache is not None else None
+    
+    def _cache_set(self, key: str, content: str) -> None:
+        """写入缓存（未启用缓存时忽略）"""
+        if self.cache is not None:
+            self.cache.set(key, content)
+    
+    def _slot(self, plan: Optional[str]) -> contextlib.AbstractAsyncContextManager:
+        """占用一个上游并发名额（未启用限制时不做限制）"""
+        if self.limiter is None:
+            return contextlib.nullcontext()
+        return self.limiter.slot(plan)
+    
+    def generate(self, prompt: Prompt) -> str:
         """生成回复"""
-        return self.llm.generate(prompt)
+        key = self._cache_key(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        def call() -> str:
+            content = self.llm.generate(prompt)
+            self._cache_set(key, content)
+            return content
+        
+        if self._flights is None:
+            return call()
+        return self._flights.do_sync(key, call)
+    
+    async def agenerate(self, prompt: Prompt, plan: Optional[str] = None) -> str:
+        """
+        生成回复（异步）
+        
+        相同的并发请求只调用一次上游；上游调用受自适应并发限制，
+        超出上限时按用户套餐优先级排队。
+        
+        Args:
+            prompt: 提示词或消息列表
+            plan: 用户套餐（UserModel.plan），决定排队优先级
+            
+        Returns:
+            生成的文本
+        """
+        key = self._cache_key(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        async def call() -> str:
+            async with self._slot(plan):
+                content = await self.llm.agenerate(prompt)
+            self._cache_set(key, content)
+            return content
+        
+        if self._flights is None:
+            return await call()
+        return await self._flights.do(key, call)
     
     def chat(self, message: str) -> str:
         """简单对话"""
         return self.generate(message)
     
-    def stream(self, prompt: str) -> Iterator[str]:
-        """流式生成"""
-        return self.llm.stream(prompt)
+    def stream(self, prompt: Prompt) -> Iterator[str]:
+        """流式生成（命中缓存时一次性产出完整回复）"""
+        key = self._cache_key(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
+        for chunk in self.llm.stream(prompt):
+            chunks.append(chunk)
+            yield chunk
+        self._cache_set(key, "".join(chunks))
+    
+    async def astream(self, prompt: Prompt, plan: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        流式生成（异步）
+        
+        命中缓存时一次性产出完整回复；相同的并发流只请求一次上游，
+        每个调用方各自收到完整的片段序列。上游流在整个持续期间占用一个并发名额。
+        
+        Args:
+            prompt: 提示词或消息列表
+            plan: 用户套餐（UserModel.plan），决定排队优先级
+        """
+        key = self._cache_key(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        async def source() -> AsyncIterator[str]:
+            chunks = []
+            async with self._slot(plan):
+                async for chunk in self.llm.astream(prompt):
+                    chunks.append(chunk)
+                    yield chunk
+            self._cache_set(key, "".join(chunks))
+        
+        stream = source() if self._streams is None else self._streams.subscribe(key, source)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            # 调用方提前停止读取时立即关闭：退订（最后一个订阅者离开时取消上游）或关闭上游流
+            await stream.aclose()
+    
+    def invalidate_cache(self) -> int:
+        """
+        清空响应缓存（知识库变更后调用）
+        
+        Returns:
+            被清除的条目数
+        """
+        return self.cache.invalidate() if self.cache is not None else 0
     
     def count_tokens(self, text: str) -> int:
-        """估算 token 数量"""
-        return self.llm.count_tokens(text) if hasattr(self.llm, 'count_tokens') else len(text) // 4
+        """计算 token 数量"""
+        return self.llm.count_tokens(text) if hasattr(self.llm, 'count_tokens') else get_tokenizer().count(text)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        运行统计（响应缓存、请求合并、并发限制、多提供商路由；未启用的部分为 None）
+        
+        Returns:
+            Dict: 统计信息
+        """
+        return {
+            "provider": self.provider,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "coalesce": {
+                "requests": self._flights.stats(),
+                "streams": self._streams.stats(),
+            } if self._flights is not None else None,
+            "limiter": self.limiter.stats() if self.limiter is not None else None,
+            "router": self.llm.stats() if isinstance(self.llm, LLMRouter) else None,
+        }
 
 
 def get_llm_service(**kwargs) -> LLMService:
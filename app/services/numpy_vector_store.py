@@ -0,0 +1,706 @@
+"""
+NumPy Vector Store - 嵌入式向量索引
+
+不依赖外部服务的向量存储后端（VECTOR_DB_TYPE=numpy），适合单机部署的中小规模知识库：
+- 存储：只追加的段文件（每次写入一个段：<序号>.vec 为归一化后的 float32/float16 行向量，
+  <序号>.jsonl 为 ID、内容和元数据），manifest.json 记录已提交的段；删除写入墓碑文件
+- 检索：内存映射的向量矩阵与查询向量做一次矩阵乘法（余弦相似度），argpartition 取 top-k
+- IVF（可选）：行数达到阈值后训练粗聚类中心，检索时只扫描最近的 nprobe 个簇
+- 量化（可选）：int8 / PQ 编码常驻内存，用近似分数选出 k * rerank 个候选，再读取原始向量
+  （内存映射，只访问候选所在的页）精确重排
+- 合并：段数过多或删除比例过高时把存活的行合并为一个段，清理墓碑
+
+写入只支持单进程；多个进程应使用不同的目录。
+"""
+
+import json
+import logging
+import operator
+import os
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.vector_quantization import create_quantizer
+
+logger = logging.getLogger(__name__)
+
+# float16 段按块转换为 float32 计算，控制临时内存
+_BLOCK_ROWS = 65536
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    """按行归一化为单位向量（零向量保持为零）"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+# 过滤条件中的比较运算（与 Chroma 的 where 语法一致，如 {"chunk_index": {"$gte": 3}}）
+_COMPARISONS = {
+    "$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le, "$ne": operator.ne,
+}
+
+
+def _matches(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """元数据过滤（各字段相等，或满足 {"$gte": 值} 形式的比较）"""
+    for key, condition in filter.items():
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for name, operand in condition.items():
+            if value is None or not _COMPARISONS[name](value, operand):
+                return False
+    return True
+
+
+class _Segment:
+    """只追加的段：向量矩阵 + 每行的 ID、内容、元数据 + 存活标记"""
+
+    def __init__(
+        self,
+        name: str,
+        vectors: np.ndarray,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        self.name = name
+        self.vectors = vectors
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.alive = np.ones(len(ids), dtype=bool)
+        # IVF 簇编号（未训练时为 None）
+        self.assign: Optional[np.ndarray] = None
+        # 量化编码（未启用量化或未训练时为 None）
+        self.codes: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def dense(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """读取 float32 向量（rows 为 None 时读取全部）"""
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        return np.asarray(vectors, dtype=np.float32)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """余弦相似度（向量已归一化，即点积）"""
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        if vectors.dtype == np.float32:
+            return vectors @ query
+        out = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), _BLOCK_ROWS):
+            block = vectors[start:start + _BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ query
+        return out
+
+
+class NumpyVectorIndex:
+    """
+    嵌入式向量索引（线程安全）
+
+    Example:
+        ```python
+        index = NumpyVectorIndex("./data/vectors/knowledge_base", nlist=256)
+        index.add(["a:0"], vectors, ["退款三个工作日到账"], [{"doc_id": "a"}])
+        for chunk_id, text, metadata, score in index.search(query_vector, k=5):
+            print(chunk_id, score)
+        ```
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        dtype: str = "float32",
+        nlist: int = 0,
+        nprobe: int = 8,
+        ivf_min_rows: int = 10000,
+        quantization: str = "none",
+        pq_subspaces: int = 0,
+        rerank: int = 10,
+        quantize_min_rows: int = 1000,
+        max_segments: int = 16,
+        max_deleted_ratio: float = 0.3
+    ):
+        """
+        打开（或创建）索引
+
+        Args:
+            directory: 存储目录（None 表示只在内存中）
+            dtype: 向量存储精度（float32 / float16，float16 占用减半）
+            nlist: IVF 簇数（0 表示不使用 IVF，始终全量扫描）
+            nprobe: 检索时扫描的簇数
+            ivf_min_rows: 行数达到该值后才训练 IVF（数据太少时全量扫描更快更准）
+            quantization: 量化方式（none / int8 / pq）
+            pq_subspaces: PQ 子空间数（0 表示维度 / 4）
+            rerank: 量化检索时取 k * rerank 个候选按原始向量精确重排
+            quantize_min_rows: 行数达到该值后才训练量化器（之前按原始向量检索）
+            max_segments: 段数超过该值时自动合并
+            max_deleted_ratio: 已删除行的比例超过该值时自动合并
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"不支持的向量精度: {dtype}")
+        if quantization not in ("none", "int8", "pq"):
+            raise ValueError(f"不支持的量化方式: {quantization}")
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.quantization = quantization
+        self.pq_subspaces = pq_subspaces
+        self.rerank = max(rerank, 1)
+        self.quantize_min_rows = quantize_min_rows
+        self.max_segments = max_segments
+        self.max_deleted_ratio = max_deleted_ratio
+
+        self.dim: Optional[int] = None
+        self.centroids: Optional[np.ndarray] = None
+        self.quantizer: Any = None
+        self._segments: List[_Segment] = []
+        self._locations: Dict[str, Tuple[_Segment, int]] = {}
+        self._next_segment = 0
+        self._lock = threading.RLock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    # ---- 持久化 ----
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self) -> None:
+        """读取 manifest 中已提交的段和墓碑"""
+        manifest_path = self._path("manifest.json")
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.dim = manifest["dim"]
+        self.dtype = np.dtype(manifest["dtype"])
+        self._next_segment = manifest["next_segment"]
+
+        for entry in manifest["segments"]:
+            name, rows = entry["name"], entry["rows"]
+            vectors = np.memmap(
+                self._path(f"{name}.vec"), dtype=self.dtype, mode="r", shape=(rows, self.dim)
+            )
+            ids, texts, metadatas = [], [], []
+            with open(self._path(f"{name}.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    ids.append(row["id"])
+                    texts.append(row["text"])
+                    metadatas.append(row["metadata"])
+            self._attach(_Segment(name, vectors, ids, texts, metadatas))
+
+        tombstones = self._path("tombstones.txt")
+        if os.path.exists(tombstones):
+            by_name = {segment.name: segment for segment in self._segments}
+            with open(tombstones, encoding="utf-8") as f:
+                for line in f:
+                    name, _, row = line.strip().partition("\t")
+                    segment = by_name.get(name)
+                    if segment is not None and row:
+                        self._kill(segment, int(row))
+
+        quantizer = self._path("quantizer.npz")
+        if self.quantization != "none" and os.path.exists(quantizer):
+            with np.load(quantizer) as data:
+                state = dict(data)
+            if str(state.pop("kind")) == self.quantization:
+                self.quantizer = create_quantizer(self.quantization, self.dim).load_state(state)
+                for segment in self._segments:
+                    codes = self._path(f"{segment.name}.codes.npy")
+                    segment.codes = np.load(codes) if os.path.exists(codes) else self._encode(segment)
+
+        centroids = self._path("centroids.npy")
+        if os.path.exists(centroids):
+            self.centroids = np.load(centroids)
+            for segment in self._segments:
+                segment.assign = self._assign(segment.dense())
+        logger.info(f"向量索引已加载: {self.directory}, {len(self)} 条, {len(self._segments)} 个段")
+
+    def _write_manifest(self) -> None:
+        """原子写入 manifest（段文件写完之后才提交）"""
+        manifest = {
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "next_segment": self._next_segment,
+            "segments": [{"name": s.name, "rows": len(s)} for s in self._segments],
+        }
+        tmp_path = self._path("manifest.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path("manifest.json"))
+
+    def _write_segment(
+        self,
+        vectors: np.ndarray,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> _Segment:
+        """写入一个新段（磁盘模式下返回内存映射的段）"""
+        name = f"{self._next_segment:06d}"
+        self._next_segment += 1
+        vectors = vectors.astype(self.dtype)
+        if not self.directory:
+            return _Segment(name, vectors, ids, texts, metadatas)
+
+        with open(self._path(f"{name}.vec"), "wb") as f:
+            f.write(vectors.tobytes())
+        with open(self._path(f"{name}.jsonl"), "w", encoding="utf-8") as f:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps(
+                    {"id": chunk_id, "text": text, "metadata": metadata}, ensure_ascii=False
+                ) + "\n")
+        mapped = np.memmap(
+            self._path(f"{name}.vec"), dtype=self.dtype, mode="r", shape=vectors.shape
+        )
+        return _Segment(name, mapped, ids, texts, metadatas)
+
+    # ---- 内存状态 ----
+
+    def _attach(self, segment: _Segment) -> None:
+        """登记段；同一 ID 以最后写入的为准"""
+        self._segments.append(segment)
+        for row, chunk_id in enumerate(segment.ids):
+            previous = self._locations.get(chunk_id)
+            if previous is not None:
+                previous[0].alive[previous[1]] = False
+            self._locations[chunk_id] = (segment, row)
+
+    def _kill(self, segment: _Segment, row: int) -> None:
+        segment.alive[row] = False
+        location = self._locations.get(segment.ids[row])
+        if location is not None and location[0] is segment and location[1] == row:
+            del self._locations[segment.ids[row]]
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    @property
+    def total_rows(self) -> int:
+        """段中的总行数（含已删除）"""
+        return sum(len(segment) for segment in self._segments)
+
+    # ---- 写入 ----
+
+    def add(
+        self,
+        ids: Sequence[str],
+        vectors: Any,
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None
+    ) -> List[str]:
+        """
+        写入向量（已存在的 ID 被新行替换）
+
+        Args:
+            ids: ID 列表
+            vectors: 向量（与 ids 一一对应）
+            texts: 内容
+            metadatas: 元数据
+
+        Returns:
+            写入的 ID 列表
+
+        Raises:
+            ValueError: 向量维度与索引不一致
+        """
+        ids = list(ids)
+        if not ids:
+            return []
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        metadatas = [dict(m) for m in metadatas] if metadatas is not None else [{} for _ in ids]
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致: {matrix.shape[1]} != {self.dim}")
+
+            segment = self._write_segment(matrix, ids, list(texts), metadatas)
+            if self.centroids is not None:
+                segment.assign = self._assign(matrix)
+            if self.quantizer is not None:
+                segment.codes = self._encode(segment, matrix)
+            self._attach(segment)
+            if self.directory:
+                self._write_manifest()
+            self._maybe_maintain()
+        return ids
+
+    def delete(
+        self,
+        ids: Optional[Iterable[str]] = None,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """
+        删除向量（写入墓碑，合并时物理删除）
+
+        Args:
+            ids: 要删除的 ID
+            filter: 元数据过滤条件（与 ids 二选一）
+
+        Returns:
+            删除的条数
+        """
+        with self._lock:
+            if ids is not None:
+                targets = [self._locations[i] for i in ids if i in self._locations]
+            elif filter is not None:
+                targets = [
+                    (segment, row)
+                    for segment, row in self._locations.values()
+                    if _matches(segment.metadatas[row], filter)
+                ]
+            else:
+                raise ValueError("必须指定 ids 或 filter")
+
+            for segment, row in targets:
+                self._kill(segment, row)
+            if targets and self.directory:
+                with open(self._path("tombstones.txt"), "a", encoding="utf-8") as f:
+                    f.writelines(f"{segment.name}\t{row}\n" for segment, row in targets)
+            if targets:
+                self._maybe_maintain()
+        return len(targets)
+
+    def clear(self) -> None:
+        """删除全部数据（包括磁盘文件）"""
+        with self._lock:
+            names = [segment.name for segment in self._segments]
+            self._segments, self._locations = [], {}
+            self.dim, self.centroids = None, None
+            if self.directory:
+                for name in names:
+                    self._remove_files(name)
+                self.quantizer = None
+                for filename in ("manifest.json", "tombstones.txt", "centroids.npy", "quantizer.npz"):
+                    if os.path.exists(self._path(filename)):
+                        os.remove(self._path(filename))
+
+    def _remove_files(self, name: str) -> None:
+        for suffix in (".vec", ".jsonl", ".codes.npy"):
+            path = self._path(name + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _maybe_maintain(self) -> None:
+        """段数过多或删除过多时合并；行数达到阈值时训练 IVF 和量化器"""
+        total = self.total_rows
+        dead = total - len(self._locations)
+        if len(self._segments) > self.max_segments or (
+            total and dead / total > self.max_deleted_ratio
+        ):
+            self.compact()
+            return
+        if self.nlist and self.centroids is None and len(self._locations) >= self.ivf_min_rows:
+            self.train_ivf()
+        if (
+            self.quantization != "none" and self.quantizer is None
+            and len(self._locations) >= self.quantize_min_rows
+        ):
+            self.train_quantizer()
+
+    def compact(self) -> None:
+        """把存活的行合并为一个段，删除旧段和墓碑"""
+        with self._lock:
+            old = self._segments
+            self._segments, self._locations = [], {}
+            live = [(segment, np.flatnonzero(segment.alive)) for segment in old]
+            live = [(segment, rows) for segment, rows in live if len(rows)]
+            if live:
+                merged = self._write_segment(
+                    np.concatenate([segment.dense(rows) for segment, rows in live]),
+                    [segment.ids[r] for segment, rows in live for r in rows],
+                    [segment.texts[r] for segment, rows in live for r in rows],
+                    [segment.metadatas[r] for segment, rows in live for r in rows],
+                )
+                self._attach(merged)
+            if self.directory:
+                self._write_manifest()
+                tombstones = self._path("tombstones.txt")
+                if os.path.exists(tombstones):
+                    os.remove(tombstones)
+                for segment in old:
+                    self._remove_files(segment.name)
+
+            if self.nlist and len(self._locations) >= self.ivf_min_rows:
+                self.train_ivf()
+            elif self.centroids is not None:
+                for segment in self._segments:
+                    segment.assign = self._assign(segment.dense())
+            if self.quantizer is not None:
+                for segment in self._segments:
+                    segment.codes = self._encode(segment)
+            elif self.quantization != "none" and len(self._locations) >= self.quantize_min_rows:
+                self.train_quantizer()
+            logger.info(f"向量索引合并完成: {len(old)} 个段 -> {len(self._segments)} 个段, {len(self)} 条")
+
+    # ---- IVF ----
+
+    def train_ivf(self, iterations: int = 10, sample_size: Optional[int] = None) -> None:
+        """
+        训练 IVF 粗聚类中心（球面 k-means），并重新分配所有行
+
+        Args:
+            iterations: k-means 迭代次数
+            sample_size: 训练采样行数（默认每簇 64 行）
+        """
+        with self._lock:
+            if not self.nlist or not self._segments:
+                return
+            matrix = np.concatenate([segment.dense() for segment in self._segments])
+            alive = np.concatenate([segment.alive for segment in self._segments])
+            matrix = matrix[alive]
+            nlist = min(self.nlist, len(matrix))
+            rng = np.random.default_rng(0)
+            sample_size = min(sample_size or nlist * 64, len(matrix))
+            sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assign = (sample @ centroids.T).argmax(axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, sample)
+                empty = np.bincount(assign, minlength=nlist) == 0
+                # 空簇保留原中心
+                sums[empty] = centroids[empty]
+                centroids = _normalize(sums)
+
+            self.centroids = centroids.astype(np.float32)
+            for segment in self._segments:
+                segment.assign = self._assign(segment.dense())
+            if self.directory:
+                np.save(self._path("centroids.npy"), self.centroids)
+            logger.info(f"IVF 训练完成: {nlist} 个簇, 采样 {sample_size} 行")
+
+    # ---- 量化 ----
+
+    def train_quantizer(self, sample_size: int = 16384) -> None:
+        """
+        训练量化器，并为所有段生成编码
+
+        Args:
+            sample_size: 训练采样行数
+        """
+        with self._lock:
+            if self.quantization == "none" or not self._segments:
+                return
+            matrix = np.concatenate([segment.dense() for segment in self._segments])
+            alive = np.concatenate([segment.alive for segment in self._segments])
+            matrix = matrix[alive]
+            rng = np.random.default_rng(0)
+            if len(matrix) > sample_size:
+                matrix = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+
+            quantizer = create_quantizer(self.quantization, self.dim, self.pq_subspaces)
+            self.quantizer = quantizer.fit(matrix)
+            if self.directory:
+                np.savez(self._path("quantizer.npz"), kind=quantizer.kind, **quantizer.state())
+            for segment in self._segments:
+                segment.codes = self._encode(segment)
+            logger.info(
+                f"量化器训练完成: {quantizer.kind}, 每条 {quantizer.code_size(self.dim)} 字节"
+                f"（原始 {self.dim * 4} 字节）"
+            )
+
+    def _encode(self, segment: _Segment, matrix: Optional[np.ndarray] = None) -> np.ndarray:
+        """生成段的量化编码（磁盘模式下同时保存）"""
+        codes = self.quantizer.encode(segment.dense() if matrix is None else matrix)
+        if self.directory:
+            np.save(self._path(f"{segment.name}.codes.npy"), codes)
+        return codes
+
+    def _assign(self, matrix: np.ndarray) -> np.ndarray:
+        """最近的聚类中心"""
+        return (matrix @ self.centroids.T).argmax(axis=1).astype(np.int32)
+
+    # ---- 检索 ----
+
+    def search(
+        self,
+        vector: Any,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, str, Dict[str, Any], float]]:
+        """
+        余弦相似度 top-k 检索
+
+        Args:
+            vector: 查询向量
+            k: 返回的最大结果数
+            filter: 元数据过滤条件（各字段相等）
+
+        Returns:
+            (ID, 内容, 元数据, 余弦相似度) 列表，按相似度降序
+        """
+        with self._lock:
+            segments = list(self._segments)
+            centroids = self.centroids
+            quantizer = self.quantizer
+        if not segments or k <= 0:
+            return []
+        query = _normalize(np.asarray(vector, dtype=np.float32).ravel())
+
+        probes = None
+        if centroids is not None:
+            nprobe = min(self.nprobe, len(centroids))
+            probes = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+
+        candidates: List[Tuple[np.ndarray, _Segment, np.ndarray]] = []
+        for segment in segments:
+            rows = self._candidate_rows(segment, probes, filter)
+            if rows is not None and not len(rows):
+                continue
+            quantized = quantizer is not None and segment.codes is not None
+            if quantized:
+                codes = segment.codes if rows is None else segment.codes[rows]
+                scores = quantizer.scores(query, codes)
+            else:
+                scores = segment.scores(query, rows)
+            alive = segment.alive if rows is None else segment.alive[rows]
+            if not alive.all():
+                scores = np.where(alive, scores, -np.inf)
+
+            take = k * self.rerank if quantized else k
+            top = np.argpartition(-scores, take - 1)[:take] if len(scores) > take else np.arange(len(scores))
+            top = top[np.isfinite(scores[top])]
+            top_rows = top if rows is None else rows[top]
+            if quantized:
+                # 按原始向量精确重排近似候选
+                top_rows = np.sort(top_rows)
+                exact = segment.scores(query, top_rows)
+                keep = np.argsort(-exact, kind="stable")[:k]
+                candidates.append((exact[keep], segment, top_rows[keep]))
+            else:
+                candidates.append((scores[top], segment, top_rows))
+        if not candidates:
+            return []
+
+        scores = np.concatenate([scores for scores, _, _ in candidates])
+        owners = [(segment, row) for _, segment, rows in candidates for row in rows.tolist()]
+        order = np.argsort(-scores, kind="stable")[:k]
+        results = []
+        for i in order:
+            segment, row = owners[i]
+            results.append((segment.ids[row], segment.texts[row], dict(segment.metadatas[row]), float(scores[i])))
+        return results
+
+    @staticmethod
+    def _candidate_rows(
+        segment: _Segment,
+        probes: Optional[np.ndarray],
+        filter: Optional[Dict[str, Any]]
+    ) -> Optional[np.ndarray]:
+        """需要计算相似度的行（None 表示整段）"""
+        rows = None
+        if probes is not None and segment.assign is not None:
+            rows = np.flatnonzero(np.isin(segment.assign, probes))
+        if filter:
+            candidates = range(len(segment)) if rows is None else rows.tolist()
+            rows = np.array(
+                [row for row in candidates if _matches(segment.metadatas[row], filter)],
+                dtype=np.int64
+            )
+        return rows
+
+    def info(self) -> Dict[str, Any]:
+        """索引信息"""
+        return {
+            "count": len(self),
+            "rows": self.total_rows,
+            "segments": len(self._segments),
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "ivf_lists": 0 if self.centroids is None else len(self.centroids),
+            "quantization": self.quantizer.kind if self.quantizer is not None else "none",
+            "code_bytes": (
+                self.quantizer.code_size(self.dim) if self.quantizer is not None
+                else (self.dim or 0) * self.dtype.itemsize
+            ),
+        }
+
+
+class NumpyVectorStore:
+    """
+    基于 NumpyVectorIndex 的向量存储客户端
+
+    方法与 LangChain VectorStore（Milvus / Chroma）中 VectorStoreService 用到的部分一致。
+    """
+
+    def __init__(self, embedding_function: Any, index: NumpyVectorIndex):
+        """
+        Args:
+            embedding_function: 向量模型（embed_documents / embed_query）
+            index: 向量索引
+        """
+        self.embedding_function = embedding_function
+        self.index = index
+
+    def add_documents(self, documents: List[Any], ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        """向量化并写入文档"""
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in documents]
+        texts = [document.page_content for document in documents]
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.index.add(ids, vectors, texts, [document.metadata for document in documents])
+
+    def similarity_search_with_relevance_scores(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> List[Tuple[Any, float]]:
+        """检索（相关度为余弦相似度）"""
+        vector = self.embedding_function.embed_query(query)
+        return self.similarity_search_with_relevance_scores_by_vector(vector, k=k, filter=filter)
+
+    def similarity_search_with_relevance_scores_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> List[Tuple[Any, float]]:
+        """按已计算的查询向量检索（相关度为余弦相似度）"""
+        from langchain_core.documents import Document
+
+        return [
+            (Document(page_content=text, metadata=metadata), score)
+            for _, text, metadata, score in self.index.search(embedding, k=k, filter=filter)
+        ]
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> List[Any]:
+        """检索"""
+        return [
+            document for document, _ in
+            self.similarity_search_with_relevance_scores(query, k=k, filter=filter)
+        ]
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None, **kwargs) -> int:
+        """删除文档"""
+        return self.index.delete(ids=ids, filter=filter)
+
+    def count(self) -> int:
+        """文档数"""
+        return len(self.index)
+
+    def delete_collection(self) -> None:
+        """删除整个集合"""
+        self.index.clear()
@@ -1,15 +1,41 @@
 """
-RAG Service - 检索增强生成服务（简化版）
+RAG Service - 检索增强生成服务
 
-提供基本的文档检索功能。
+基于 VectorStoreService（Milvus / Chroma）检索知识库片段，基于 DocumentProcessor
+摄入文档。未配置向量数据库（VECTOR_DB_TYPE 为空）或向量库不可用时降级为空结果，
+对话仍可进行；异步检索超过 RAG_TIMEOUT 时同样返回空结果（批量检索返回 None），
+不拖慢本轮对话。
+
+混合检索（RAG_HYBRID_ENABLED）：摄入时同时写入进程内 BM25 关键词索引，检索时与
+向量结果做倒数排名融合，补上订单号、SKU 等精确字符串的召回。
 """
 
+import asyncio
 import logging
-from typing import List, Optional, Dict, Any
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Tuple
 from dataclasses import dataclass
 
+from app.core.config import settings
+from app.core.concurrency import run_blocking
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.keyword_index import BM25Index, KeywordHit, reciprocal_rank_fusion
+
 logger = logging.getLogger(__name__)
 
+# 来源引用保留的字段（对话历史中不保存片段内容）
+SOURCE_REF_FIELDS = ("chunk_id", "score", "doc_id")
+
+# 向量库元数据只支持标量值
+_SCALAR_TYPES = (str, int, float, bool)
+
+# 批量检索在 RAG_TIMEOUT 之外额外等待的时间（秒），供线程中的检索在截止时间后收尾
+_BATCH_TIMEOUT_GRACE = 0.5
+
 
 @dataclass
 class RetrievalResult:
@@ -18,19 +44,172 @@ class RetrievalResult:
     metadata: Dict[str, Any]
     score: float
     chunk_id: str
+    # 混合检索的 RRF 融合分数（决定排序），score 保持各路检索的原始相关度
+    rank_score: float = 0.0
+
+
+def document_id(result: RetrievalResult) -> str:
+    """片段所属文档的标识（doc_id，缺省时用来源路径或文件名）"""
+    metadata = result.metadata
+    return str(metadata.get("doc_id") or metadata.get("source") or metadata.get("filename", ""))
+
+
+def source_ref(source: Dict[str, Any]) -> Dict[str, Any]:
+    """将来源信息压缩为引用（chunk_id、score、doc_id）"""
+    return {field: source.get(field) for field in SOURCE_REF_FIELDS}
+
+
+def chunk_id_of(metadata: Dict[str, Any]) -> str:
+    """片段ID：`文件名:分块序号`（摄入时写入元数据）"""
+    if metadata.get("chunk_id"):
+        return str(metadata["chunk_id"])
+    return f"{metadata.get('doc_id') or metadata.get('filename', '未知')}:{metadata.get('chunk_index', 0)}"
+
+
+def create_embeddings(loop: Optional[asyncio.AbstractEventLoop] = None) -> Any:
+    """
+    创建向量模型
+
+    配置了 OPENAI_API_KEY 时使用 OpenAI 兼容的向量接口（EMBEDDING_MODEL，带查询 LRU、
+    文档磁盘缓存和查询微批处理），否则使用本地字符 n-gram 哈希向量（只能匹配字面相近的文本）。
+
+    Args:
+        loop: 查询微批处理绑定的事件循环（None 时在首次异步调用时绑定）
+    """
+    if settings.OPENAI_API_KEY:
+        from langchain_openai import OpenAIEmbeddings
+        model = OpenAIEmbeddings(
+            model=settings.EMBEDDING_MODEL,
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL
+        )
+        if settings.EMBEDDING_BATCH_ENABLED:
+            model = EmbeddingBatcher(
+                model,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                max_delay=settings.EMBEDDING_BATCH_MAX_DELAY,
+                timeout=settings.RAG_TIMEOUT if settings.RAG_TIMEOUT > 0 else None
+            )
+            if loop is not None:
+                model.attach(loop)
+        return CachedEmbeddings(
+            model,
+            directory=settings.EMBEDDING_CACHE_DIR or None,
+            namespace=settings.EMBEDDING_MODEL,
+            query_cache_size=settings.EMBEDDING_QUERY_CACHE_SIZE
+        )
+    from app.services.text_features import HashingEmbeddings
+    logger.warning("未配置 OPENAI_API_KEY，知识库使用字符 n-gram 哈希向量")
+    return HashingEmbeddings()
 
 
 class RAGService:
     """
     RAG（检索增强生成）服务类
-    
-    提供基本的检索功能。
+
+    检索结果按相关度分数过滤（score_threshold）。启用关键词索引时，向量结果与 BM25
+    结果按 RRF 融合排序（rank_score），片段分数保留向量相似度，关键词独有的片段取 BM25
+    归一化相关度。最近检索到的片段按
+    chunk_id 缓存（有界 LRU），供对话历史中的来源引用展开。
+
+    Example:
+        ```python
+        rag = RAGService()
+        rag.ingest_file("docs/售后政策.md")
+        results = await rag.aretrieve_documents("怎么退款", top_k=3)
+        ```
     """
-    
-    def __init__(self):
-        """初始化 RAG 服务"""
-        logger.info("RAG 服务初始化完成（简化版）")
-    
+
+    def __init__(
+        self,
+        vector_store: Any = None,
+        document_processor: Any = None,
+        keyword_index: Optional[BM25Index] = None,
+        score_threshold: Optional[float] = None,
+        timeout: Optional[float] = None,
+        chunk_cache_size: int = 2048,
+        knowledge_dir: Optional[str] = None
+    ):
+        """
+        初始化 RAG 服务
+
+        Args:
+            vector_store: 向量存储服务（默认按配置 VECTOR_DB_TYPE 在 start() 或首次检索时创建）
+            document_processor: 文档处理器（默认首次摄入时创建）
+            keyword_index: BM25 关键词索引（默认按配置 RAG_KEYWORD_INDEX_PATH 首次使用时加载）
+            score_threshold: 最低相关度分数（默认使用配置 RAG_SCORE_THRESHOLD）
+            timeout: 异步检索超时（秒，默认使用配置 RAG_TIMEOUT，<= 0 表示不限制）
+            chunk_cache_size: 片段缓存的最大条目数
+            knowledge_dir: 知识库文档根目录（默认使用配置 KNOWLEDGE_BASE_DIR）
+        """
+        self._vector_store = vector_store
+        self._document_processor = document_processor
+        self._keyword_index = keyword_index
+        self._embeddings: Any = None
+        self._store_failed = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._store_lock = threading.RLock()
+        self.score_threshold = (
+            settings.RAG_SCORE_THRESHOLD if score_threshold is None else score_threshold
+        )
+        self.timeout = settings.RAG_TIMEOUT if timeout is None else timeout
+        self.rrf_k = settings.RAG_RRF_K
+        self.keyword_threshold = settings.RAG_KEYWORD_THRESHOLD
+        self.knowledge_dir = os.path.abspath(knowledge_dir or settings.KNOWLEDGE_BASE_DIR or ".")
+
+        self.chunk_cache_size = chunk_cache_size
+        self._chunks: "OrderedDict[str, RetrievalResult]" = OrderedDict()
+        self._chunk_lock = threading.Lock()
+
+        self.timeouts = 0
+        logger.info("RAG 服务初始化完成")
+
+    @property
+    def vector_store(self) -> Any:
+        """向量存储服务（未配置或创建失败时为 None）"""
+        if self._vector_store is not None or self._store_failed:
+            return self._vector_store
+        if not settings.VECTOR_DB_TYPE:
+            return None
+        with self._store_lock:
+            if self._vector_store is None and not self._store_failed:
+                try:
+                    from app.services.vector_store import VectorStoreService
+                    self._vector_store = VectorStoreService(self.embeddings)
+                except Exception as e:
+                    # 只记录一次，之后的检索直接降级
+                    self._store_failed = True
+                    logger.error(f"向量存储不可用，知识库检索已降级: {e}")
+        return self._vector_store
+
+    @property
+    def embeddings(self) -> Any:
+        """向量模型（知识库检索和标准问答共用同一实例及其缓存，首次访问时按配置创建）"""
+        if self._embeddings is None:
+            with self._store_lock:
+                if self._embeddings is None:
+                    self._embeddings = create_embeddings(self._loop)
+        return self._embeddings
+
+    @property
+    def keyword_index(self) -> Optional[BM25Index]:
+        """BM25 关键词索引（未启用混合检索时为 None）"""
+        if self._keyword_index is not None or not settings.RAG_HYBRID_ENABLED:
+            return self._keyword_index
+        with self._store_lock:
+            if self._keyword_index is None:
+                path = settings.RAG_KEYWORD_INDEX_PATH
+                self._keyword_index = BM25Index.open(path) if path else BM25Index()
+        return self._keyword_index
+
+    @property
+    def document_processor(self) -> Any:
+        """文档处理器"""
+        if self._document_processor is None:
+            from app.knowledge.document_processor import DocumentProcessor
+            self._document_processor = DocumentProcessor()
+        return self._document_processor
+
     def retrieve_documents(
         self,
         query: str,
@@ -38,30 +217,325 @@ class RAGService:
     ) -> List[RetrievalResult]:
         """
         检索相关文档
-        
+
         Args:
             query: 查询文本
             top_k: 返回的最大结果数
-            
+
+        Returns:
+            检索结果列表（按相关度降序，低于 score_threshold 的已过滤）；
+            未配置向量数据库时返回空列表
+
+        Raises:
+            Exception: 向量库查询失败
+        """
+        store = self.vector_store
+        if store is None:
+            return []
+
+        pairs = store.similarity_search_with_score(query=query, top_k=top_k)
+        return self._rank(query, pairs, top_k)
+
+    def _rank(self, query: str, pairs: List[Any], top_k: int) -> List[RetrievalResult]:
+        """将向量库返回的 (文档, 分数) 过滤、排序，并与关键词结果融合"""
+        results = [
+            RetrievalResult(
+                content=document.page_content,
+                metadata=dict(document.metadata),
+                score=float(score),
+                chunk_id=chunk_id_of(document.metadata)
+            )
+            for document, score in pairs
+            if score >= self.score_threshold
+        ]
+        results.sort(key=lambda r: r.score, reverse=True)
+
+        index = self.keyword_index
+        if index is not None and len(index):
+            hits = [
+                hit for hit in index.search(query, top_k=top_k)
+                if hit.relevance >= self.keyword_threshold
+            ]
+            results = self._fuse(results, hits, top_k)
+
+        logger.info(f"检索完成: {query[:50]}，{len(results)} 个片段（向量候选 {len(pairs)} 个）")
+        self._remember(results)
+        return results
+
+    def _fuse(
+        self,
+        vector_results: List[RetrievalResult],
+        hits: List[KeywordHit],
+        top_k: int
+    ) -> List[RetrievalResult]:
+        """按 RRF 融合向量结果和关键词结果（score 保留向量相似度，关键词独有的片段取 BM25 相关度）"""
+        by_id = {result.chunk_id: result for result in vector_results}
+        for hit in hits:
+            result = by_id.get(hit.chunk_id)
+            if result is None:
+                by_id[hit.chunk_id] = RetrievalResult(
+                    content=hit.content,
+                    metadata=hit.metadata,
+                    score=hit.relevance,
+                    chunk_id=hit.chunk_id
+                )
+
+        fused = reciprocal_rank_fusion(
+            [[result.chunk_id for result in vector_results], [hit.chunk_id for hit in hits]],
+            k=self.rrf_k
+        )
+        for chunk_id, result in by_id.items():
+            result.rank_score = fused[chunk_id]
+        ranked = sorted(by_id.values(), key=lambda result: result.rank_score, reverse=True)
+        return ranked[:top_k]
+
+    async def aretrieve_documents(
+        self,
+        query: str,
+        top_k: int = 5
+    ) -> List[RetrievalResult]:
+        """
+        检索相关文档（异步，在线程池中执行，超时返回空列表）
+
+        Args:
+            query: 查询文本
+            top_k: 返回的最大结果数
+
         Returns:
             检索结果列表
         """
-        # 简化版：返回空结果
-        logger.info(f"检索（简化版）: {query[:50]}...")
-        return []
-    
+        if await self._aget_vector_store() is None:
+            # 未配置向量库时检索不阻塞，直接在事件循环中执行
+            return self.retrieve_documents(query, top_k=top_k)
+        return await self._with_timeout(
+            run_blocking(self.retrieve_documents, query, top_k=top_k), [], query
+        )
+
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        deadline: Optional[float] = None
+    ) -> List[Optional[List[RetrievalResult]]]:
+        """
+        批量检索（批量对话接口使用）
+
+        向量库支持批量检索时所有查询只向量化一次；批量调用失败或不支持时逐个检索，
+        只有失败的查询位置为 None。
+
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回的最大结果数
+            deadline: 截止时间（time.monotonic()），逐个检索时到期后剩余查询不再执行
+
+        Returns:
+            与 queries 一一对应的检索结果列表；查询失败或未在截止时间前执行的位置为 None
+        """
+        store = self.vector_store
+        if store is not None and hasattr(store, "similarity_search_with_score_batch"):
+            # 一次向量化全部查询，再逐个按向量检索
+            try:
+                batches = store.similarity_search_with_score_batch(queries, top_k=top_k)
+            except Exception as e:
+                logger.warning(f"知识库批量检索失败，改为逐个检索（{len(queries)} 个查询）: {e}")
+            else:
+                return [self._rank(query, pairs, top_k) for query, pairs in zip(queries, batches)]
+
+        results: List[Optional[List[RetrievalResult]]] = []
+        skipped = 0
+        for query in queries:
+            if deadline is not None and time.monotonic() >= deadline:
+                results.append(None)
+                skipped += 1
+                continue
+            try:
+                results.append(self.retrieve_documents(query, top_k=top_k))
+            except Exception as e:
+                logger.warning(f"知识库检索失败: {query[:50]}, {e}")
+                results.append(None)
+
+        if skipped:
+            self.timeouts += 1
+            logger.warning(f"知识库批量检索超时，{skipped} 个查询不使用知识库")
+        return results
+
+    async def aretrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5
+    ) -> List[Optional[List[RetrievalResult]]]:
+        """
+        批量检索（异步）
+
+        整批在一个线程中执行，与单次检索共用 RAG_TIMEOUT：到期时已完成的查询照常返回，
+        其余位置为 None，由调用方逐条降级为不使用知识库。
+        """
+        if await self._aget_vector_store() is None:
+            return self.retrieve_batch(queries, top_k=top_k)
+        if self.timeout <= 0:
+            return await run_blocking(self.retrieve_batch, queries, top_k=top_k)
+        return await self._with_timeout(
+            run_blocking(
+                self.retrieve_batch, queries, top_k=top_k,
+                deadline=time.monotonic() + self.timeout
+            ),
+            [None] * len(queries),
+            f"{len(queries)} 个查询",
+            timeout=self.timeout + _BATCH_TIMEOUT_GRACE
+        )
+
+    def _bind_loop(self) -> None:
+        """记录事件循环（创建向量库时查询微批处理绑定到该循环）"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+
+    async def _aget_vector_store(self) -> Any:
+        """
+        获取向量存储服务（异步）
+
+        首次创建会打开向量磁盘缓存、连接向量库，在线程池中执行，不阻塞事件循环。
+        """
+        self._bind_loop()
+        if self._vector_store is None and not self._store_failed and settings.VECTOR_DB_TYPE:
+            return await run_blocking(lambda: self.vector_store)
+        return self._vector_store
+
+    async def start(self) -> None:
+        """应用启动时调用：绑定事件循环，在线程池中创建向量存储和关键词索引"""
+        await self._aget_vector_store()
+        await run_blocking(lambda: self.keyword_index)
+
+    def _embedding_layers(self) -> Tuple[Any, Any]:
+        """向量模型的查询缓存和微批处理器（create_embeddings 的包装层，不存在时为 None）"""
+        embeddings = self._embeddings or getattr(self._vector_store, "embedding_model", None)
+        cache = embeddings if isinstance(embeddings, CachedEmbeddings) else None
+        batcher = cache.embeddings if cache is not None else embeddings
+        return cache, batcher if isinstance(batcher, EmbeddingBatcher) else None
+
+    async def stop(self) -> None:
+        """应用关闭时调用：发送查询微批处理中剩余的查询并等待进行中的批次完成"""
+        _, batcher = self._embedding_layers()
+        if batcher is not None:
+            await batcher.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        运行统计（检索超时、关键词索引片段数、向量缓存和查询微批处理；未启用的部分为 None）
+
+        Returns:
+            Dict: 统计信息
+        """
+        cache, batcher = self._embedding_layers()
+        return {
+            "timeouts": self.timeouts,
+            "keyword_chunks": len(self._keyword_index) if self._keyword_index is not None else None,
+            "embedding_cache": cache.stats() if cache is not None else None,
+            "embedding_batcher": batcher.stats() if batcher is not None else None,
+        }
+
+    async def _with_timeout(
+        self,
+        awaitable,
+        default: Any,
+        label: str,
+        timeout: Optional[float] = None
+    ) -> Any:
+        """等待检索完成，超时后返回默认值（线程中的查询继续执行但结果被丢弃）"""
+        timeout = self.timeout if timeout is None else timeout
+        if timeout <= 0:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"知识库检索超时（{timeout}s），本轮不使用知识库: {label[:50]}")
+            return default
+
+    def _remember(self, results: List[RetrievalResult]) -> None:
+        """缓存检索到的片段"""
+        with self._chunk_lock:
+            for result in results:
+                self._chunks[result.chunk_id] = result
+                self._chunks.move_to_end(result.chunk_id)
+            while len(self._chunks) > self.chunk_cache_size:
+                self._chunks.popitem(last=False)
+
+    def get_chunk(self, chunk_id: str) -> Optional[RetrievalResult]:
+        """
+        按 chunk_id 获取最近检索到的片段
+
+        Args:
+            chunk_id: 片段ID
+
+        Returns:
+            检索结果；不在缓存中时返回 None
+        """
+        with self._chunk_lock:
+            return self._chunks.get(chunk_id)
+
+    def document_id_for(self, file_path: str) -> str:
+        """
+        文件的文档ID：相对知识库根目录的路径（`/` 分隔），根目录之外的文件用绝对路径
+
+        不同目录下的同名文件因此不会互相覆盖。
+        """
+        path = os.path.abspath(file_path)
+        if os.path.commonpath([path, self.knowledge_dir]) == self.knowledge_dir:
+            path = os.path.relpath(path, self.knowledge_dir)
+        return path.replace(os.sep, "/")
+
     def ingest_file(self, file_path: str) -> int:
         """
-        摄入单个文件
-        
+        摄入单个文件：解析、分块并写入向量库
+
         Args:
             file_path: 文件路径
-            
+
         Returns:
             处理的块数量
+
+        Raises:
+            RuntimeError: 未配置向量数据库
+            Exception: 写入向量库失败（旧版本的片段和关键词索引保持不变）
         """
-        logger.info(f"摄入文件（简化版）: {file_path}")
-        return 0
+        store = self.vector_store
+        if store is None:
+            raise RuntimeError("未配置向量数据库（VECTOR_DB_TYPE）")
+
+        documents = self.document_processor.process_document(file_path)["documents"]
+        doc_id = self.document_id_for(file_path)
+        ids = []
+        for position, document in enumerate(documents):
+            # 向量库元数据只保留标量值，并写入文档ID、分块序号和片段ID
+            metadata = {
+                key: value for key, value in document.metadata.items()
+                if isinstance(value, _SCALAR_TYPES)
+            }
+            metadata["doc_id"] = doc_id
+            metadata.setdefault("chunk_index", position)
+            metadata["chunk_id"] = chunk_id_of(metadata)
+            document.metadata = metadata
+            ids.append(metadata["chunk_id"])
+
+        # 片段ID固定为 `文档ID:序号`，先按ID覆盖写入新版本，写入失败时旧版本仍可检索；
+        # 再删除新版本没有的尾部片段（序号 >= 新的块数）
+        if documents:
+            store.add_documents(documents, ids=ids)
+        try:
+            store.delete_documents(filter={"doc_id": doc_id, "chunk_index": {"$gte": len(documents)}})
+        except Exception as e:
+            logger.warning(f"删除旧版本多余片段失败: {doc_id}, {e}")
+
+        index = self.keyword_index
+        if index is not None:
+            index.remove_document(doc_id)
+            index.add(
+                (chunk_id, document.page_content, document.metadata)
+                for chunk_id, document in zip(ids, documents)
+            )
+            index.save()
+        logger.info(f"摄入文件: {file_path}, {len(documents)} 个块")
+        return len(documents)
 
 
 # 便捷函数
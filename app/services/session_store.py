@@ -0,0 +1,852 @@
+"""
+Session Store - 会话存储
+
+会话历史存储，支持多种后端（SESSION_BACKEND）：
+- memory: 进程内存储（单进程部署）。会话总数上限（LRU 淘汰）、空闲超时、
+  单会话消息数和内存占用上限
+- sqlite: SQLite（WAL 模式）文件，同一台机器上的多个 worker 共享
+- redis: Redis，多台机器共享；空闲超时由键过期实现
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.core.config import settings
+from app.core.concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+class MessageRecord:
+    """
+    对话历史中的一条消息
+
+    使用 __slots__ 和数值时间戳减少小对象开销；仅在 API 层序列化为字典。
+    """
+
+    __slots__ = ("role", "content", "metadata", "timestamp")
+
+    def __init__(
+        self,
+        role: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        timestamp: Optional[float] = None
+    ):
+        """
+        Args:
+            role: 角色 (user/assistant)
+            content: 消息内容
+            metadata: 元数据（为空时不保存字典）
+            timestamp: Unix 时间戳（默认当前时间）
+        """
+        self.role = role
+        self.content = content
+        self.metadata = metadata or None
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为 API 返回的格式（ISO 时间）"""
+        return {
+            "role": self.role,
+            "content": self.content,
+            "metadata": self.metadata or {},
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()
+        }
+
+    def pack(self) -> str:
+        """序列化为紧凑的 JSON 数组（用于 SQLite / Redis 存储）"""
+        return json.dumps(
+            [self.role, self.content, self.metadata, self.timestamp], ensure_ascii=False
+        )
+
+    @classmethod
+    def unpack(cls, data: Union[str, bytes]) -> "MessageRecord":
+        """从 pack() 的结果还原"""
+        role, content, metadata, timestamp = json.loads(data)
+        return cls(role, content, metadata, timestamp)
+
+    def __repr__(self) -> str:
+        return f"MessageRecord(role={self.role!r}, content={self.content[:20]!r})"
+
+
+class ConversationSummary:
+    """会话摘要：摘要文本及其覆盖到的最后一条消息的时间戳（与会话历史存放在一起）"""
+
+    __slots__ = ("text", "until", "tokens")
+
+    def __init__(self, text: str, until: float, tokens: int):
+        self.text = text
+        self.until = until
+        self.tokens = tokens
+
+    def pack(self) -> str:
+        """序列化为紧凑的 JSON 数组（用于 SQLite / Redis 存储）"""
+        return json.dumps([self.text, self.until, self.tokens], ensure_ascii=False)
+
+    @classmethod
+    def unpack(cls, data: Union[str, bytes]) -> "ConversationSummary":
+        """从 pack() 的结果还原"""
+        text, until, tokens = json.loads(data)
+        return cls(text, until, tokens)
+
+    def __repr__(self) -> str:
+        return f"ConversationSummary(until={self.until}, tokens={self.tokens})"
+
+
+def message_size(message: MessageRecord) -> int:
+    """估算单条消息占用的字节数（内容 + 元数据）"""
+    size = len(message.content.encode("utf-8"))
+    if message.metadata:
+        size += len(repr(message.metadata).encode("utf-8"))
+    return size
+
+
+class BaseSessionStore:
+    """
+    会话存储基类
+
+    子类实现 iter_messages / extend / populate / clear / __contains__ / count /
+    get_summary / set_summary，需要定期清理的后端再实现 sweep。
+    """
+
+    name: str = "base"
+    # 操作是否涉及 I/O（异步调用方需卸载到线程池）
+    blocking: bool = True
+
+    def __init__(
+        self,
+        max_messages: int = 22,
+        idle_ttl: float = 1800.0,
+        sweep_interval: float = 60.0
+    ):
+        """
+        初始化会话存储
+
+        Args:
+            max_messages: 单会话最大消息数
+            idle_ttl: 会话空闲超时（秒），<= 0 表示不过期
+            sweep_interval: 后台清理间隔（秒），<= 0 表示不启动后台清理
+        """
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper: Optional["asyncio.Task[None]"] = None
+
+    def iter_messages(
+        self,
+        session_id: str,
+        limit: Optional[int] = None
+    ) -> Iterable[MessageRecord]:
+        """
+        按时间顺序遍历会话的最近消息（不存在时为空，不创建会话）
+
+        Args:
+            session_id: 会话ID
+            limit: 只返回最近的若干条
+
+        Returns:
+            消息列表（快照，之后的写入不影响已返回的结果，可跨 await 持有）
+        """
+        raise NotImplementedError
+
+    def extend(self, session_id: str, messages: Sequence[MessageRecord]) -> None:
+        """
+        追加多条消息（超出上限时丢弃最早的消息）
+
+        Args:
+            session_id: 会话ID
+            messages: 消息列表
+        """
+        raise NotImplementedError
+
+    def append(self, session_id: str, message: MessageRecord) -> None:
+        """追加一条消息"""
+        self.extend(session_id, [message])
+
+    def populate(self, session_id: str, messages: Sequence[MessageRecord]) -> None:
+        """
+        用已有消息填充会话（如从数据库加载），会话已存在时不覆盖
+
+        Args:
+            session_id: 会话ID
+            messages: 按时间顺序的消息列表
+        """
+        raise NotImplementedError
+
+    def clear(self, session_id: str) -> bool:
+        """
+        删除会话（含会话摘要）
+
+        Returns:
+            会话是否存在
+        """
+        raise NotImplementedError
+
+    def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
+        """
+        获取会话的滚动摘要
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            会话摘要（不存在时返回 None）
+        """
+        raise NotImplementedError
+
+    def set_summary(self, session_id: str, summary: ConversationSummary) -> bool:
+        """
+        保存会话的滚动摘要（随会话历史一起过期和删除）
+
+        Args:
+            session_id: 会话ID
+            summary: 会话摘要
+
+        Returns:
+            是否保存（会话不存在，或已有覆盖范围相同或更新的摘要时不保存）
+        """
+        raise NotImplementedError
+
+    def __contains__(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """会话数量"""
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """
+        清理空闲超时的会话
+
+        Returns:
+            清理的会话数
+        """
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """存储统计"""
+        return {"backend": self.name, "sessions": self.count()}
+
+    def close(self) -> None:
+        """释放连接"""
+
+    async def start(self) -> None:
+        """启动后台清理任务（需在事件循环中调用）"""
+        if self.sweep_interval <= 0:
+            return
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        """停止后台清理任务并释放连接"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        self.close()
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                if self.blocking:
+                    await run_blocking(self.sweep)
+                else:
+                    self.sweep()
+            except Exception as e:
+                logger.error(f"清理空闲会话失败: {e}")
+
+
+class _Session:
+    """单个会话（定长环形缓冲区，写满后自动丢弃最早的消息）"""
+
+    __slots__ = ("messages", "size", "last_access", "summary")
+
+    def __init__(self, capacity: int):
+        self.messages: Deque[MessageRecord] = deque(maxlen=capacity)
+        self.size = 0
+        self.last_access = time.monotonic()
+        self.summary: Optional[ConversationSummary] = None
+
+
+class MemorySessionStore(BaseSessionStore):
+    """
+    有界内存会话存储（线程安全）
+
+    Example:
+        ```python
+        store = MemorySessionStore(max_sessions=10000, idle_ttl=1800)
+        store.append("user-123", MessageRecord("user", "你好"))
+        list(store.iter_messages("user-123", limit=10))
+        await store.start()
+        ```
+    """
+
+    name = "memory"
+    blocking = False
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        idle_ttl: float = 1800.0,
+        max_messages: int = 22,
+        max_bytes: int = 64 * 1024,
+        sweep_interval: float = 60.0
+    ):
+        """
+        初始化会话存储
+
+        Args:
+            max_sessions: 最大会话数
+            idle_ttl: 会话空闲超时（秒），<= 0 表示不过期
+            max_messages: 单会话最大消息数
+            max_bytes: 单会话最大占用字节数
+            sweep_interval: 后台清理间隔（秒）
+        """
+        super().__init__(max_messages=max_messages, idle_ttl=idle_ttl, sweep_interval=sweep_interval)
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.evicted_lru = 0
+        self.expired_idle = 0
+        self.trimmed_messages = 0
+
+    def iter_messages(
+        self,
+        session_id: str,
+        limit: Optional[int] = None
+    ) -> Tuple[MessageRecord, ...]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return ()
+            if self._is_expired(session, time.monotonic()):
+                self._remove(session_id)
+                self.expired_idle += 1
+                return ()
+            self._touch(session_id, session)
+            messages = session.messages
+            # 在锁内复制为元组（只复制引用，max_history 量级），调用方可跨 await 使用
+            start = max(len(messages) - limit, 0) if limit else 0
+            return tuple(itertools.islice(messages, start, None))
+
+    def extend(self, session_id: str, messages: Sequence[MessageRecord]) -> None:
+        with self._lock:
+            for message in messages:
+                self._append(session_id, message)
+
+    def populate(self, session_id: str, messages: Sequence[MessageRecord]) -> None:
+        with self._lock:
+            if session_id in self._sessions:
+                return
+            for message in messages:
+                self._append(session_id, message)
+
+    def _append(self, session_id: str, message: MessageRecord) -> None:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = _Session(self.max_messages)
+            self._sessions[session_id] = session
+            self._evict_overflow()
+        self._touch(session_id, session)
+
+        messages = session.messages
+        if len(messages) == messages.maxlen:
+            # 缓冲区已满，append 会挤掉最早的一条
+            session.size -= message_size(messages[0])
+            self.trimmed_messages += 1
+        messages.append(message)
+        session.size += message_size(message)
+
+        # 内存上限：丢弃最早的消息（至少保留最新一条）
+        while len(messages) > 1 and session.size > self.max_bytes:
+            session.size -= message_size(messages.popleft())
+            self.trimmed_messages += 1
+
+    def clear(self, session_id: str) -> bool:
+        with self._lock:
+            return self._remove(session_id)
+
+    def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.summary if session is not None else None
+
+    def set_summary(self, session_id: str, summary: ConversationSummary) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or (session.summary is not None and session.summary.until >= summary.until):
+                return False
+            session.summary = summary
+            return True
+
+    def sweep(self) -> int:
+        if self.idle_ttl <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            # 按最近访问排序，最久未访问的在前
+            expired = []
+            for session_id, session in self._sessions.items():
+                if not self._is_expired(session, now):
+                    break
+                expired.append(session_id)
+            for session_id in expired:
+                self._remove(session_id)
+            self.expired_idle += len(expired)
+
+        if expired:
+            logger.info(f"清理空闲会话 {len(expired)} 个")
+        return len(expired)
+
+    def _is_expired(self, session: _Session, now: float) -> bool:
+        return self.idle_ttl > 0 and now - session.last_access > self.idle_ttl
+
+    def _touch(self, session_id: str, session: _Session) -> None:
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(session_id)
+
+    def _remove(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def _evict_overflow(self) -> None:
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted_lru += 1
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "bytes": sum(s.size for s in self._sessions.values()),
+                "evicted_lru": self.evicted_lru,
+                "expired_idle": self.expired_idle,
+                "trimmed_messages": self.trimmed_messages,
+            }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """
+    SQLite 会话存储（WAL 模式，同一台机器的多个 worker 进程共享）
+
+    每个线程使用独立连接；WAL 模式下读写互不阻塞，写入之间由 busy_timeout 排队。
+    """
+
+    name = "sqlite"
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access);
+        CREATE TABLE IF NOT EXISTS session_messages (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            message TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_session_messages ON session_messages(session_id, seq);
+        CREATE TABLE IF NOT EXISTS session_summaries (
+            session_id TEXT PRIMARY KEY,
+            until REAL NOT NULL,
+            summary TEXT NOT NULL
+        );
+    """
+
+    def __init__(
+        self,
+        path: str = "./data/sessions.db",
+        max_sessions: int = 10000,
+        idle_ttl: float = 1800.0,
+        max_messages: int = 22,
+        sweep_interval: float = 60.0,
+        busy_timeout_ms: int = 5000
+    ):
+        """
+        初始化 SQLite 会话存储
+
+        Args:
+            path: 数据库文件路径
+            max_sessions: 最大会话数（清理时淘汰最久未访问的会话）
+            idle_ttl: 会话空闲超时（秒），<= 0 表示不过期
+            max_messages: 单会话最大消息数
+            sweep_interval: 后台清理间隔（秒）
+            busy_timeout_ms: 写锁等待时间（毫秒）
+        """
+        super().__init__(max_messages=max_messages, idle_ttl=idle_ttl, sweep_interval=sweep_interval)
+        self.path = path
+        self.max_sessions = max_sessions
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+        self.evicted_lru = 0
+        self.expired_idle = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _transaction(self, func, *args) -> Any:
+        """在写事务中执行 func(conn, *args)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn, *args)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _cutoff(self, now: float) -> float:
+        """早于该时间最后访问的会话视为过期"""
+        return now - self.idle_ttl if self.idle_ttl > 0 else float("-inf")
+
+    def iter_messages(
+        self,
+        session_id: str,
+        limit: Optional[int] = None
+    ) -> List[MessageRecord]:
+        conn = self._conn()
+        now = time.time()
+        # 更新访问时间，同时判断会话是否存在且未过期
+        cursor = conn.execute(
+            "UPDATE sessions SET last_access = ? WHERE session_id = ? AND last_access >= ?",
+            (now, session_id, self._cutoff(now))
+        )
+        if cursor.rowcount == 0:
+            return []
+        rows = conn.execute(
+            "SELECT message FROM session_messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, limit or -1)
+        ).fetchall()
+        return [MessageRecord.unpack(row[0]) for row in reversed(rows)]
+
+    def extend(self, session_id: str, messages: Sequence[MessageRecord]) -> None:
+        self._transaction(self._write, session_id, messages)
+
+    def populate(self, session_id: str, messages: Sequence[MessageRecord]) -> None:
+        def write_if_absent(conn: sqlite3.Connection) -> None:
+            exists = conn.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if not exists:
+                self._write(conn, session_id, messages)
+
+        self._transaction(write_if_absent)
+
+    def _write(
+        self,
+        conn: sqlite3.Connection,
+        session_id: str,
+        messages: Sequence[MessageRecord]
+    ) -> None:
+        """追加消息并裁剪到 max_messages"""
+        conn.execute(
+            "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+            (session_id, time.time())
+        )
+        conn.executemany(
+            "INSERT INTO session_messages (session_id, message) VALUES (?, ?)",
+            [(session_id, m.pack()) for m in messages]
+        )
+        conn.execute(
+            "DELETE FROM session_messages WHERE session_id = ? AND seq <= ("
+            "SELECT seq FROM session_messages WHERE session_id = ? "
+            "ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+            (session_id, session_id, self.max_messages)
+        )
+
+    def clear(self, session_id: str) -> bool:
+        def delete(conn: sqlite3.Connection) -> bool:
+            conn.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_summaries WHERE session_id = ?", (session_id,))
+            return conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            ).rowcount > 0
+
+        return self._transaction(delete)
+
+    def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
+        row = self._conn().execute(
+            "SELECT summary FROM session_summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return ConversationSummary.unpack(row[0]) if row else None
+
+    def set_summary(self, session_id: str, summary: ConversationSummary) -> bool:
+        # 会话存在且新摘要覆盖范围更大时才写入，比较和写入在同一条语句中完成
+        cursor = self._conn().execute(
+            "INSERT INTO session_summaries (session_id, until, summary) "
+            "SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM sessions WHERE session_id = ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET until = excluded.until, summary = excluded.summary "
+            "WHERE excluded.until > session_summaries.until",
+            (session_id, summary.until, summary.pack(), session_id)
+        )
+        return cursor.rowcount > 0
+
+    def __contains__(self, session_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ? AND last_access >= ?",
+            (session_id, self._cutoff(time.time()))
+        ).fetchone()
+        return row is not None
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def sweep(self) -> int:
+        """清理空闲超时的会话，并按最久未访问淘汰超出 max_sessions 的会话"""
+        cutoff = self._cutoff(time.time())
+
+        def delete_stale(conn: sqlite3.Connection):
+            expired = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ?", (cutoff,)
+            )]
+            remaining = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - len(expired)
+            overflow: List[str] = []
+            if remaining > self.max_sessions:
+                overflow = [row[0] for row in conn.execute(
+                    "SELECT session_id FROM sessions WHERE last_access >= ? "
+                    "ORDER BY last_access LIMIT ?",
+                    (cutoff, remaining - self.max_sessions)
+                )]
+            removed = [(sid,) for sid in expired + overflow]
+            conn.executemany("DELETE FROM session_messages WHERE session_id = ?", removed)
+            conn.executemany("DELETE FROM session_summaries WHERE session_id = ?", removed)
+            conn.executemany("DELETE FROM sessions WHERE session_id = ?", removed)
+            return expired, overflow
+
+        expired, overflow = self._transaction(delete_stale)
+        self.expired_idle += len(expired)
+        self.evicted_lru += len(overflow)
+        if expired or overflow:
+            logger.info(f"清理会话：空闲过期 {len(expired)} 个，超出上限 {len(overflow)} 个")
+        return len(expired) + len(overflow)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "sessions": self.count(),
+            "max_sessions": self.max_sessions,
+            "evicted_lru": self.evicted_lru,
+            "expired_idle": self.expired_idle,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class RedisSessionStore(BaseSessionStore):
+    """
+    Redis 会话存储（多机共享）
+
+    每个会话一个列表键，写入时裁剪到 max_messages，访问时刷新过期时间；会话摘要存放在
+    `summary:<前缀><会话ID>` 字符串键中（不计入会话数），过期时间与列表键相同；
+    会话总数由 Redis 的 maxmemory 淘汰策略控制，无需后台清理。
+    """
+
+    name = "redis"
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "session:",
+        idle_ttl: float = 1800.0,
+        max_messages: int = 22,
+        client: Optional[Any] = None
+    ):
+        """
+        初始化 Redis 会话存储
+
+        Args:
+            url: Redis 连接地址
+            prefix: 键前缀
+            idle_ttl: 会话空闲超时（秒），<= 0 表示不过期
+            max_messages: 单会话最大消息数
+            client: redis.Redis 客户端（默认按 url 创建）
+        """
+        super().__init__(max_messages=max_messages, idle_ttl=idle_ttl, sweep_interval=0)
+        self.url = url
+        self.prefix = prefix
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        """redis 客户端（首次访问时创建）"""
+        if self._client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("SESSION_BACKEND=redis 需要安装 redis: pip install redis") from e
+            self._client = redis.Redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def _summary_key(self, session_id: str) -> str:
+        return f"summary:{self.prefix}{session_id}"
+
+    def iter_messages(
+        self,
+        session_id: str,
+        limit: Optional[int] = None
+    ) -> List[MessageRecord]:
+        key = self._key(session_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lrange(key, -limit if limit else 0, -1)
+        if self.idle_ttl > 0:
+            pipe.expire(key, int(self.idle_ttl))
+        items = pipe.execute()[0]
+        return [MessageRecord.unpack(item) for item in items]
+
+    def extend(self, session_id: str, messages: Sequence[MessageRecord]) -> None:
+        if not messages:
+            return
+        key = self._key(session_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(key, *[m.pack() for m in messages])
+        pipe.ltrim(key, -self.max_messages, -1)
+        if self.idle_ttl > 0:
+            pipe.expire(key, int(self.idle_ttl))
+        pipe.execute()
+
+    def populate(self, session_id: str, messages: Sequence[MessageRecord]) -> None:
+        if session_id not in self:
+            self.extend(session_id, messages)
+
+    def clear(self, session_id: str) -> bool:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(self._key(session_id))
+        pipe.delete(self._summary_key(session_id))
+        return bool(pipe.execute()[0])
+
+    def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
+        key = self._summary_key(session_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(key)
+        if self.idle_ttl > 0:
+            pipe.expire(key, int(self.idle_ttl))
+        data = pipe.execute()[0]
+        return ConversationSummary.unpack(data) if data else None
+
+    def set_summary(self, session_id: str, summary: ConversationSummary) -> bool:
+        # 比较和写入不是原子操作：同一会话的压缩在进程内串行，跨进程同时压缩时以后写入的为准
+        if session_id not in self:
+            return False
+        current = self.get_summary(session_id)
+        if current is not None and current.until >= summary.until:
+            return False
+        self.client.set(
+            self._summary_key(session_id), summary.pack(),
+            ex=int(self.idle_ttl) if self.idle_ttl > 0 else None
+        )
+        return True
+
+    def __contains__(self, session_id: str) -> bool:
+        return bool(self.client.exists(self._key(session_id)))
+
+    def count(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}*", count=1000))
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+
+
+# 后端名称 -> 存储类
+SESSION_STORES = {
+    "memory": MemorySessionStore,
+    "sqlite": SQLiteSessionStore,
+    "redis": RedisSessionStore,
+}
+
+
+def create_session_store(backend: Optional[str] = None, **kwargs) -> BaseSessionStore:
+    """
+    按配置创建会话存储
+
+    Args:
+        backend: 后端名称（默认使用配置 SESSION_BACKEND）
+        **kwargs: 覆盖默认参数（如 max_messages）
+
+    Returns:
+        BaseSessionStore: 会话存储
+
+    Raises:
+        ValueError: 未知的后端
+    """
+    backend = backend or settings.SESSION_BACKEND
+    if backend == "memory":
+        options = {
+            "max_sessions": settings.SESSION_MAX_COUNT,
+            "idle_ttl": settings.SESSION_IDLE_TTL,
+            "max_bytes": settings.SESSION_MAX_BYTES,
+            "sweep_interval": settings.SESSION_SWEEP_INTERVAL,
+        }
+    elif backend == "sqlite":
+        options = {
+            "path": settings.SESSION_SQLITE_PATH,
+            "max_sessions": settings.SESSION_MAX_COUNT,
+            "idle_ttl": settings.SESSION_IDLE_TTL,
+            "sweep_interval": settings.SESSION_SWEEP_INTERVAL,
+        }
+    elif backend == "redis":
+        options = {
+            "url": settings.REDIS_URL,
+            "prefix": settings.SESSION_REDIS_PREFIX,
+            "idle_ttl": settings.SESSION_IDLE_TTL,
+        }
+    else:
+        raise ValueError(f"未知的会话存储后端: {backend}")
+
+    options.update(kwargs)
+    logger.info(f"会话存储后端: {backend}")
+    return SESSION_STORES[backend](**options)
@@ -0,0 +1,89 @@
+"""
+Text Features - 字符 n-gram 哈希特征
+
+不依赖外部模型的文本向量化：
+- 文本规范化（小写、去除空白和标点）
+- 字符 n-gram 哈希到固定维度（crc32，跨进程稳定）
+- HashingEmbeddings：与 LangChain Embeddings 相同的接口，未配置向量模型时作为兜底
+"""
+
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+_PUNCTUATION_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：小写、去除空白和标点"""
+    return _PUNCTUATION_PATTERN.sub("", text.lower())
+
+
+def hashed_ngrams(
+    text: str,
+    dim: int,
+    ngram_range: Tuple[int, int] = (1, 3)
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    提取字符 n-gram 哈希特征（稀疏表示）
+
+    规范化后的文本首尾加上边界符，n >= 2 的 n-gram 可以区分词首词尾。
+
+    Args:
+        text: 文本
+        dim: 哈希维度
+        ngram_range: n-gram 的最小/最大长度
+
+    Returns:
+        (特征下标, L2 归一化后的取值)
+    """
+    padded = f"^{normalize_text(text)}$"
+    low, high = ngram_range
+    counts: Dict[int, float] = {}
+    for n in range(low, high + 1):
+        for i in range(len(padded) - n + 1):
+            gram = padded[i:i + n]
+            if n == 1 and gram in "^$":
+                continue
+            index = zlib.crc32(gram.encode("utf-8")) % dim
+            counts[index] = counts.get(index, 0.0) + 1.0
+
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    norm = np.linalg.norm(values)
+    if norm > 0:
+        values /= norm
+    return indices, values
+
+
+class HashingEmbeddings:
+    """
+    字符 n-gram 哈希向量（单位向量，点积即余弦相似度）
+
+    只能识别字面相近的文本，不理解语义；配置了向量模型时应优先使用向量模型。
+    """
+
+    def __init__(self, dim: int = 4096, ngram_range: Tuple[int, int] = (1, 3)):
+        """
+        Args:
+            dim: 向量维度
+            ngram_range: n-gram 的最小/最大长度
+        """
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def embed_query(self, text: str) -> List[float]:
+        """向量化单条文本"""
+        return self._embed(text).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量向量化"""
+        return [self._embed(text).tolist() for text in texts]
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        indices, values = hashed_ngrams(text, self.dim, self.ngram_range)
+        np.add.at(vector, indices, values)
+        return vector
@@ -0,0 +1,232 @@
+"""
+Tokenizer - Token 计数
+
+基于 BPE 分词器（tiktoken）的 token 计数：
+- 分词器首次使用时才加载；应用启动时在线程池中预加载（`warm_up`），
+  避免首个请求在事件循环中加载编码表（可能需要下载）
+- 按字符串缓存计数结果（LRU）
+- 提供批量计数接口，未命中的文本一次性批量编码
+- 未安装 tiktoken 或编码表加载失败时，降级为按中/英文分别估算
+"""
+
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# CJK 统一表意文字、扩展 A、兼容表意文字及全角标点
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+# OpenAI 对话格式每条消息的额外开销（role、分隔符）及回复引导
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算 token 数量（无分词器时使用）
+
+    中文等 CJK 字符约 1 字 1 token，其余字符约 4 字符 1 token。
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class Tokenizer:
+    """
+    带缓存的 token 计数器
+
+    Example:
+        ```python
+        tokenizer = get_tokenizer()
+        tokenizer.count("你们的退款政策是什么？")
+        tokenizer.count_batch(["你好", "How much is the Pro plan?"])
+        ```
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base", cache_size: int = 8192):
+        """
+        初始化计数器
+
+        Args:
+            encoding_name: tiktoken 编码名称
+            cache_size: 计数缓存的最大条目数
+        """
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self._encoding: Any = None
+        self._loaded = False
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self) -> Optional[Any]:
+        """BPE 编码器（首次访问时加载，不可用时为 None）"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._encoding = self._load_encoding()
+                    self._loaded = True
+        return self._encoding
+
+    def warm_up(self) -> bool:
+        """
+        预加载编码表（同步，应在线程池中调用）
+
+        Returns:
+            是否可用 BPE 分词器（False 表示按字符估算）
+        """
+        return self.encoding is not None
+
+    def _load_encoding(self) -> Optional[Any]:
+        try:
+            import tiktoken
+        except ImportError:
+            logger.warning("未安装 tiktoken，token 数按字符估算")
+            return None
+        try:
+            encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logger.warning(f"加载分词器 {self.encoding_name} 失败，token 数按字符估算: {e}")
+            return None
+        logger.info(f"分词器已加载: {self.encoding_name}")
+        return encoding
+
+    def _cache_get(self, text: str) -> Optional[int]:
+        with self._lock:
+            count = self._cache.get(text)
+            if count is not None:
+                self._cache.move_to_end(text)
+            return count
+
+    def _cache_put(self, text: str, count: int) -> None:
+        with self._lock:
+            self._cache[text] = count
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        """
+        计算 token 数量
+
+        Args:
+            text: 文本
+
+        Returns:
+            token 数
+        """
+        if not text:
+            return 0
+        cached = self._cache_get(text)
+        if cached is not None:
+            return cached
+
+        encoding = self.encoding
+        count = len(encoding.encode_ordinary(text)) if encoding else estimate_tokens(text)
+        self._cache_put(text, count)
+        return count
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        """
+        批量计算 token 数量
+
+        已缓存的直接返回，其余文本一次性批量编码（tiktoken 内部多线程）。
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            与输入一一对应的 token 数
+        """
+        counts: List[Optional[int]] = [self._cache_get(t) if t else 0 for t in texts]
+        missing: Dict[str, List[int]] = {}
+        for i, count in enumerate(counts):
+            if count is None:
+                missing.setdefault(texts[i], []).append(i)
+
+        if missing:
+            pending = list(missing)
+            encoding = self.encoding
+            if encoding:
+                computed = [len(tokens) for tokens in encoding.encode_ordinary_batch(pending)]
+            else:
+                computed = [estimate_tokens(t) for t in pending]
+            for text, count in zip(pending, computed):
+                self._cache_put(text, count)
+                for i in missing[text]:
+                    counts[i] = count
+
+        return counts  # type: ignore[return-value]
+
+    def count_messages(self, messages: Sequence[Dict[str, str]]) -> int:
+        """
+        计算对话消息列表的 token 数（含每条消息的格式开销）
+
+        Args:
+            messages: OpenAI 格式的消息列表
+
+        Returns:
+            token 数
+        """
+        contents = [m.get("content", "") for m in messages]
+        return (
+            sum(self.count_batch(contents))
+            + TOKENS_PER_MESSAGE * len(messages)
+            + TOKENS_PER_REPLY
+        )
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        截断文本到不超过 max_tokens 个 token
+
+        Args:
+            text: 文本
+            max_tokens: 最大 token 数
+
+        Returns:
+            截断后的文本
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        encoding = self.encoding
+        if encoding:
+            return encoding.decode(encoding.encode_ordinary(text)[:max_tokens])
+
+        # 无分词器：二分查找满足预算的最长前缀
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if estimate_tokens(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+
+_tokenizer: Optional[Tokenizer] = None
+
+
+def get_tokenizer() -> Tokenizer:
+    """获取全局 token 计数器"""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = Tokenizer(settings.TOKENIZER_ENCODING)
+    return _tokenizer
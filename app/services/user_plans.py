@@ -0,0 +1,82 @@
+"""
+User Plans - 用户套餐查询
+
+LLM 并发限制按用户套餐（UserModel.plan）决定排队优先级。套餐按 user_id 从数据库读取，
+结果（包括查不到的用户）在进程内缓存一段时间；查询失败时按免费版处理，不影响对话。
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.database import get_session_factory
+from app.models.database import UserModel
+
+logger = logging.getLogger(__name__)
+
+
+class UserPlanCache:
+    """
+    带 TTL 的用户套餐缓存
+
+    Example:
+        ```python
+        plans = UserPlanCache()
+        plan = await plans.get("user-123")  # "pro"；未知用户返回 None
+        ```
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[async_sessionmaker] = None,
+        ttl: float = 60.0,
+        max_size: int = 10000
+    ):
+        """
+        初始化套餐缓存
+
+        Args:
+            session_factory: 异步会话工厂（默认使用全局数据库引擎）
+            ttl: 缓存时间（秒），套餐变更最迟在该时间后生效
+            max_size: 最大缓存用户数
+        """
+        self._session_factory = session_factory
+        self.ttl = ttl
+        self.max_size = max_size
+        # user_id -> (套餐, 过期时间)
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+
+    async def get(self, user_id: Optional[str]) -> Optional[str]:
+        """
+        获取用户套餐
+
+        Args:
+            user_id: 用户ID（为空时不查询）
+
+        Returns:
+            套餐名称；匿名、未知用户或查询失败时返回 None（按免费版排队）
+        """
+        if not user_id:
+            return None
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        try:
+            factory = self._session_factory or get_session_factory()
+            async with factory() as session:
+                plan = await session.scalar(select(UserModel.plan).where(UserModel.id == user_id))
+        except Exception as e:
+            logger.warning(f"查询用户套餐失败: {user_id}, {e}")
+            plan = None
+
+        self._entries[user_id] = (plan, now + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return plan
@@ -0,0 +1,197 @@
+"""
+Vector Quantization - 向量量化
+
+嵌入式向量索引的压缩编码，检索时直接在编码上计算近似相似度：
+- Int8Quantizer：逐维度的标量量化（每维一个 scale / offset），占用为 float32 的 1/4
+- ProductQuantizer：乘积量化，向量切成 m 个子空间，每个子空间用 256 个中心编码为 1 字节；
+  检索时先算查询到各子空间中心的内积表（非对称距离，ADC），再按编码查表求和
+
+近似分数只用于选出候选，最终按原始向量精确重排。
+"""
+
+import logging
+import math
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 编码按块转换和查表，块大小控制在 CPU 缓存内（块太大时转换后的临时数组反而更慢）
+_BLOCK_ROWS = 4096
+
+
+class Int8Quantizer:
+    """
+    逐维度 int8 标量量化
+
+    x ≈ offset + scale * (code + 128)，内积可以拆成与编码无关的常数项和编码的线性项。
+    """
+
+    kind = "int8"
+
+    def __init__(self):
+        self.offset: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    def fit(self, matrix: np.ndarray) -> "Int8Quantizer":
+        """按每维的最小/最大值确定量化区间"""
+        low = matrix.min(axis=0)
+        high = matrix.max(axis=0)
+        self.offset = low.astype(np.float32)
+        self.scale = np.maximum((high - low) / 255.0, 1e-12).astype(np.float32)
+        return self
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        """编码为 int8（区间外的值截断）"""
+        codes = np.rint((matrix - self.offset) / self.scale) - 128.0
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """解码为近似向量"""
+        return self.offset + self.scale * (codes.astype(np.float32) + 128.0)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """近似内积"""
+        weights = query * self.scale
+        constant = float(query @ self.offset + 128.0 * weights.sum())
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ weights
+        return out + constant
+
+    def code_size(self, dim: int) -> int:
+        """每条向量的编码字节数"""
+        return dim
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"offset": self.offset, "scale": self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> "Int8Quantizer":
+        self.offset, self.scale = state["offset"], state["scale"]
+        return self
+
+
+class ProductQuantizer:
+    """
+    乘积量化（每个子空间 256 个中心，编码为 uint8）
+
+    维度不能整除子空间数时补零。
+    """
+
+    kind = "pq"
+
+    def __init__(self, subspaces: int, iterations: int = 10, seed: int = 0):
+        """
+        Args:
+            subspaces: 子空间数 m（每条向量编码为 m 字节）
+            iterations: 每个子空间 k-means 的迭代次数
+            seed: 随机种子
+        """
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.seed = seed
+        # (m, 256, 子空间维度)
+        self.codebooks: Optional[np.ndarray] = None
+
+    def _split(self, matrix: np.ndarray) -> np.ndarray:
+        """(n, dim) -> (m, n, 子空间维度)，每个子空间连续存放，不足的维度补零"""
+        sub_dim = math.ceil(matrix.shape[1] / self.subspaces)
+        padding = sub_dim * self.subspaces - matrix.shape[1]
+        if padding:
+            matrix = np.pad(matrix, ((0, 0), (0, padding)))
+        parts = matrix.reshape(len(matrix), self.subspaces, sub_dim)
+        return np.ascontiguousarray(parts.transpose(1, 0, 2))
+
+    def fit(self, matrix: np.ndarray) -> "ProductQuantizer":
+        """各子空间分别做 k-means"""
+        parts = self._split(matrix.astype(np.float32))
+        rng = np.random.default_rng(self.seed)
+        clusters = min(256, len(matrix))
+        codebooks = np.zeros((self.subspaces, 256, parts.shape[2]), dtype=np.float32)
+        for j in range(self.subspaces):
+            sub = parts[j]
+            centers = sub[rng.choice(len(sub), clusters, replace=False)].copy()
+            for _ in range(self.iterations):
+                assign = self._nearest(sub, centers)
+                counts = np.bincount(assign, minlength=clusters)
+                sums = np.stack([
+                    np.bincount(assign, weights=sub[:, d], minlength=clusters)
+                    for d in range(sub.shape[1])
+                ], axis=1)
+                filled = counts > 0
+                # 空簇保留原中心
+                centers[filled] = sums[filled] / counts[filled, None]
+            codebooks[j, :clusters] = centers
+            if clusters < 256:
+                # 训练数据不足 256 条时，其余中心复制第一个中心
+                codebooks[j, clusters:] = centers[0]
+        self.codebooks = codebooks
+        return self
+
+    @staticmethod
+    def _nearest(sub: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        """最近中心（欧氏距离；|x|² 对所有中心相同，比较时省略）"""
+        distances = sub @ (-2.0 * centers).T
+        distances += (centers * centers).sum(axis=1)
+        return distances.argmin(axis=1)
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        """编码为 (n, m) uint8"""
+        parts = self._split(matrix.astype(np.float32))
+        codes = np.empty((len(matrix), self.subspaces), dtype=np.uint8)
+        for j in range(self.subspaces):
+            codes[:, j] = self._nearest(parts[j], self.codebooks[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """解码为近似向量（含补零的维度）"""
+        parts = self.codebooks[np.arange(self.subspaces), codes]
+        return parts.reshape(len(codes), -1)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """非对称距离：查询与各子空间中心的内积表，按编码查表求和"""
+        query_parts = self._split(query.reshape(1, -1).astype(np.float32))[:, 0, :]
+        table = np.einsum("md,mkd->mk", query_parts, self.codebooks)
+        flat = table.ravel()
+        offsets = (np.arange(self.subspaces) * 256).astype(np.int64)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            out[start:start + len(block)] = flat[block.astype(np.int64) + offsets].sum(axis=1)
+        return out
+
+    def code_size(self, dim: int) -> int:
+        """每条向量的编码字节数"""
+        return self.subspaces
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> "ProductQuantizer":
+        self.codebooks = state["codebooks"]
+        self.subspaces = self.codebooks.shape[0]
+        return self
+
+
+def create_quantizer(kind: str, dim: int, subspaces: int = 0):
+    """
+    创建量化器
+
+    Args:
+        kind: int8 / pq
+        dim: 向量维度
+        subspaces: PQ 子空间数（0 表示 dim / 4，即 float32 的 1/16）
+
+    Returns:
+        量化器
+
+    Raises:
+        ValueError: 不支持的量化方式
+    """
+    if kind == "int8":
+        return Int8Quantizer()
+    if kind == "pq":
+        return ProductQuantizer(subspaces or max(dim // 4, 1))
+    raise ValueError(f"不支持的量化方式: {kind}")
@@ -1,20 +1,23 @@
 """
 向量存储服务模块
-封装 Milvus/Chroma 操作，提供文档存储和相似度搜索功能
+封装 Milvus/Chroma/嵌入式 NumPy 索引操作，提供文档存储和相似度搜索功能
 """
+import json
 import logging
 from typing import List, Optional, Dict, Any
+import os
 from pathlib import Path
 
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
-from langchain_milvus import Milvus as LangChainMilvus
-from langchain_chroma import Chroma as LangChainChroma
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# 过滤条件中的比较运算对应的 Milvus 表达式
+_MILVUS_OPERATORS = {"$eq": "==", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
 
 class VectorStoreService:
     """向量存储服务类"""
@@ -27,22 +30,25 @@ class VectorStoreService:
             embedding_model: 嵌入模型实例
         """
         self.embedding_model = embedding_model
-        self._client: Optional[LangChainMilvus | LangChainChroma] = None
-        self._collection_name = settings.VECTOR_COLLECTION_NAME
+        self._client: Optional[Any] = None
+        self._collection_name = (
+            settings.VECTOR_DB_TYPE == "milvus" and settings.MILVUS_COLLECTION_NAME
+        ) or settings.VECTOR_COLLECTION_NAME
     
-    def _get_client(self) -> LangChainMilvus | LangChainChroma:
-        """获取向量存储客户端"""
+    def _get_client(self) -> Any:
+        """获取向量存储客户端（各后端的依赖按需导入）"""
         if self._client is not None:
             return self._client
         
         vector_db_type = settings.VECTOR_DB_TYPE
         
         if vector_db_type == "milvus":
+            from langchain_milvus import Milvus as LangChainMilvus
             self._client = LangChainMilvus(
                 embedding_function=self.embedding_model,
                 collection_name=self._collection_name,
                 connection_args={
-                    "uri": settings.MILVUS_URI,
+                    "uri": settings.MILVUS_URI or f"http://{settings.MILVUS_HOST}:{settings.MILVUS_PORT}",
                     "token": settings.MILVUS_TOKEN,
                 },
                 index_params={
@@ -53,11 +59,26 @@ class VectorStoreService:
                 search_params={"params": {"nprobe": 10}},
             )
         elif vector_db_type == "chroma":
+            from langchain_chroma import Chroma as LangChainChroma
             self._client = LangChainChroma(
                 embedding_function=self.embedding_model,
                 collection_name=self._collection_name,
                 persist_directory=str(settings.CHROMA_PERSIST_DIR),
             )
+        elif vector_db_type == "numpy":
+            from app.services.numpy_vector_store import NumpyVectorIndex, NumpyVectorStore
+            self._client = NumpyVectorStore(
+                embedding_function=self.embedding_model,
+                index=NumpyVectorIndex(
+                    directory=os.path.join(settings.NUMPY_VECTOR_DIR, self._collection_name),
+                    dtype=settings.NUMPY_VECTOR_DTYPE,
+                    nlist=settings.NUMPY_VECTOR_NLIST,
+                    nprobe=settings.NUMPY_VECTOR_NPROBE,
+                    quantization=settings.NUMPY_VECTOR_QUANTIZATION,
+                    pq_subspaces=settings.NUMPY_VECTOR_PQ_SUBSPACES,
+                    rerank=settings.NUMPY_VECTOR_RERANK,
+                ),
+            )
         else:
             raise ValueError(f"Unsupported vector database type: {vector_db_type}")
         
@@ -156,6 +177,64 @@ class VectorStoreService:
             logger.error(f"Failed to perform similarity search with score: {e}")
             raise
     
+    def similarity_search_with_score_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[List[tuple[Document, float]]]:
+        """
+        批量相似度搜索：一次向量化全部查询，再逐个按向量检索
+        
+        后端不支持按向量检索时退化为逐个调用 similarity_search_with_score。
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回的结果数量
+            filter: 可选的过滤条件
+            
+        Returns:
+            与 queries 一一对应的 (文档, 相似度分数) 列表
+        """
+        client = self._get_client()
+        search = self._relevance_search_by_vector(client)
+        if search is None:
+            return [self.similarity_search_with_score(query, top_k, filter) for query in queries]
+        
+        try:
+            embed = getattr(self.embedding_model, "embed_queries", self.embedding_model.embed_documents)
+            vectors = embed(list(queries))
+            results = [search(vector, top_k, filter) for vector in vectors]
+            logger.info(f"Batch similarity search: {len(queries)} queries")
+            return results
+        except Exception as e:
+            logger.error(f"Failed to perform batch similarity search: {e}")
+            raise
+    
+    @staticmethod
+    def _relevance_search_by_vector(client: Any) -> Optional[Any]:
+        """按向量检索并返回相关度分数（0-1）的函数；后端不支持时返回 None"""
+        if hasattr(client, "similarity_search_with_relevance_scores_by_vector"):
+            return lambda vector, k, filter: client.similarity_search_with_relevance_scores_by_vector(
+                vector, k=k, filter=filter
+            )
+        # Milvus / Chroma 按向量检索返回的是原始距离，需换算为相关度
+        by_vector = getattr(client, "similarity_search_with_score_by_vector", None) or getattr(
+            client, "similarity_search_by_vector_with_relevance_scores", None
+        )
+        if by_vector is None:
+            return None
+        try:
+            relevance = client._select_relevance_score_fn()
+        except NotImplementedError:
+            return None
+        
+        def search(vector: List[float], k: int, filter: Optional[Dict[str, Any]]) -> List[tuple]:
+            kwargs = {"filter": filter} if filter is not None else {}
+            return [(document, relevance(score)) for document, score in by_vector(vector, k=k, **kwargs)]
+        
+        return search
+    
     def delete_collection(self) -> bool:
         """
         删除整个向量集合
@@ -202,7 +281,7 @@ class VectorStoreService:
             if ids is not None:
                 client.delete(ids=ids, **kwargs)
             elif filter is not None:
-                client.delete(filter=filter, **kwargs)
+                client.delete(**self._filter_kwargs(filter), **kwargs)
             else:
                 raise ValueError("Either ids or filter must be provided")
             
@@ -212,6 +291,26 @@ class VectorStoreService:
             logger.error(f"Failed to delete documents: {e}")
             raise
     
+    @staticmethod
+    def _filter_kwargs(filter: Dict[str, Any]) -> Dict[str, Any]:
+        """将元数据过滤条件（等值或 {"$gte": 值} 形式的比较）转换为各后端 delete 的参数"""
+        vector_db_type = settings.VECTOR_DB_TYPE
+        if vector_db_type == "milvus":
+            clauses = []
+            for key, condition in filter.items():
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                clauses.extend(
+                    f"{key} {_MILVUS_OPERATORS[name]} {json.dumps(value, ensure_ascii=False)}"
+                    for name, value in condition.items()
+                )
+            return {"expr": " and ".join(clauses)}
+        if vector_db_type == "chroma":
+            if len(filter) == 1:
+                return {"where": dict(filter)}
+            return {"where": {"$and": [{key: value} for key, value in filter.items()]}}
+        return {"filter": filter}
+    
     def get_collection_info(self) -> Dict[str, Any]:
         """
         获取集合信息
@@ -223,7 +322,10 @@ class VectorStoreService:
             client = self._get_client()
             
             # 获取文档数量
-            count = len(client.get())
+            if hasattr(client, "count"):
+                count = client.count()
+            else:
+                count = len(client.get()["ids"])
             
             return {
                 "collection_name": self._collection_name,
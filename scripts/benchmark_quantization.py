@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Quantization Benchmark - 向量量化基准测试
+
+对比嵌入式向量索引在 float32 / int8 / PQ 存储下的每条向量字节数、检索耗时和
+recall@k（以 float32 全量扫描的结果为准），量化方式分别给出不重排和精确重排的结果。
+
+用法:
+    python scripts/benchmark_quantization.py --rows 50000 --dim 768 --k 10
+    python scripts/benchmark_quantization.py --vectors embeddings.npy --queries 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.numpy_vector_store import NumpyVectorIndex
+
+
+def synthetic_vectors(rows: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """生成带簇结构的随机向量（接近真实向量的分布，比纯高斯噪声更难量化）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    return centers[labels] + 0.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+
+
+def build_index(vectors: np.ndarray, quantization: str, rerank: int, pq_subspaces: int) -> NumpyVectorIndex:
+    """构建内存索引（量化器在全部数据写入后训练）"""
+    index = NumpyVectorIndex(
+        quantization=quantization,
+        pq_subspaces=pq_subspaces,
+        rerank=rerank,
+        quantize_min_rows=len(vectors) + 1,
+    )
+    ids = [str(i) for i in range(len(vectors))]
+    index.add(ids, vectors, [""] * len(vectors))
+    if quantization != "none":
+        index.train_quantizer()
+    return index
+
+
+def run(index: NumpyVectorIndex, queries: np.ndarray, truth: list, k: int):
+    """返回 (recall@k, 每次检索毫秒数)"""
+    hits = 0
+    start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        found = {int(result[0]) for result in index.search(query, k=k)}
+        hits += len(found & expected)
+    elapsed = (time.perf_counter() - start) / len(queries) * 1000
+    return hits / (k * len(queries)), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量量化基准测试")
+    parser.add_argument("--vectors", help="向量文件（.npy，形状为 行数 x 维度），默认生成随机数据")
+    parser.add_argument("--rows", type=int, default=20000, help="随机数据行数")
+    parser.add_argument("--dim", type=int, default=384, help="随机数据维度")
+    parser.add_argument("--queries", type=int, default=100, help="查询数")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的 k")
+    parser.add_argument("--rerank", type=int, default=10, help="重排候选倍数")
+    parser.add_argument("--pq-subspaces", type=int, default=0, help="PQ 子空间数（0 表示维度 / 4）")
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.rows, args.dim)
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), args.queries, replace=False)
+    queries = vectors[picks] + 0.3 * rng.standard_normal((args.queries, vectors.shape[1])).astype(np.float32)
+
+    print(f"数据: {len(vectors)} 条 x {vectors.shape[1]} 维, 查询 {args.queries} 条, k={args.k}")
+    baseline = build_index(vectors, "none", 1, 0)
+    truth = [{int(result[0]) for result in baseline.search(q, k=args.k)} for q in queries]
+    _, baseline_ms = run(baseline, queries, truth, args.k)
+
+    print(f"{'存储':<16}{'字节/条':>10}{'压缩比':>8}{'recall@k':>10}{'毫秒/次':>10}")
+    full_bytes = vectors.shape[1] * 4
+    print(f"{'float32':<16}{full_bytes:>10}{1.0:>8.1f}{1.0:>10.3f}{baseline_ms:>10.2f}")
+    for quantization in ("int8", "pq"):
+        index = build_index(vectors, quantization, 1, args.pq_subspaces)
+        code_bytes = index.info()["code_bytes"]
+        for rerank in (1, args.rerank):
+            index.rerank = rerank
+            recall, ms = run(index, queries, truth, args.k)
+            label = f"{quantization}" + (f"+rerank{rerank}" if rerank > 1 else "")
+            print(f"{label:<16}{code_bytes:>10}{full_bytes / code_bytes:>8.1f}{recall:>10.3f}{ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
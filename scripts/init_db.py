@@ -7,7 +7,7 @@ import sys
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
-from app.models.database import Base, create_tables
+from app.core.database import init_db
 
 # 添加父目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -25,9 +25,8 @@ async def init_database():
     # 创建引擎
     engine = create_async_engine(db_url, echo=settings.DEBUG)
     
-    # 创建表
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # 创建表，并补齐旧版本数据库的表结构
+    await init_db(engine)
     
     # 关闭引擎
     await engine.dispose()
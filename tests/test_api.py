@@ -2,9 +2,21 @@
 API Tests - API 接口测试
 """
 
+import asyncio
+import json
+import time
+
+import httpx
 import pytest
+from fastapi import WebSocketDisconnect
 from fastapi.testclient import TestClient
+from app.api.chat import get_chat_service_instance, get_user_plans
+from app.core.config import settings
 from app.main import app
+from app.services.chat_service import ChatService
+from app.services.llm_limiter import LimiterOverloadedError
+from app.services.llm_service import LLMService
+from app.services.rag_service import RAGService
 
 client = TestClient(app)
 
@@ -26,6 +38,23 @@ class TestHealthAPI:
         assert response.status_code == 200
         data = response.json()
         assert data["ready"] == True
+    
+    def test_metrics(self):
+        """测试运行统计汇总 LLM 缓存、请求合并、并发限制和会话存储"""
+        service = ChatService(llm_service=LLMService(), rag_service=RAGService())
+        app.dependency_overrides[get_chat_service_instance] = lambda: service
+        try:
+            response = client.get("/api/v1/metrics")
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data["llm"]) == {"provider", "cache", "coalesce", "limiter", "router"}
+        assert data["llm"]["coalesce"]["requests"]["leaders"] == 0
+        assert data["llm"]["router"] is None
+        assert data["rag"]["embedding_batcher"] is None
+        assert data["sessions"]["sessions"] == 0
 
 
 class TestChatAPI:
@@ -71,6 +100,52 @@ class TestChatAPI:
         data = response.json()
         assert data["status"] == "cleared"
     
+    def test_chat_stream(self):
+        """测试流式对话"""
+        session_id = "test-session-stream"
+        response = client.post(
+            "/api/v1/chat",
+            json={"message": "你好", "session_id": session_id, "stream": True}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            json.loads(line[len("data: "):])
+            for line in response.text.splitlines()
+            if line.startswith("data: ")
+        ]
+        assert events[0]["type"] == "delta"
+        assert events[-1]["type"] == "done"
+        assert events[-1]["session_id"] == session_id
+        assert "".join(e["content"] for e in events if e["type"] == "delta") == events[-1]["response"]
+
+        history = client.get(f"/api/v1/history/{session_id}").json()
+        assert history["message_count"] == 2
+
+    def test_chat_batch(self):
+        """测试批量对话（NDJSON 按完成顺序返回）"""
+        response = client.post(
+            "/api/v1/chat/batch",
+            json={"items": [
+                {"message": "第一个问题", "session_id": "test-batch"},
+                {"message": "第二个问题", "session_id": "test-batch"},
+                {"message": "你好", "use_rag": False},
+            ]}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(r["index"] for r in results) == [0, 1, 2]
+        assert all("response" in r for r in results)
+
+        history = client.get("/api/v1/history/test-batch").json()
+        assert [m["content"] for m in history["messages"][::2]] == ["第一个问题", "第二个问题"]
+
+    def test_chat_batch_empty(self):
+        """测试空的批量请求"""
+        response = client.post("/api/v1/chat/batch", json={"items": []})
+        assert response.status_code == 422
+
     def test_chat_empty_message(self):
         """测试空消息"""
         response = client.post(
@@ -81,6 +156,185 @@ class TestChatAPI:
         assert response.status_code in [200, 422]
 
 
+class SlowStreamLLM:
+    """逐字慢速输出的流式 LLM 后端"""
+
+    async def agenerate(self, messages, plan=None):
+        return "".join([chunk async for chunk in self.astream(messages, plan)])
+
+    async def astream(self, messages, plan=None):
+        for char in f"回复: {messages[-1]['content']}":
+            await asyncio.sleep(0.05)
+            yield char
+
+
+class OverloadedLLM:
+    """并发限制器已满、拒绝所有调用的 LLM 后端"""
+
+    async def agenerate(self, messages, plan=None):
+        raise LimiterOverloadedError("LLM 调用排队已满")
+
+    async def astream(self, messages, plan=None):
+        raise LimiterOverloadedError("LLM 调用排队已满")
+        yield
+
+
+class TestOverload:
+    """上游过载测试"""
+
+    @pytest.fixture(autouse=True)
+    def overloaded_service(self):
+        service = ChatService(llm_service=OverloadedLLM(), rag_service=RAGService())
+        app.dependency_overrides[get_chat_service_instance] = lambda: service
+        yield service
+        app.dependency_overrides.clear()
+
+    @pytest.mark.parametrize("stream", [False, True])
+    def test_shed_request_returns_503_without_history(self, overloaded_service, stream):
+        """测试过载拒绝返回 503 和 Retry-After，不写入对话历史"""
+        response = client.post(
+            "/api/v1/chat",
+            json={"message": "怎么退款", "session_id": "shed", "use_rag": False, "stream": stream}
+        )
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == str(settings.LLM_OVERLOAD_RETRY_AFTER)
+        assert overloaded_service.get_history("shed") == []
+
+
+class RecordingPlans:
+    """记录查询了哪些用户套餐"""
+
+    def __init__(self):
+        self.lookups = []
+
+    async def get(self, user_id):
+        self.lookups.append(user_id)
+        return "enterprise" if user_id else None
+
+
+class TestPlanIdentity:
+    """排队优先级的用户身份测试"""
+
+    @pytest.fixture(autouse=True)
+    def plans(self):
+        plans = RecordingPlans()
+        service = ChatService(llm_service=SlowStreamLLM(), rag_service=RAGService())
+        app.dependency_overrides[get_chat_service_instance] = lambda: service
+        app.dependency_overrides[get_user_plans] = lambda: plans
+        yield plans
+        app.dependency_overrides.clear()
+
+    def test_body_user_id_without_header_setting(self, plans):
+        """测试未配置认证请求头时按请求体的 user_id 查询套餐"""
+        client.post("/api/v1/chat", json={"message": "你好呀", "user_id": "u1", "use_rag": False})
+
+        assert plans.lookups == ["u1"]
+
+    def test_only_authenticated_header_is_trusted(self, plans, monkeypatch):
+        """测试配置认证请求头后忽略请求体中冒用的 user_id"""
+        monkeypatch.setattr(settings, "LLM_PLAN_USER_HEADER", "X-Authenticated-User")
+        body = {"message": "你好呀", "user_id": "vip", "use_rag": False}
+
+        client.post("/api/v1/chat", json=body)
+        client.post("/api/v1/chat", json=body, headers={"X-Authenticated-User": "u2"})
+        client.post("/api/v1/chat/batch", json={"items": [body]}, headers={"X-Authenticated-User": "u3"})
+
+        assert plans.lookups == [None, "u2", "u3"]
+
+
+@pytest.fixture
+def ws_service():
+    service = ChatService(llm_service=SlowStreamLLM(), rag_service=RAGService())
+    app.dependency_overrides[get_chat_service_instance] = lambda: service
+    yield service
+    app.dependency_overrides.clear()
+
+
+class TestChatWebSocket:
+    """WebSocket 对话通道测试"""
+
+    def test_stream_and_history(self, ws_service):
+        """测试流式返回，连接上的历史用于下一轮"""
+        with client.websocket_connect("/api/v1/chat/ws?session_id=ws-1&use_rag=false") as ws:
+            assert ws.receive_json() == {"type": "session", "session_id": "ws-1"}
+            for text in ["我想退款", "多久到账"]:
+                ws.send_json({"message": text})
+                events = []
+                while not events or events[-1]["type"] != "done":
+                    events.append(ws.receive_json())
+                deltas = "".join(e["content"] for e in events if e["type"] == "delta")
+                assert deltas == events[-1]["response"] == f"回复: {text}"
+
+        assert [m.content for m in ws_service.get_history("ws-1")] == [
+            "我想退款", "回复: 我想退款", "多久到账", "回复: 多久到账"
+        ]
+
+    def test_cancel_generation(self, ws_service):
+        """测试生成过程中取消，被取消的一轮不写入历史"""
+        with client.websocket_connect("/api/v1/chat/ws?session_id=ws-2") as ws:
+            ws.receive_json()
+            ws.send_json({"message": "一个很长的问题" * 5})
+            assert ws.receive_json()["type"] == "delta"
+            ws.send_json({"type": "cancel"})
+            event = ws.receive_json()
+            while event["type"] == "delta":
+                event = ws.receive_json()
+            assert event == {"type": "cancelled"}
+
+            ws.send_json({"message": "多久到账"})
+            events = [ws.receive_json()]
+            while events[-1]["type"] != "done":
+                events.append(ws.receive_json())
+
+        assert [m.content for m in ws_service.get_history("ws-2")] == ["多久到账", "回复: 多久到账"]
+
+    def test_cancel_stops_upstream(self, monkeypatch):
+        """测试取消生成时上游 LLM 流随之关闭并归还并发名额"""
+        monkeypatch.setattr(settings, "MINIMAX_API_KEY", "test-key")
+        produced = []
+
+        async def body():
+            for i in range(50):
+                await asyncio.sleep(0.02)
+                produced.append(i)
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': str(i)}}]})}\n\n".encode()
+
+        async def handler(request):
+            return httpx.Response(200, content=body())
+
+        llm = LLMService(client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        llm.cache = None
+        service = ChatService(llm_service=llm, rag_service=RAGService())
+        app.dependency_overrides[get_chat_service_instance] = lambda: service
+        try:
+            with client.websocket_connect("/api/v1/chat/ws?session_id=ws-3&use_rag=false") as ws:
+                ws.receive_json()
+                ws.send_json({"message": "讲个长故事"})
+                assert ws.receive_json()["type"] == "delta"
+                ws.send_json({"type": "cancel"})
+                event = ws.receive_json()
+                while event["type"] == "delta":
+                    event = ws.receive_json()
+                assert event == {"type": "cancelled"}
+
+                count = len(produced)
+                time.sleep(0.2)
+                assert len(produced) == count < 50
+                assert llm.limiter.in_flight == 0
+                assert llm._streams.stats()["in_flight"] == 0
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_rejects_oversized_query_params(self, ws_service):
+        """测试超长的会话ID以 1008 关闭连接"""
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect(f"/api/v1/chat/ws?session_id={'x' * 65}") as ws:
+                ws.receive_json()
+
+        assert exc_info.value.code == 1008
+
+
 class TestRoot:
     """根路径测试"""
     
@@ -0,0 +1,370 @@
+"""
+Chat Service Tests - 对话服务测试
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.services.chat_service import ChatService
+from app.services.context_packer import ContextPacker
+from app.services.intent_classifier import SMALL_TALK_REPLIES, get_intent_classifier
+from app.services.rag_service import RAGService, RetrievalResult
+from app.services.session_store import MemorySessionStore, MessageRecord
+from app.services.tokenizer import get_tokenizer
+
+
+class SlowSyncLLM:
+    """仅提供同步接口的慢速 LLM 后端"""
+
+    def __init__(self, delay: float = 0.2):
+        self.delay = delay
+
+    def generate(self, messages):
+        time.sleep(self.delay)
+        return f"回复: {messages[-1]['content']}"
+
+    def stream(self, messages):
+        time.sleep(self.delay)
+        yield "回"
+        yield "复"
+
+
+class TestAsyncChat:
+    """异步对话流程测试"""
+
+    @pytest.mark.asyncio
+    async def test_achat_does_not_block_event_loop(self):
+        """测试同步后端被卸载到线程池，事件循环保持响应"""
+        service = ChatService(llm_service=SlowSyncLLM(), rag_service=RAGService())
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        results = await asyncio.gather(*[
+            service.achat(message=f"问题{i}", session_id=f"s{i}") for i in range(5)
+        ])
+        task.cancel()
+
+        assert [r["response"] for r in results] == [f"回复: 问题{i}" for i in range(5)]
+        assert ticks >= 5
+        assert len(service.get_history("s0")) == 2
+
+    @pytest.mark.asyncio
+    async def test_astream_chat_with_sync_backend(self):
+        """测试同步流式后端通过线程池逐块产出"""
+        service = ChatService(llm_service=SlowSyncLLM(delay=0), rag_service=RAGService())
+
+        events = [e async for e in service.astream_chat(message="怎么退款", session_id="s")]
+
+        assert [e["content"] for e in events if e["type"] == "delta"] == ["回", "复"]
+        assert events[-1]["response"] == "回复"
+        assert service.get_history("s")[-1].content == "回复"
+
+
+class TestPromptBudget:
+    """提示词 token 预算测试"""
+
+    def test_oldest_history_dropped_first(self):
+        """测试超出预算时优先丢弃最早的历史"""
+        service = ChatService(rag_service=RAGService(), max_prompt_tokens=120)
+        for i in range(6):
+            service._sessions.append("s", service._make_message("user", f"第{i}个问题" * 5))
+
+        messages = service._build_messages("新问题", "s", use_rag=False)
+
+        assert messages[0]["role"] == "system"
+        assert messages[-1]["content"] == "新问题"
+        assert messages[-2]["content"] == "第5个问题" * 5
+        assert len(messages) < 8
+        assert get_tokenizer().count_messages(messages) <= 120
+
+    def test_context_truncated_to_fit(self):
+        """测试知识库内容超出预算时被截断"""
+        service = ChatService(rag_service=RAGService(), max_prompt_tokens=200)
+
+        messages = service._build_messages("退款", "s", context="退款说明。" * 500)
+
+        assert "=== 知识库内容 ===" in messages[0]["content"]
+        assert get_tokenizer().count_messages(messages) <= 200
+
+
+def _chunk(content, score, filename="faq.md", index=0):
+    return RetrievalResult(
+        content=content,
+        metadata={"filename": filename, "chunk_index": index},
+        score=score,
+        chunk_id=f"{filename}:{index}",
+    )
+
+
+class TestContextPacker:
+    """上下文打包测试"""
+
+    def test_overlap_and_duplicates_removed(self):
+        """测试去除相邻分块重叠和重复片段"""
+        shared = "退款将在审核通过后的三个工作日内原路退回您的支付账户。"
+        first = _chunk("七天无理由退款适用于所有套餐。" + shared, 0.9, index=0)
+        second = _chunk(shared + "如需加急请联系人工客服处理。", 0.8, index=1)
+        duplicate = _chunk(first.content, 0.7, filename="copy.md")
+
+        packed = ContextPacker(min_remaining_chars=5).pack_chunks(
+            [second, duplicate, first], budget=1000
+        )
+
+        assert [c.chunk_id for c in packed.chunks] == ["faq.md:0", "faq.md:1"]
+        assert packed.chunks[1].content == "如需加急请联系人工客服处理。"
+        assert packed.context.count(shared) == 1
+        assert packed.dropped == 1
+
+    def test_greedy_by_score_within_budget(self):
+        """测试按相关度贪心放入，放不下的跳过"""
+        packer = ContextPacker()
+        big = _chunk("价格说明" * 200, 0.95, filename="a.md")
+        small = _chunk("专业版每月99元。", 0.6, filename="b.md")
+        best = _chunk("免费版可以永久使用。", 0.99, filename="c.md")
+
+        packed = packer.pack_chunks([small, big, best], budget=100)
+
+        assert [c.metadata["filename"] for c in packed.chunks] == ["c.md", "b.md"]
+        assert packed.tokens <= 100
+
+    def test_build_messages_packs_chunks(self):
+        """测试构建消息时使用打包后的上下文"""
+        service = ChatService(rag_service=RAGService(), max_context_tokens=50)
+        chunks = [_chunk("专业版每月99元。", 0.6), _chunk("价格说明" * 200, 0.9, filename="a.md")]
+
+        system = service._build_messages("多少钱", "s", chunks=chunks)[0]["content"]
+
+        assert "专业版每月99元。" in system
+        assert "价格说明" not in system
+
+
+class TestSessionStore:
+    """会话存储测试"""
+
+    def test_lru_eviction(self):
+        """测试超出会话数上限时淘汰最久未访问的会话"""
+        store = MemorySessionStore(max_sessions=2)
+        store.append("a", MessageRecord("user", "1"))
+        store.append("b", MessageRecord("user", "2"))
+        list(store.iter_messages("a"))
+        store.append("c", MessageRecord("user", "3"))
+
+        assert "a" in store and "c" in store
+        assert "b" not in store
+        assert store.stats()["evicted_lru"] == 1
+
+    def test_read_does_not_create_session(self):
+        """测试读取不存在的会话不会创建条目"""
+        service = ChatService(rag_service=RAGService())
+
+        service._build_messages("你好", "ghost", use_rag=False)
+
+        assert service.get_history("ghost") == []
+        assert service.get_session_count() == 0
+
+    def test_idle_sessions_swept(self):
+        """测试空闲超时的会话被清理"""
+        store = MemorySessionStore(idle_ttl=0.05)
+        store.append("old", MessageRecord("user", "旧消息"))
+        time.sleep(0.1)
+        store.append("new", MessageRecord("user", "新消息"))
+
+        assert store.sweep() == 1
+        assert "old" not in store and "new" in store
+        assert store.stats()["expired_idle"] == 1
+
+    def test_per_session_byte_cap(self):
+        """测试单会话超出内存上限时丢弃最早的消息"""
+        store = MemorySessionStore(max_bytes=100)
+        for i in range(5):
+            store.append("s", MessageRecord("user", f"{i}" * 40))
+
+        messages = store.iter_messages("s")
+        assert [m.content[0] for m in messages] == ["3", "4"]
+        assert store.stats()["bytes"] <= 100
+        assert store.stats()["trimmed_messages"] == 3
+
+    @pytest.mark.asyncio
+    async def test_background_sweeper(self):
+        """测试后台任务定期清理空闲会话"""
+        store = MemorySessionStore(idle_ttl=0.01, sweep_interval=0.02)
+        store.append("s", MessageRecord("user", "你好"))
+
+        await store.start()
+        await asyncio.sleep(0.1)
+        await store.stop()
+
+        assert len(store) == 0
+
+    def test_ring_buffer_snapshot(self):
+        """测试会话历史为定长环形缓冲区，读取返回不受后续写入影响的快照"""
+        store = MemorySessionStore(max_messages=3)
+        store.extend("s", [MessageRecord("user", f"消息{i}") for i in range(5)])
+
+        snapshot = store.iter_messages("s", limit=2)
+        store.append("s", MessageRecord("assistant", "并发写入"))
+        assert [m.content for m in snapshot] == ["消息3", "消息4"]
+        assert store._sessions["s"].messages.maxlen == 3
+        assert store.stats()["trimmed_messages"] == 3
+        assert store.iter_messages("s")[0] is store._sessions["s"].messages[0]
+
+
+class StaticRAG(RAGService):
+    """返回固定片段的检索服务"""
+
+    def __init__(self, results):
+        super().__init__()
+        self.results = results
+
+    def retrieve_documents(self, query, top_k=5):
+        self._remember(self.results)
+        return self.results
+
+
+class TestSourceRefs:
+    """来源引用测试"""
+
+    @pytest.mark.asyncio
+    async def test_history_stores_refs_and_resolves_lazily(self):
+        """测试历史只保存来源引用，读取时展开片段内容"""
+        chunk = _chunk("退款将在三个工作日内原路退回。" * 20, 0.9)
+        service = ChatService(llm_service=SlowSyncLLM(delay=0), rag_service=StaticRAG([chunk]))
+
+        result = await service.achat(message="多久退款", session_id="s")
+
+        assert result["sources"][0]["content"] == chunk.content
+        stored = service.get_history("s")[-1].metadata["sources"]
+        assert stored == [{"chunk_id": "faq.md:0", "score": 0.9, "doc_id": "faq.md"}]
+
+        exported = service.export_history(await service.aget_history("s"))
+        source = exported[-1]["metadata"]["sources"][0]
+        assert source["content"] == chunk.content
+        assert source["filename"] == "faq.md"
+        assert "content" not in service.get_history("s")[-1].metadata["sources"][0]
+
+
+class CountingRAG(StaticRAG):
+    """记录批量检索调用的检索服务"""
+
+    def __init__(self, results):
+        super().__init__(results)
+        self.batches = []
+
+    def retrieve_batch(self, queries, top_k=5):
+        self.batches.append(list(queries))
+        return super().retrieve_batch(queries, top_k=top_k)
+
+
+class FlakyRAG(StaticRAG):
+    """指定查询检索失败的检索服务"""
+
+    def retrieve_documents(self, query, top_k=5):
+        if "超时" in query:
+            raise TimeoutError("向量库无响应")
+        return super().retrieve_documents(query, top_k=top_k)
+
+
+class PeakLLM:
+    """记录最大并发调用数的异步 LLM 后端"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def agenerate(self, messages, plan=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.02)
+        self.active -= 1
+        return f"回复: {messages[-1]['content']}"
+
+
+class TestBatchChat:
+    """批量对话测试"""
+
+    @pytest.mark.asyncio
+    async def test_single_batched_retrieval_and_bounded_fanout(self):
+        """测试检索合并为一次批量调用，LLM 并发不超过上限"""
+        rag = CountingRAG([_chunk("专业版每月99元。", 0.8)])
+        llm = PeakLLM()
+        service = ChatService(llm_service=llm, rag_service=rag)
+        requests = [{"message": f"问题{i % 3}"} for i in range(6)] + [{"message": "你好", "use_rag": False}]
+
+        results = [r async for r in service.abatch_chat(requests, concurrency=2)]
+
+        assert sorted(r["index"] for r in results) == list(range(7))
+        assert rag.batches == [["问题0", "问题1", "问题2"]]
+        assert llm.peak == 2
+        by_index = {r["index"]: r for r in results}
+        assert by_index[6]["sources"] == []
+        assert by_index[0]["sources"][0]["content"] == "专业版每月99元。"
+
+    @pytest.mark.asyncio
+    async def test_failed_retrieval_degrades_only_that_item(self):
+        """测试单个查询检索失败时只有该条降级为不使用知识库"""
+        service = ChatService(
+            llm_service=PeakLLM(), rag_service=FlakyRAG([_chunk("专业版每月99元。", 0.8)])
+        )
+        requests = [{"message": "价格多少"}, {"message": "超时的问题"}]
+
+        results = {r["index"]: r async for r in service.abatch_chat(requests)}
+
+        assert results[0]["sources"][0]["content"] == "专业版每月99元。"
+        assert results[1]["sources"] == []
+        assert "error" not in results[1]
+
+    @pytest.mark.asyncio
+    async def test_same_session_runs_in_order(self):
+        """测试同一会话的消息按提交顺序执行"""
+        service = ChatService(llm_service=SlowSyncLLM(delay=0), rag_service=RAGService())
+        requests = [{"message": f"第{i}轮", "session_id": "s", "use_rag": False} for i in range(4)]
+
+        results = [r async for r in service.abatch_chat(requests, concurrency=4)]
+
+        assert [r["index"] for r in results] == [0, 1, 2, 3]
+        assert [m.content for m in service.get_history("s")[::2]] == ["第0轮", "第1轮", "第2轮", "第3轮"]
+
+
+class TestSmallTalk:
+    """闲聊快速通道测试"""
+
+    @pytest.mark.asyncio
+    async def test_greeting_skips_retrieval_and_llm(self):
+        """测试高置信度的问候直接模板回复，不检索也不调用 LLM"""
+        rag = CountingRAG([_chunk("专业版每月99元。", 0.8)])
+        llm = PeakLLM()
+        service = ChatService(llm_service=llm, rag_service=rag)
+
+        result = await service.achat(message="你好！", session_id="s")
+
+        assert result["response"] in SMALL_TALK_REPLIES["greeting"]
+        assert result["sources"] == []
+        assert llm.peak == 0 and rag.batches == []
+        assert [m.content for m in service.get_history("s")] == ["你好！", result["response"]]
+
+    @pytest.mark.asyncio
+    async def test_question_goes_to_llm(self):
+        """测试业务问题（含问候语）仍走检索和 LLM"""
+        service = ChatService(llm_service=PeakLLM(), rag_service=RAGService())
+
+        result = await service.achat(message="你好，我想退款", session_id="s", use_rag=False)
+
+        assert result["response"] == "回复: 你好，我想退款"
+
+    def test_classifier_intents(self):
+        """测试内置数据训练的分类器"""
+        classifier = get_intent_classifier()
+
+        assert classifier.classify("谢谢啦").intent == "thanks"
+        assert classifier.classify("再见～").intent == "farewell"
+        assert classifier.classify("专业版多少钱").intent == "other"
+        assert classifier.classify("你好" * 20).intent == "other"
@@ -0,0 +1,115 @@
+"""
+Embedding Batcher Tests - 查询向量微批处理测试
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.concurrency import run_blocking
+from app.services.chat_service import ChatService
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.rag_service import RAGService
+
+
+class RecordingEmbeddings:
+    """记录每次批量调用的向量模型"""
+
+    def __init__(self, fail=False, delay=0.0):
+        self.calls = []
+        self.fail = fail
+        self.delay = delay
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [float(len(text))]
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("向量接口不可用")
+        return [[float(len(text))] for text in texts]
+
+
+class TestEmbeddingBatcher:
+    """微批处理测试"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_share_one_call(self):
+        """测试时间窗口内的并发查询合并为一次调用，相同查询只计算一次"""
+        model = RecordingEmbeddings()
+        batcher = EmbeddingBatcher(model, max_batch_size=32, max_delay=0.01)
+
+        vectors = await asyncio.gather(*(
+            batcher.aembed_query(text) for text in ["退款", "发货时间", "退款", "发票"]
+        ))
+
+        assert vectors == [[2.0], [4.0], [2.0], [2.0]]
+        assert model.calls == [["退款", "发货时间", "发票"]]
+        stats = batcher.stats()
+        assert stats["batches"] == 1
+        assert stats["queue_delay"]["count"] == 4
+
+    @pytest.mark.asyncio
+    async def test_full_batch_flushes_immediately(self):
+        """测试凑满批大小立即发送，不等待时间窗口"""
+        model = RecordingEmbeddings()
+        batcher = EmbeddingBatcher(model, max_batch_size=2, max_delay=10.0)
+
+        vectors = await asyncio.wait_for(
+            asyncio.gather(*(batcher.aembed_query(f"问题{i}") for i in range(4))), timeout=1.0
+        )
+
+        assert len(vectors) == 4
+        assert model.calls == [["问题0", "问题1"], ["问题2", "问题3"]]
+
+    @pytest.mark.asyncio
+    async def test_threads_submit_to_loop_and_errors_propagate(self):
+        """测试线程池中的同步调用经事件循环合并，失败时同批调用方都收到异常"""
+        model = RecordingEmbeddings()
+        batcher = EmbeddingBatcher(model, max_delay=0.05)
+        batcher.attach(asyncio.get_running_loop())
+
+        vectors = await asyncio.gather(*(
+            run_blocking(batcher.embed_query, text) for text in ["一", "二二", "三三三"]
+        ))
+        assert vectors == [[1.0], [2.0], [3.0]]
+        assert len(model.calls) == 1
+
+        model.fail = True
+        results = await asyncio.gather(
+            batcher.aembed_query("甲"), batcher.aembed_query("乙"), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert batcher.failures == 1
+
+    @pytest.mark.asyncio
+    async def test_sync_call_times_out_and_cancels(self):
+        """测试线程中的同步调用超时后抛出 TimeoutError，并取消事件循环中的等待"""
+        model = RecordingEmbeddings(delay=0.3)
+        batcher = EmbeddingBatcher(model, max_delay=0.001, timeout=0.05)
+        batcher.attach(asyncio.get_running_loop())
+
+        with pytest.raises(TimeoutError):
+            await run_blocking(batcher.embed_query, "退款")
+        await batcher.stop()
+
+        assert model.calls == [["退款"]]
+
+    @pytest.mark.asyncio
+    async def test_chat_service_stop_flushes_batcher(self):
+        """测试关闭对话服务时检索服务发送批处理器中剩余的查询"""
+        model = RecordingEmbeddings()
+        batcher = EmbeddingBatcher(model, max_batch_size=32, max_delay=10.0)
+        store = SimpleNamespace(embedding_model=CachedEmbeddings(batcher, directory=None))
+        service = ChatService(rag_service=RAGService(vector_store=store))
+
+        pending = asyncio.ensure_future(batcher.aembed_query("发货时间"))
+        await asyncio.sleep(0)
+        await service.stop()
+
+        assert await asyncio.wait_for(pending, timeout=1.0) == [4.0]
@@ -0,0 +1,115 @@
+"""
+Embedding Cache Tests - 向量缓存测试
+"""
+
+import os
+import threading
+
+import pytest
+
+from app.services.embedding_cache import CachedEmbeddings, EmbeddingDiskStore, content_hash
+
+
+class CountingEmbeddings:
+    """记录调用的向量模型（向量由文本长度生成）"""
+
+    model = "counting/v1"
+
+    def __init__(self):
+        self.queries = []
+        self.documents = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 1.0, 0.5]
+
+    def embed_documents(self, texts):
+        self.documents.append(list(texts))
+        return [[float(len(text)), 0.0, 0.25] for text in texts]
+
+
+class TestCachedEmbeddings:
+    """缓存包装测试"""
+
+    def test_query_lru(self):
+        """测试查询向量命中 LRU，超出容量时淘汰最久未使用的"""
+        model = CountingEmbeddings()
+        embeddings = CachedEmbeddings(model, query_cache_size=2)
+
+        embeddings.embed_query("退款")
+        embeddings.embed_query("发货")
+        assert embeddings.embed_query("退款") == [2.0, 1.0, 0.5]
+        embeddings.embed_query("发票")
+        embeddings.embed_query("发货")
+
+        assert model.queries == ["退款", "发货", "发票", "发货"]
+        assert embeddings.stats()["query_hits"] == 1
+
+    def test_batched_queries_share_one_call(self, tmp_path):
+        """测试批量查询未命中的部分合并为一次调用，且不写入文档磁盘缓存"""
+        model = CountingEmbeddings()
+        embeddings = CachedEmbeddings(model, directory=str(tmp_path))
+        embeddings.embed_query("退款")
+
+        vectors = embeddings.embed_queries(["发货", "退款", "发票", "发货"])
+
+        assert model.documents == [["发货", "发票"]]
+        assert vectors[1] == [2.0, 1.0, 0.5] and vectors[0] == vectors[3]
+        assert embeddings.embed_query("发票") == vectors[2]
+        assert embeddings.stats()["documents"] == 0
+
+    def test_documents_persist_across_instances(self, tmp_path):
+        """测试文档向量落盘，重新摄入时只向量化新片段"""
+        model = CountingEmbeddings()
+        first = CachedEmbeddings(model, directory=str(tmp_path))
+        vectors = first.embed_documents(["第一段", "第二段内容", "第一段"])
+
+        second = CachedEmbeddings(model, directory=str(tmp_path))
+        again = second.embed_documents(["第二段内容", "新的第三段", "第一段"])
+
+        assert model.documents == [["第一段", "第二段内容"], ["新的第三段"]]
+        assert again[0] == vectors[1] and again[2] == vectors[0]
+        assert os.path.isdir(tmp_path / "counting_v1")
+        assert second.stats()["documents"] == 3
+
+
+class TestEmbeddingDiskStore:
+    """磁盘存储测试"""
+
+    def test_recovers_from_partial_write(self, tmp_path):
+        """测试索引多于向量（写入中断）时只保留完整的条目"""
+        store = EmbeddingDiskStore(str(tmp_path))
+        store.put_many({content_hash("a"): [1.0, 2.0], content_hash("b"): [3.0, 4.0]})
+        with open(tmp_path / "index.txt", "a", encoding="utf-8") as f:
+            f.write(content_hash("c") + "\n")
+
+        reopened = EmbeddingDiskStore(str(tmp_path))
+
+        assert len(reopened) == 2 and content_hash("c") not in reopened
+        assert reopened.get_many([content_hash("b")])[content_hash("b")].tolist() == [3.0, 4.0]
+        with pytest.raises(ValueError):
+            reopened.put_many({content_hash("d"): [1.0, 2.0, 3.0]})
+
+    def test_shared_directory_across_writers(self, tmp_path):
+        """测试多个实例（模拟多 worker）并发写同一目录时行号不冲突，并能读到对方写入的向量"""
+        stores = [EmbeddingDiskStore(str(tmp_path)) for _ in range(2)]
+
+        def write(store, name):
+            for i in range(50):
+                store.put_many({content_hash(f"{name}{i}"): [float(i), float(len(name))]})
+
+        threads = [
+            threading.Thread(target=write, args=(store, name))
+            for store, name in zip(stores, ["a", "bb"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        digest = content_hash("bb7")
+        assert stores[0].get_many([digest])[digest].tolist() == [7.0, 2.0]
+        reopened = EmbeddingDiskStore(str(tmp_path))
+        assert len(reopened) == 100
+        vectors = reopened.get_many([content_hash(f"a{i}") for i in range(50)])
+        assert [vector.tolist() for vector in vectors.values()] == [[float(i), 1.0] for i in range(50)]
@@ -0,0 +1,132 @@
+"""
+FAQ Index Tests - 标准问答索引测试
+"""
+
+import pytest
+
+from app.core.config import settings
+from app.services.chat_service import ChatService
+from app.services.faq_index import FAQEntry, FAQIndex
+from app.services.rag_service import RAGService
+from app.services.text_features import HashingEmbeddings
+
+
+class FailingLLM:
+    """被调用即失败的 LLM 后端（用于确认没有调用 LLM）"""
+
+    def generate(self, messages):
+        raise AssertionError("不应调用 LLM")
+
+    async def agenerate(self, messages, plan=None):
+        raise AssertionError("不应调用 LLM")
+
+
+class RecordingEmbeddings(HashingEmbeddings):
+    """记录向量化文本的向量模型（代替配置的 EMBEDDING_MODEL）"""
+
+    def __init__(self):
+        super().__init__()
+        self.documents = []
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def faq_csv(tmp_path):
+    path = tmp_path / "faq.csv"
+    path.write_text(
+        "question,answer,source\n"
+        "怎么申请退款？,在订单详情页点击“申请退款”，三个工作日内原路退回。,售后政策.md\n"
+        "专业版多少钱,专业版每月99元。,\n"
+        ",缺少问题的行会被忽略,\n",
+        encoding="utf-8"
+    )
+    return str(path)
+
+
+class TestFAQIndex:
+    """索引测试"""
+
+    def test_load_csv(self, faq_csv):
+        """测试从 CSV 加载，source 缺省为文件名"""
+        index = FAQIndex.from_csv(faq_csv)
+
+        assert len(index) == 2
+        assert index.match("专业版多少钱").entry.source == "faq.csv"
+
+    def test_exact_and_similar_match(self, faq_csv):
+        """测试规范化后精确匹配，以及相似问题按阈值匹配"""
+        index = FAQIndex.from_csv(faq_csv, threshold=0.6)
+
+        exact = index.match("怎么申请退款")
+        assert exact.exact and exact.score == 1.0
+        assert exact.entry.source == "售后政策.md"
+
+        similar = index.match("请问怎么申请退款呢")
+        assert similar is not None and not similar.exact
+        assert 0.6 <= similar.score < 1.0
+
+        assert index.match("发票怎么开") is None
+        assert index.stats() == {"entries": 2, "hits": 2, "exact_hits": 1, "misses": 1}
+
+    def test_reload_replaces_entries(self):
+        """测试重新加载整体替换索引"""
+        index = FAQIndex()
+        index.load([FAQEntry("a", "旧问题", "旧答案")])
+        index.load([FAQEntry("b", "新问题", "新答案")])
+
+        assert index.match("旧问题") is None
+        assert index.match("新问题").entry.answer == "新答案"
+
+
+class TestFAQChat:
+    """对话服务集成测试"""
+
+    def test_chat_returns_curated_answer(self, faq_csv):
+        """测试命中标准问答时直接返回答案和来源，不调用 LLM"""
+        service = ChatService(
+            llm_service=FailingLLM(), rag_service=RAGService(),
+            faq_index=FAQIndex.from_csv(faq_csv)
+        )
+
+        result = service.chat(message="专业版多少钱？", session_id="s")
+
+        assert result["response"] == "专业版每月99元。"
+        assert result["confidence"] == 1.0
+        assert result["sources"][0]["filename"] == "faq.csv"
+        assert service.get_history("s")[-1].metadata["sources"][0]["chunk_id"] == "faq.csv:1"
+
+    @pytest.mark.asyncio
+    async def test_miss_and_use_rag_false_go_to_llm(self, faq_csv):
+        """测试未命中或不使用知识库时仍调用 LLM"""
+        service = ChatService(
+            llm_service=FailingLLM(), rag_service=RAGService(),
+            faq_index=FAQIndex.from_csv(faq_csv)
+        )
+
+        hit = await service.achat(message="怎么申请退款", session_id="s")
+        miss = await service.achat(message="发票怎么开", session_id="s")
+        skipped = await service.achat(message="专业版多少钱", session_id="s", use_rag=False)
+
+        assert hit["sources"][0]["doc_id"] == "售后政策.md"
+        assert miss["response"] == skipped["response"] == "抱歉，我现在无法回答您的问题。请稍后再试。"
+
+    def test_uses_configured_embeddings(self, faq_csv, monkeypatch):
+        """测试配置了 OPENAI_API_KEY 时与知识库共用向量模型，否则使用哈希向量"""
+        embeddings = RecordingEmbeddings()
+        monkeypatch.setattr(settings, "FAQ_FILE", faq_csv)
+        monkeypatch.setattr(
+            "app.services.rag_service.create_embeddings", lambda loop=None: embeddings
+        )
+
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "")
+        assert type(ChatService(rag_service=RAGService()).faq_index.embeddings) is HashingEmbeddings
+
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "sk-test")
+        rag = RAGService()
+        service = ChatService(llm_service=FailingLLM(), rag_service=rag)
+
+        assert service.faq_index.embeddings is rag.embeddings is embeddings
+        assert embeddings.documents == ["怎么申请退款？", "专业版多少钱"]
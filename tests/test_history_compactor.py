@@ -0,0 +1,119 @@
+"""
+History Compactor Tests - 对话历史滚动摘要测试
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.chat_service import ChatService
+from app.services.history_compactor import HistoryCompactor
+from app.services.rag_service import RAGService
+from app.services.session_store import MemorySessionStore, MessageRecord
+
+
+class EchoLLM:
+    """原样返回用户消息的 LLM 后端"""
+
+    async def agenerate(self, messages, plan=None):
+        return f"回复: {messages[-1]['content']}"
+
+
+class SummaryRecorder:
+    """记录摘要请求并返回固定摘要"""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def __call__(self, messages):
+        self.prompts.append(messages)
+        return f"摘要{len(self.prompts)}"
+
+
+def _history(count):
+    return [
+        MessageRecord("user" if i % 2 == 0 else "assistant", f"消息{i}" * 10, timestamp=float(i))
+        for i in range(count)
+    ]
+
+
+def _store(*session_ids):
+    store = MemorySessionStore()
+    for session_id in session_ids:
+        store.append(session_id, MessageRecord("user", "你好"))
+    return store
+
+
+class TestHistoryCompactor:
+    """压缩器测试"""
+
+    @pytest.mark.asyncio
+    async def test_folds_older_messages(self):
+        """测试超过阈值时折叠较早的消息，摘要之后的消息原样保留"""
+        generate = SummaryRecorder()
+        store = _store("s")
+        compactor = HistoryCompactor(generate, store, trigger_tokens=100, keep_messages=2)
+        history = _history(6)
+
+        assert await compactor.compact("s", history)
+        summary, recent = compactor.split("s", history)
+
+        assert summary.text == "摘要1"
+        assert summary.until == 3.0
+        assert [m.content for m in recent] == [history[4].content, history[5].content]
+        assert "用户：" + history[0].content in generate.prompts[0][1]["content"]
+        assert store.get_summary("s") is summary
+
+    @pytest.mark.asyncio
+    async def test_below_threshold_and_rolling(self):
+        """测试未超过阈值时不压缩，再次压缩时带上已有摘要"""
+        generate = SummaryRecorder()
+        compactor = HistoryCompactor(generate, _store("s"), trigger_tokens=100, keep_messages=2)
+
+        assert not await compactor.compact("s", _history(2))
+        await compactor.compact("s", _history(6))
+        assert await compactor.compact("s", _history(10))
+
+        assert "摘要1" in generate.prompts[1][1]["content"]
+        assert compactor.get_summary("s").until == 7.0
+        assert compactor.stats()["folded_messages"] == 8
+
+    @pytest.mark.asyncio
+    async def test_summary_requires_live_session(self):
+        """测试会话已删除时不保存摘要，摘要随会话一起删除"""
+        store = _store("s")
+        compactor = HistoryCompactor(SummaryRecorder(), store, trigger_tokens=100, keep_messages=2)
+
+        assert not await compactor.compact("ghost", _history(6))
+        assert await compactor.compact("s", _history(6))
+        store.clear("s")
+        assert compactor.get_summary("s") is None
+
+
+class TestChatCompaction:
+    """对话服务集成测试"""
+
+    @pytest.mark.asyncio
+    async def test_summary_replaces_old_turns(self):
+        """测试回复后在后台生成摘要，之后的提示词只带摘要和近期消息"""
+        generate = SummaryRecorder()
+        store = MemorySessionStore()
+        service = ChatService(
+            llm_service=EchoLLM(), rag_service=RAGService(), session_store=store,
+            compactor=HistoryCompactor(generate, store, trigger_tokens=60, keep_messages=2)
+        )
+
+        for i in range(3):
+            await service.achat(message=f"第{i}个问题" * 5, session_id="s", use_rag=False)
+            await asyncio.sleep(0)
+        await asyncio.gather(*service.compactor._tasks.values())
+
+        messages = service._build_messages("新问题", "s", use_rag=False)
+        assert messages[1] == {"role": "system", "content": f"=== 此前对话摘要 ===\n摘要{len(generate.prompts)}"}
+        assert [m["content"] for m in messages[2:]] == [
+            "第2个问题" * 5, "回复: " + "第2个问题" * 5, "新问题"
+        ]
+
+        assert service.clear_history("s")
+        assert service.compactor.get_summary("s") is None
+        await service.stop()
@@ -0,0 +1,167 @@
+"""
+History Store Tests - 对话历史持久化测试
+"""
+
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models.database import ChatMessageModel, ChatSessionModel
+from app.services.chat_service import ChatService
+from app.services.history_store import DatabaseHistoryStore
+from app.services.rag_service import RAGService
+from app.services.session_store import MessageRecord
+
+
+class EchoLLM:
+    """原样返回用户消息的 LLM 后端"""
+
+    async def agenerate(self, messages, plan=None):
+        return f"回复: {messages[-1]['content']}"
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'history.db'}")
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+def _message(content, role="user"):
+    return MessageRecord(role, content)
+
+
+class TestDatabaseHistoryStore:
+    """write-behind 历史存储测试"""
+
+    @pytest.mark.asyncio
+    async def test_batches_by_size(self, session_factory):
+        """测试累计到批量大小时立即写入，且一批只用一次事务"""
+        store = DatabaseHistoryStore(session_factory, flush_interval=10, flush_size=4)
+        await store.start()
+
+        for i in range(4):
+            store.record("s1", _message(f"消息{i}"), user_id="u1")
+        await asyncio.sleep(0.2)
+
+        assert store.stats()["flushes"] == 1
+        assert store.stats()["flushed"] == 4
+        async with session_factory() as session:
+            count = await session.scalar(select(func.count()).select_from(ChatMessageModel))
+            chat_session = await session.get(ChatSessionModel, "s1")
+        assert count == 4
+        assert chat_session.message_count == 4
+        assert chat_session.user_id == "u1"
+        await store.stop()
+
+    @pytest.mark.asyncio
+    async def test_load_merges_unflushed(self, session_factory):
+        """测试读取时合并已落库和尚未落库的消息"""
+        store = DatabaseHistoryStore(session_factory, flush_interval=10)
+        await store.start()
+        store.record("s1", _message("第一条"))
+        await store.flush()
+        store.record("s1", _message("第二条", role="assistant"))
+
+        messages = await store.load("s1")
+
+        assert [m.content for m in messages] == ["第一条", "第二条"]
+        assert store.stats()["pending"] == 1
+        await store.stop()
+        assert store.stats()["pending"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_is_retried(self, session_factory):
+        """测试写入失败时消息退回缓冲区"""
+        store = DatabaseHistoryStore(session_factory, create_tables=False)
+        store.record("s1", _message("你好"))
+
+        assert await store.flush() == 0
+        assert store.stats()["failed_flushes"] == 1
+        assert store.stats()["pending"] == 1
+
+        store.create_tables = True
+        await store.start()
+        assert await store.flush() == 1
+        assert [m.content for m in await store.load("s1")] == ["你好"]
+        await store.stop()
+
+
+    @pytest.mark.asyncio
+    async def test_poison_message_dead_lettered(self, session_factory, tmp_path):
+        """测试多次写入失败的消息转入死信文件，不阻塞其他消息"""
+        dead_letters = tmp_path / "dead_letter.jsonl"
+        store = DatabaseHistoryStore(
+            session_factory, flush_interval=10, max_attempts=2, dead_letter_path=str(dead_letters)
+        )
+        await store.start()
+        store.record("s1", _message("第一条"))
+        store.record("s1", MessageRecord(None, "缺少角色"))
+        assert await store.flush() == 0
+        store.record("s1", _message("第二条"))
+
+        assert await store.flush() == 1
+        assert await store.flush() == 1
+        assert store.stats()["dead_lettered"] == 1
+        assert store.stats()["pending"] == 0
+        assert [m.content for m in await store.load("s1")] == ["第一条", "第二条"]
+        assert json.loads(dead_letters.read_text(encoding="utf-8"))["content"] == "缺少角色"
+        await store.stop()
+
+    @pytest.mark.asyncio
+    async def test_upgrades_old_schema(self, session_factory):
+        """测试旧版本数据库补齐 metadata 列和索引后可以写入"""
+        engine = session_factory.kw["bind"]
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "CREATE TABLE chat_messages (id VARCHAR(36) PRIMARY KEY, session_id VARCHAR(36) NOT NULL, "
+                "role VARCHAR(20) NOT NULL, content TEXT NOT NULL, tokens INTEGER, latency_ms FLOAT, "
+                "created_at DATETIME)"
+            ))
+
+        store = DatabaseHistoryStore(session_factory)
+        await store.start()
+        store.record("s1", MessageRecord("assistant", "好的", {"confidence": 0.9}))
+        assert await store.flush() == 1
+
+        async with engine.connect() as conn:
+            indexes = await conn.run_sync(lambda c: inspect(c).get_indexes("chat_messages"))
+        assert "ix_chat_messages_session_id" in {index["name"] for index in indexes}
+        assert (await store.load("s1"))[0].metadata == {"confidence": 0.9}
+        await store.stop()
+
+
+class TestPersistentChat:
+    """对话历史跨实例持久化测试"""
+
+    @pytest.mark.asyncio
+    async def test_history_survives_restart(self, session_factory):
+        """测试重启（新的服务实例）后仍能读取并续接历史"""
+        first = ChatService(
+            llm_service=EchoLLM(), rag_service=RAGService(),
+            history_store=DatabaseHistoryStore(session_factory)
+        )
+        await first.start()
+        await first.achat(message="我想退款", session_id="s1", use_rag=False)
+        await first.stop()
+
+        second = ChatService(
+            llm_service=EchoLLM(), rag_service=RAGService(),
+            history_store=DatabaseHistoryStore(session_factory)
+        )
+        await second.start()
+        history = await second.aget_history("s1")
+        await second.achat(message="多久到账", session_id="s1", use_rag=False)
+        messages = second._build_messages("还有吗", "s1", use_rag=False)
+        await second.aclear_history("s1")
+        await second.stop()
+
+        assert [m.content for m in history] == ["我想退款", "回复: 我想退款"]
+        assert [m["content"] for m in messages[1:]] == [
+            "我想退款", "回复: 我想退款", "多久到账", "回复: 多久到账", "还有吗"
+        ]
+        assert await DatabaseHistoryStore(session_factory).load("s1") == []
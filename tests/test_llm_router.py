@@ -0,0 +1,131 @@
+"""
+LLM Router Tests - 多提供商路由测试
+
+使用本地桩 HTTP 服务模拟不同延迟和故障的提供商。
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services.llm_router import LLMRouter
+from app.services.llm_service import AnthropicLLM, LLMService, OpenAILLM
+
+
+def _start_stub(reply: str, delay: float = 0.0, status: int = 200, anthropic: bool = False):
+    """启动返回固定回复的桩服务，返回 (server, base_url)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            if anthropic:
+                body = {"content": [{"type": "text", "text": reply}]}
+            else:
+                body = {"choices": [{"message": {"role": "assistant", "content": reply}}]}
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.fixture
+def stubs():
+    """按需启动桩服务，测试结束后关闭"""
+    servers = []
+
+    def start(*args, **kwargs):
+        server, url = _start_stub(*args, **kwargs)
+        servers.append(server)
+        return url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def _provider(base_url: str, client: httpx.AsyncClient, cls=OpenAILLM):
+    return cls(base_url=base_url, api_key="test-key", client=client)
+
+
+class TestLLMRouter:
+    """路由测试"""
+
+    @pytest.mark.asyncio
+    async def test_hedge_beats_slow_primary(self, stubs):
+        """测试主提供商变慢时对冲请求胜出"""
+        slow = stubs("慢", delay=2.0)
+        fast = stubs("快")
+
+        async with httpx.AsyncClient() as client:
+            router = LLMRouter(
+                {"slow": _provider(slow, client), "fast": _provider(fast, client)},
+                hedge=True,
+                hedge_min_delay=0.1,
+            )
+            start = time.monotonic()
+            reply = await router.agenerate("你好")
+            elapsed = time.monotonic() - start
+
+        assert reply == "快"
+        assert elapsed < 1.5
+        assert router.hedges == 1
+        assert router.hedge_wins == 1
+
+    @pytest.mark.asyncio
+    async def test_failover_and_ranking(self, stubs):
+        """测试失败切换，并按延迟和错误率排序"""
+        broken = stubs("", status=500)
+        anthropic = stubs("好的", anthropic=True)
+
+        async with httpx.AsyncClient() as client:
+            router = LLMRouter({
+                "broken": _provider(broken, client),
+                "anthropic": _provider(anthropic, client, cls=AnthropicLLM),
+            })
+            assert await router.agenerate([
+                {"role": "system", "content": "你是客服"},
+                {"role": "user", "content": "你好"},
+            ]) == "好的"
+
+        stats = router.stats()["providers"]
+        assert stats["broken"]["error_rate"] == 1.0
+        assert stats["anthropic"]["p50"] is not None
+        assert router.ranked() == ["anthropic", "broken"]
+
+    @pytest.mark.asyncio
+    async def test_unconfigured_provider_excluded(self, stubs):
+        """测试未配置 API Key 的提供商（占位回复最快）不参与路由"""
+        openai = stubs("好的")
+
+        async with httpx.AsyncClient() as client:
+            placeholder = _provider(openai, client)
+            placeholder.api_key = None
+            router = LLMRouter({"placeholder": placeholder, "openai": _provider(openai, client)})
+            assert await router.agenerate("你好") == "好的"
+
+        assert router.ranked() == ["openai"]
+
+    def test_service_builds_router_from_settings(self, monkeypatch):
+        """测试 LLMService 按配置构建路由，未知提供商报错"""
+        monkeypatch.setattr(settings, "LLM_PROVIDERS", "minimax,openai")
+        service = LLMService(provider="router")
+        assert list(service.llm.providers) == ["minimax", "openai"]
+
+        with pytest.raises(ValueError):
+            LLMService(provider="unknown")
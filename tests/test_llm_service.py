@@ -0,0 +1,388 @@
+"""
+LLM Service Tests - LLM 服务测试
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.concurrency import run_blocking
+from app.core.config import settings
+from app.core.database import init_db
+from app.models.database import UserModel
+from app.services.llm_cache import LLMResponseCache, fingerprint
+from app.services.llm_limiter import AdaptiveLimiter, LimiterOverloadedError
+from app.services.llm_service import BaseChatLLM, LLMService, MiniMaxLLM
+from app.services.tokenizer import Tokenizer, estimate_tokens
+from app.services.user_plans import UserPlanCache
+
+
+def _completion(content: str) -> dict:
+    """构造补全响应"""
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+@pytest.fixture
+def minimax_key(monkeypatch):
+    """模拟 MiniMax API Key"""
+    monkeypatch.setattr(settings, "MINIMAX_API_KEY", "test-key")
+
+
+class TestMiniMaxLLM:
+    """MiniMax 客户端测试"""
+
+    @pytest.mark.asyncio
+    async def test_agenerate_reuses_client(self, minimax_key):
+        """测试异步生成复用同一个连接池客户端"""
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(json.loads(request.content))
+            return httpx.Response(200, json=_completion("您好"))
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            llm = MiniMaxLLM(client=client)
+            messages = [
+                {"role": "system", "content": "你是客服"},
+                {"role": "user", "content": "你好"},
+            ]
+            assert await llm.agenerate(messages) == "您好"
+            assert await llm.agenerate("再见") == "您好"
+
+        assert requests[0]["messages"] == messages
+        assert requests[1]["messages"] == [{"role": "user", "content": "再见"}]
+
+    @pytest.mark.asyncio
+    async def test_agenerate_raises_on_http_error(self, minimax_key):
+        """测试上游错误向上抛出"""
+        transport = httpx.MockTransport(lambda request: httpx.Response(429))
+
+        async with httpx.AsyncClient(transport=transport) as client:
+            llm = MiniMaxLLM(client=client)
+            with pytest.raises(httpx.HTTPStatusError):
+                await llm.agenerate("你好")
+
+    @pytest.mark.asyncio
+    async def test_astream_yields_sse_deltas(self, minimax_key):
+        """测试流式生成逐个产出 SSE 增量"""
+        body = "".join(
+            f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]})}\n\n"
+            for piece in ["您", "好"]
+        ) + "data: [DONE]\n\n"
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            assert json.loads(request.content)["stream"] is True
+            return httpx.Response(200, text=body)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            llm = MiniMaxLLM(client=client)
+            chunks = [chunk async for chunk in llm.astream("你好")]
+
+        assert chunks == ["您", "好"]
+
+    @pytest.mark.asyncio
+    async def test_agenerate_without_key(self, monkeypatch):
+        """测试无 API Key 时返回占位回复"""
+        monkeypatch.setattr(settings, "MINIMAX_API_KEY", "")
+        monkeypatch.delenv("MINIMAX_API_KEY", raising=False)
+        service = LLMService()
+
+        reply = await service.agenerate([{"role": "user", "content": "你好"}])
+        assert reply == "[无API密钥] 你好"
+
+    def test_provider_must_define_defaults(self):
+        """测试未提供默认模型、地址和密钥的提供商不能实例化"""
+        class PartialLLM(BaseChatLLM):
+            def _default_model(self):
+                return "model"
+
+        with pytest.raises(TypeError):
+            PartialLLM()
+
+
+class TestLLMResponseCache:
+    """LLM 响应缓存测试"""
+
+    def test_lru_eviction_and_ttl(self, monkeypatch):
+        """测试 LRU 淘汰和 TTL 过期"""
+        cache = LLMResponseCache(max_size=2, ttl=10)
+        cache.set("a", "A")
+        cache.set("b", "B")
+        assert cache.get("a") == "A"
+        cache.set("c", "C")  # 淘汰最久未使用的 b
+
+        assert cache.get("b") is None
+        assert cache.get("c") == "C"
+        assert cache.evictions == 1
+
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+        assert cache.get("a") is None
+        assert cache.stats()["hits"] == 2
+
+    def test_fingerprint_covers_model_and_temperature(self):
+        """测试指纹包含模型和温度"""
+        messages = [{"role": "user", "content": "退款政策"}]
+        key = fingerprint(messages, "m1", 0.7)
+
+        assert key == fingerprint(list(messages), "m1", 0.7)
+        assert key != fingerprint(messages, "m2", 0.7)
+        assert key != fingerprint(messages, "m1", 0.2)
+
+    @pytest.mark.asyncio
+    async def test_service_serves_hits_without_upstream_call(self, minimax_key):
+        """测试命中缓存时不调用上游"""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            return httpx.Response(200, json=_completion("七天无理由退款"))
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            service = LLMService(cache=LLMResponseCache(), client=client)
+            first = await service.agenerate("退款政策")
+            second = await service.agenerate("退款政策")
+            streamed = [chunk async for chunk in service.astream("退款政策")]
+
+            assert service.invalidate_cache() == 1
+            await service.agenerate("退款政策")
+
+        assert first == second == "七天无理由退款"
+        assert streamed == ["七天无理由退款"]
+        assert len(calls) == 2
+
+
+class TestCoalescing:
+    """相同请求合并测试"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_requests_share_one_call(self, minimax_key):
+        """测试并发相同请求只调用一次上游"""
+        calls = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, json=_completion("请稍候"))
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            service = LLMService(client=client)
+            service.cache = None
+            replies = await asyncio.gather(*[service.agenerate("故障了吗") for _ in range(10)])
+
+        assert replies == ["请稍候"] * 10
+        assert len(calls) == 1
+        assert service._flights.stats()["followers"] == 9
+
+    @pytest.mark.asyncio
+    async def test_stream_subscribers_each_get_full_stream(self, minimax_key):
+        """测试每个流式订阅者都收到完整的片段序列"""
+        calls = []
+        body = "".join(
+            f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]})}\n\n"
+            for piece in ["正在", "恢复", "中"]
+        )
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, text=body)
+
+        async def consume(service):
+            return [chunk async for chunk in service.astream("故障了吗")]
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            service = LLMService(client=client)
+            service.cache = None
+            streams = await asyncio.gather(*[consume(service) for _ in range(3)])
+
+        assert streams == [["正在", "恢复", "中"]] * 3
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_abandoned_stream_cancels_upstream(self, minimax_key):
+        """测试所有订阅者离开后上游流被取消"""
+        produced = []
+
+        async def body():
+            for i in range(20):
+                await asyncio.sleep(0.01)
+                produced.append(i)
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': str(i)}}]})}\n\n".encode()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=body())
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            service = LLMService(client=client)
+            service.cache = None
+            streams = [service.astream("讲个长故事") for _ in range(2)]
+            assert [await stream.__anext__() for stream in streams] == ["0", "0"]
+            await streams[0].aclose()
+            assert await streams[1].__anext__() == "1"
+            await streams[1].aclose()
+            await asyncio.sleep(0.05)
+
+        assert len(produced) < 5
+        assert service._streams.stats() == {"in_flight": 0, "leaders": 1, "followers": 1}
+
+    @pytest.mark.asyncio
+    async def test_errors_are_shared_not_cached(self, minimax_key):
+        """测试上游错误传递给所有等待者且不会被缓存"""
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(0.01)
+            return httpx.Response(503)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            service = LLMService(cache=LLMResponseCache(), client=client)
+            results = await asyncio.gather(
+                *[service.agenerate("你好") for _ in range(3)],
+                return_exceptions=True
+            )
+
+        assert all(isinstance(r, httpx.HTTPStatusError) for r in results)
+        assert len(service.cache) == 0
+
+
+class TestAdaptiveLimiter:
+    """自适应并发限制测试"""
+
+    @pytest.mark.asyncio
+    async def test_paid_plans_are_served_first(self):
+        """测试排队请求按套餐优先级放行"""
+        limiter = AdaptiveLimiter(initial_limit=1)
+        order = []
+        await limiter.acquire("free")
+
+        async def call(plan):
+            async with limiter.slot(plan):
+                order.append(plan)
+
+        tasks = [asyncio.create_task(call(plan)) for plan in ["free", "pro", "enterprise"]]
+        await asyncio.sleep(0)
+        assert limiter.queued == 3
+
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["enterprise", "pro", "free"]
+        assert limiter.stats()["queue_time_by_plan"]["enterprise"]["count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_aimd_adjusts_limit(self):
+        """测试成功时加性增长、429 时乘性下降"""
+        limiter = AdaptiveLimiter(initial_limit=8)
+        for _ in range(8):
+            async with limiter.slot():
+                pass
+        assert 8.9 < limiter.limit < 9.1
+
+        response = httpx.Response(429, request=httpx.Request("POST", "http://llm"))
+        with pytest.raises(httpx.HTTPStatusError):
+            async with limiter.slot():
+                response.raise_for_status()
+        assert int(limiter.limit) == 4
+
+    @pytest.mark.asyncio
+    async def test_full_queue_sheds_free_tier_first(self):
+        """测试队列已满时挤出免费版请求"""
+        limiter = AdaptiveLimiter(initial_limit=1, max_queue=1)
+        await limiter.acquire("pro")
+
+        free = asyncio.create_task(limiter.acquire("free"))
+        await asyncio.sleep(0)
+        pro = asyncio.create_task(limiter.acquire("pro"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(LimiterOverloadedError):
+            await free
+        with pytest.raises(LimiterOverloadedError):
+            await limiter.acquire("free")
+
+        limiter.release()
+        await pro
+        assert limiter.shed_by_plan["free"] == 2
+
+
+    @pytest.mark.asyncio
+    async def test_early_closed_streams_release_slots(self, minimax_key, monkeypatch):
+        """测试调用方提前关闭流式生成时归还并发名额"""
+        monkeypatch.setattr(settings, "LLM_COALESCE_ENABLED", False)
+        body = "".join(
+            f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]})}\n\n"
+            for piece in ["第一段", "第二段"]
+        )
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, text=body)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            service = LLMService(client=client)
+            service.cache = None
+            for _ in range(3):
+                stream = service.astream("你好")
+                assert await stream.__anext__() == "第一段"
+                await stream.aclose()
+
+        assert service.limiter.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_user_plan_lookup(self, tmp_path):
+        """测试按 user_id 查询套餐并缓存，未知用户返回 None"""
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}")
+        await init_db(engine)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with factory() as session:
+            session.add(UserModel(id="u1", username="企业客户", plan="enterprise"))
+            await session.commit()
+
+        plans = UserPlanCache(factory, ttl=60)
+        assert await plans.get("u1") == "enterprise"
+        assert await plans.get("unknown") is None
+        assert await plans.get(None) is None
+
+        async with factory() as session:
+            await session.execute(update(UserModel).values(plan="free"))
+            await session.commit()
+        assert await plans.get("u1") == "enterprise"
+        await engine.dispose()
+
+
+class TestTokenizer:
+    """Token 计数测试"""
+
+    def test_mixed_chinese_english_estimate(self):
+        """测试中英文混合文本的估算"""
+        assert estimate_tokens("你好") == 2
+        assert estimate_tokens("Pro plan") == 2
+        assert estimate_tokens("Pro 套餐多少钱？") == 7
+
+    def test_batch_matches_single_and_is_cached(self):
+        """测试批量计数与单条计数一致，并写入缓存"""
+        tokenizer = Tokenizer(cache_size=2)
+        texts = ["退款政策", "refund policy", "退款政策"]
+
+        assert tokenizer.count_batch(texts) == [tokenizer.count(t) for t in texts]
+        assert len(tokenizer._cache) == 2
+
+    @pytest.mark.asyncio
+    async def test_warm_up_in_thread(self):
+        """测试在线程池中预加载分词器，之后计数不再加载"""
+        tokenizer = Tokenizer("no-such-encoding")
+        assert await run_blocking(tokenizer.warm_up) is False
+        assert tokenizer._loaded
+        assert tokenizer.count("你好") == estimate_tokens("你好")
+
+    def test_truncate_respects_budget(self):
+        """测试截断结果不超过预算"""
+        tokenizer = Tokenizer()
+        text = "我们提供七天无理由退款服务。" * 20
+
+        truncated = tokenizer.truncate(text, 30)
+        assert tokenizer.count(truncated) <= 30
+        assert text.startswith(truncated)
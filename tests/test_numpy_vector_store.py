@@ -0,0 +1,123 @@
+"""
+NumPy Vector Store Tests - 嵌入式向量索引测试
+"""
+
+import numpy as np
+import pytest
+
+from app.services.numpy_vector_store import NumpyVectorIndex
+
+
+def _vectors(n, dim=32, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def _add(index, vectors, prefix="c", start=0, **metadata):
+    ids = [f"{prefix}:{start + i}" for i in range(len(vectors))]
+    index.add(ids, vectors, [f"内容{i}" for i in ids], [dict(metadata) for _ in ids])
+    return ids
+
+
+def _exact_top(vectors, query, k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(unit @ (query / np.linalg.norm(query))))[:k])
+
+
+class TestNumpyVectorIndex:
+    """索引测试"""
+
+    def test_topk_matches_brute_force_across_segments(self):
+        """测试多段检索结果与暴力计算一致，过滤条件生效"""
+        vectors = _vectors(300)
+        index = NumpyVectorIndex()
+        _add(index, vectors[:100], doc_id="a")
+        _add(index, vectors[100:], start=100, doc_id="b")
+        query = _vectors(1, seed=1)[0]
+
+        results = index.search(query, k=5)
+
+        assert [r[0] for r in results] == [f"c:{i}" for i in _exact_top(vectors, query, 5)]
+        assert all(r[2]["doc_id"] == "a" for r in index.search(query, k=5, filter={"doc_id": "a"}))
+
+    def test_persistence_delete_and_compaction(self, tmp_path):
+        """测试墓碑删除、同 ID 覆盖、重新打开和合并"""
+        vectors = _vectors(20)
+        index = NumpyVectorIndex(str(tmp_path), max_segments=100)
+        _add(index, vectors[:10], doc_id="a")
+        _add(index, vectors[10:], start=10, doc_id="b")
+        index.delete(ids=["c:0", "c:1"])
+        index.add(["c:2"], vectors[19:20], ["新内容"], [{"doc_id": "a"}])
+
+        reopened = NumpyVectorIndex(str(tmp_path))
+        assert len(reopened) == 18
+        assert reopened.search(vectors[19], k=2)[0][0] in ("c:2", "c:19")
+        assert "c:0" not in [r[0] for r in reopened.search(vectors[0], k=20)]
+
+        assert reopened.delete(filter={"doc_id": "b"}) == 10
+        assert reopened.info()["segments"] == 1
+        assert len(NumpyVectorIndex(str(tmp_path))) == 8
+        assert not (tmp_path / "tombstones.txt").exists()
+
+    def test_comparison_filter(self):
+        """测试过滤条件支持比较运算（重新摄入时删除多余的尾部片段）"""
+        index = NumpyVectorIndex()
+        vectors = _vectors(5)
+        index.add(
+            [f"a:{i}" for i in range(5)], vectors, [f"内容{i}" for i in range(5)],
+            [{"doc_id": "a", "chunk_index": i} for i in range(5)]
+        )
+
+        assert index.delete(filter={"doc_id": "a", "chunk_index": {"$gte": 3}}) == 2
+        assert sorted(r[0] for r in index.search(vectors[0], k=5)) == ["a:0", "a:1", "a:2"]
+
+    def test_ivf_and_float16(self):
+        """测试 IVF 检索的召回率和 float16 存储"""
+        vectors = _vectors(2000)
+        index = NumpyVectorIndex(dtype="float16", nlist=16, nprobe=6, ivf_min_rows=1000)
+        _add(index, vectors)
+        assert index.info()["ivf_lists"] == 16
+
+        queries = vectors[:20] + 0.1 * _vectors(20, seed=2)
+        recall = np.mean([
+            len({r[0] for r in index.search(q, k=10)} & {f"c:{i}" for i in _exact_top(vectors, q, 10)}) / 10
+            for q in queries
+        ])
+        assert recall >= 0.8
+
+        with pytest.raises(ValueError):
+            index.add(["x"], _vectors(1, dim=8), ["维度不对"])
+
+
+class TestQuantization:
+    """量化存储测试"""
+
+    @pytest.mark.parametrize("quantization, code_bytes", [("int8", 32), ("pq", 8)])
+    def test_recall_with_rerank(self, quantization, code_bytes):
+        """测试量化编码的占用，以及精确重排后的召回率"""
+        vectors = _vectors(1500)
+        index = NumpyVectorIndex(quantization=quantization, quantize_min_rows=1000)
+        _add(index, vectors)
+        assert index.info()["code_bytes"] == code_bytes
+
+        queries = vectors[:20] + 0.1 * _vectors(20, seed=2)
+        recall = np.mean([
+            len({r[0] for r in index.search(q, k=5)} & {f"c:{i}" for i in _exact_top(vectors, q, 5)}) / 5
+            for q in queries
+        ])
+        assert recall >= 0.9
+        # 重排后的分数为精确余弦相似度
+        top = index.search(vectors[3], k=1)[0]
+        assert top[0] == "c:3" and top[3] == pytest.approx(1.0, abs=1e-5)
+
+    def test_quantizer_persists(self, tmp_path):
+        """测试量化器和编码随索引保存，重新打开后继续用于新写入的段"""
+        vectors = _vectors(1200)
+        index = NumpyVectorIndex(str(tmp_path), quantization="int8", quantize_min_rows=1000)
+        _add(index, vectors[:1100])
+
+        reopened = NumpyVectorIndex(str(tmp_path), quantization="int8")
+        _add(reopened, vectors[1100:], start=1100)
+
+        assert reopened.info()["quantization"] == "int8"
+        assert all(segment.codes is not None for segment in reopened._segments)
+        assert reopened.search(vectors[1150], k=1)[0][0] == "c:1150"
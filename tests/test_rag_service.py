@@ -0,0 +1,292 @@
+"""
+RAG Service Tests - 知识库检索服务测试
+"""
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services.keyword_index import BM25Index, reciprocal_rank_fusion, tokenize
+from app.services.rag_service import RAGService
+
+
+@pytest.fixture(autouse=True)
+def in_memory_keyword_index(monkeypatch):
+    """关键词索引只放在内存中"""
+    monkeypatch.setattr(settings, "RAG_KEYWORD_INDEX_PATH", "")
+
+
+def _document(content, **metadata):
+    """与 LangChain Document 相同字段的文档"""
+    return SimpleNamespace(page_content=content, metadata=metadata)
+
+
+class FakeVectorStore:
+    """返回固定结果的向量存储"""
+
+    def __init__(self, pairs=(), delay=0.0):
+        self.pairs = list(pairs)
+        self.delay = delay
+        self.added = []
+        self.deleted = []
+        self.calls = []
+        self.failing_queries = set()
+        self.fail_writes = False
+
+    def similarity_search_with_score(self, query, top_k=5):
+        time.sleep(self.delay)
+        if query in self.failing_queries:
+            raise ConnectionError("向量库不可用")
+        return self.pairs[:top_k]
+
+    def add_documents(self, documents, ids=None):
+        self.calls.append("add")
+        if self.fail_writes:
+            raise ConnectionError("向量库不可用")
+        self.added.append((documents, ids))
+        return ids
+
+    def delete_documents(self, ids=None, filter=None):
+        self.calls.append("delete")
+        self.deleted.append(filter)
+        return True
+
+
+class BatchVectorStore(FakeVectorStore):
+    """支持批量检索的向量存储（记录每批查询）"""
+
+    def __init__(self, pairs=(), fail=False):
+        super().__init__(pairs)
+        self.fail = fail
+        self.batches = []
+
+    def similarity_search_with_score_batch(self, queries, top_k=5):
+        self.batches.append(list(queries))
+        if self.fail:
+            raise ConnectionError("向量库不可用")
+        return [self.pairs[:top_k] for _ in queries]
+
+
+class FakeProcessor:
+    """返回固定分块的文档处理器"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def process_document(self, file_path):
+        documents = [_document(d.page_content, **d.metadata) for d in self.documents]
+        return {"metadata": None, "documents": documents}
+
+
+class TestRetrieve:
+    """检索测试"""
+
+    def test_scores_threshold_and_chunk_ids(self):
+        """测试返回真实分数和片段ID，低于阈值的结果被过滤"""
+        store = FakeVectorStore([
+            (_document("退款政策", filename="售后.md", chunk_index=2), 0.6),
+            (_document("发货时间", chunk_id="物流.md:0", doc_id="物流.md"), 0.9),
+            (_document("无关内容", filename="其他.md", chunk_index=0), 0.1),
+        ])
+        rag = RAGService(vector_store=store, score_threshold=0.3)
+
+        results = rag.retrieve_documents("怎么退款", top_k=3)
+
+        assert [r.chunk_id for r in results] == ["物流.md:0", "售后.md:2"]
+        assert [r.score for r in results] == [0.9, 0.6]
+        assert rag.get_chunk("售后.md:2").content == "退款政策"
+
+    @pytest.mark.asyncio
+    async def test_timeout_degrades_to_empty(self):
+        """测试异步检索超时返回空结果，批量检索到期后未执行的查询为 None"""
+        store = FakeVectorStore([(_document("内容", chunk_id="a:0"), 0.9)], delay=0.3)
+        rag = RAGService(vector_store=store, timeout=0.05)
+
+        assert await rag.aretrieve_documents("问题") == []
+        results = await rag.aretrieve_batch(["问题一", "问题二"])
+        assert [r.chunk_id for r in results[0]] == ["a:0"] and results[1] is None
+        assert rag.timeouts == 2
+
+    @pytest.mark.asyncio
+    async def test_batch_timeout_does_not_scale_with_size(self):
+        """测试批量检索与单次检索共用超时，到期前完成的查询照常返回"""
+        store = FakeVectorStore([(_document("内容", chunk_id="a:0"), 0.9)], delay=0.05)
+        rag = RAGService(vector_store=store, timeout=0.12)
+
+        start = time.monotonic()
+        results = await rag.aretrieve_batch([f"问题{i}" for i in range(20)])
+
+        assert time.monotonic() - start < 0.5
+        assert [r.chunk_id for r in results[0]] == ["a:0"]
+        assert results[-1] is None
+        assert rag.timeouts == 1
+
+    def test_batch_uses_single_store_call(self):
+        """测试批量检索一次调用向量库，批量调用失败时逐个检索，只有失败的查询为 None"""
+        store = BatchVectorStore([
+            (_document("退款政策", chunk_id="售后.md:0"), 0.8),
+            (_document("无关内容", chunk_id="其他.md:0"), 0.1),
+        ])
+        rag = RAGService(vector_store=store, score_threshold=0.3)
+
+        results = rag.retrieve_batch(["怎么退款", "多久到账"], top_k=2)
+
+        assert store.batches == [["怎么退款", "多久到账"]]
+        assert [[r.chunk_id for r in result] for result in results] == [["售后.md:0"]] * 2
+
+        store = BatchVectorStore([(_document("退款政策", chunk_id="售后.md:0"), 0.8)], fail=True)
+        store.failing_queries = {"多久到账"}
+        rag = RAGService(vector_store=store)
+        results = rag.retrieve_batch(["怎么退款", "多久到账"])
+        assert [r.chunk_id for r in results[0]] == ["售后.md:0"] and results[1] is None
+
+    @pytest.mark.asyncio
+    async def test_store_created_off_loop(self, monkeypatch):
+        """测试异步检索首次创建向量存储时在线程池中执行"""
+        created_in = []
+
+        class RecordingStore(FakeVectorStore):
+            def __init__(self, embedding_model):
+                super().__init__()
+                created_in.append(threading.current_thread())
+
+        monkeypatch.setattr(settings, "VECTOR_DB_TYPE", "numpy")
+        monkeypatch.setitem(
+            sys.modules, "app.services.vector_store", SimpleNamespace(VectorStoreService=RecordingStore)
+        )
+        monkeypatch.setattr("app.services.rag_service.create_embeddings", lambda loop=None: None)
+        rag = RAGService()
+
+        assert await rag.aretrieve_documents("问题") == []
+        assert await rag.aretrieve_batch(["问题"]) == [[]]
+        assert len(created_in) == 1 and created_in[0] is not threading.main_thread()
+
+    @pytest.mark.asyncio
+    async def test_without_vector_store(self):
+        """测试未配置向量数据库时返回空结果，摄入报错"""
+        rag = RAGService()
+
+        assert await rag.aretrieve_documents("问题") == []
+        assert rag.retrieve_batch(["问题"]) == [[]]
+        with pytest.raises(RuntimeError):
+            rag.ingest_file("docs/售后.md")
+
+
+class TestIngest:
+    """摄入测试"""
+
+    def test_ingest_sets_ids_and_scalar_metadata(self):
+        """测试摄入时写入片段ID和文档ID，只保留标量元数据"""
+        documents = [
+            _document("第一段", filename="售后.md", chunk_index=0, author=None, tags={"a": 1}),
+            _document("第二段", filename="售后.md", chunk_index=1, author=None, tags={"a": 1}),
+        ]
+        store = FakeVectorStore()
+        rag = RAGService(
+            vector_store=store, document_processor=FakeProcessor(documents), knowledge_dir="docs"
+        )
+
+        assert rag.ingest_file("docs/售后.md") == 2
+
+        added, ids = store.added[0]
+        assert ids == ["售后.md:0", "售后.md:1"]
+        assert added[1].metadata == {
+            "filename": "售后.md", "chunk_index": 1, "doc_id": "售后.md", "chunk_id": "售后.md:1"
+        }
+
+    def test_reingest_replaces_old_chunks(self, tmp_path):
+        """测试重新摄入先覆盖写入再删除多余的尾部片段，不同目录下的同名文件互不覆盖"""
+        store = FakeVectorStore()
+        processor = FakeProcessor([_document("第一段", chunk_index=0), _document("第二段", chunk_index=1)])
+        rag = RAGService(
+            vector_store=store, document_processor=processor,
+            keyword_index=BM25Index(), knowledge_dir=str(tmp_path)
+        )
+
+        rag.ingest_file(str(tmp_path / "售后" / "faq.md"))
+        rag.ingest_file(str(tmp_path / "物流" / "faq.md"))
+        processor.documents = processor.documents[:1]
+        rag.ingest_file(str(tmp_path / "售后" / "faq.md"))
+
+        assert store.calls == ["add", "delete"] * 3
+        assert store.deleted[-1] == {"doc_id": "售后/faq.md", "chunk_index": {"$gte": 1}}
+        assert [ids for _, ids in store.added][-1] == ["售后/faq.md:0"]
+        assert "售后/faq.md:1" not in rag.keyword_index and "物流/faq.md:1" in rag.keyword_index
+        outside = tmp_path.parent / "faq.md"
+        assert rag.document_id_for(str(outside)) == str(outside).replace(os.sep, "/")
+
+    def test_failed_write_keeps_old_version(self, tmp_path):
+        """测试写入向量库失败时不删除旧片段，关键词索引保持旧版本"""
+        store = FakeVectorStore()
+        processor = FakeProcessor([_document("退款政策", chunk_index=0)])
+        rag = RAGService(
+            vector_store=store, document_processor=processor,
+            keyword_index=BM25Index(), knowledge_dir=str(tmp_path)
+        )
+        rag.ingest_file(str(tmp_path / "售后.md"))
+
+        store.fail_writes = True
+        processor.documents = [_document("新的退款政策", chunk_index=0)]
+        with pytest.raises(ConnectionError):
+            rag.ingest_file(str(tmp_path / "售后.md"))
+
+        assert store.calls == ["add", "delete", "add"]
+        assert rag.keyword_index.search("退款政策")[0].content == "退款政策"
+
+
+class TestKeywordIndex:
+    """关键词索引与混合检索测试"""
+
+    def test_tokenize_cjk_and_codes(self):
+        """测试中文按两字切分，编码保留整体和各段"""
+        assert tokenize("订单号SO-2024查询") == ["订单", "单号", "so-2024", "so", "2024", "查询"]
+
+    def test_bm25_ranking_and_persistence(self, tmp_path):
+        """测试 BM25 排序、重新摄入替换旧片段，以及保存后加载结果一致"""
+        path = str(tmp_path / "keywords.npz")
+        index = BM25Index.open(path)
+        index.add([
+            ("a.md:0", "型号 X1-PRO 的保修期为两年", {"doc_id": "a.md"}),
+            ("a.md:1", "普通型号保修一年", {"doc_id": "a.md"}),
+            ("b.md:0", "退款三个工作日到账", {"doc_id": "b.md"}),
+        ])
+        index.remove_document("a.md")
+        index.add([("a.md:0", "型号 X1-PRO 的保修期为两年", {"doc_id": "a.md"})])
+        index.save()
+
+        loaded = BM25Index.open(path)
+        hits = loaded.search("X1-PRO 保修多久", top_k=3)
+
+        assert len(loaded) == 2
+        assert [hit.chunk_id for hit in hits] == ["a.md:0"]
+        assert hits[0].score == pytest.approx(index.search("X1-PRO 保修多久")[0].score)
+        assert 0 < hits[0].relevance <= 1
+        # 词频饱和前单个查询词的贡献低于 idf * (k1 + 1)，完全命中也不会被截断到 1
+        assert loaded.search("x1-pro")[0].relevance < 1
+
+    def test_hybrid_fusion(self):
+        """测试向量结果与关键词结果按 RRF 融合，score 保留向量相似度，关键词独有的命中也被召回"""
+        index = BM25Index()
+        index.add([
+            ("订单.md:3", "订单 SO-20240101 已发货", {"doc_id": "订单.md"}),
+            ("售后.md:0", "退款政策说明", {"doc_id": "售后.md"}),
+        ])
+        store = FakeVectorStore([
+            (_document("退款政策说明", chunk_id="售后.md:0", doc_id="售后.md"), 0.5),
+            (_document("物流说明", chunk_id="物流.md:0", doc_id="物流.md"), 0.4),
+        ])
+        rag = RAGService(vector_store=store, keyword_index=index, score_threshold=0.3)
+
+        results = rag.retrieve_documents("SO-20240101 的退款政策", top_k=3)
+
+        assert [r.chunk_id for r in results][0] == "售后.md:0"
+        assert results[0].score == 0.5
+        assert [r.rank_score for r in results] == sorted((r.rank_score for r in results), reverse=True)
+        assert {r.chunk_id for r in results} == {"售后.md:0", "订单.md:3", "物流.md:0"}
+        assert rag.get_chunk("订单.md:3").content == "订单 SO-20240101 已发货"
+        assert reciprocal_rank_fusion([["a", "b"], ["b"]], k=1) == {"a": 0.5, "b": 1 / 3 + 1 / 2}
@@ -0,0 +1,277 @@
+"""
+Session Store Tests - 会话存储后端测试
+"""
+
+import fnmatch
+import os
+import socketserver
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from app.services.chat_service import ChatService
+from app.services.rag_service import RAGService
+from app.services.session_store import (
+    ConversationSummary,
+    RedisSessionStore,
+    MessageRecord,
+    SQLiteSessionStore,
+    create_session_store,
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class EchoLLM:
+    """原样返回用户消息的 LLM 后端"""
+
+    async def agenerate(self, messages, plan=None):
+        return f"回复: {messages[-1]['content']}"
+
+
+def _message(content, role="user"):
+    return MessageRecord(role, content)
+
+
+class TestSQLiteSessionStore:
+    """SQLite 会话存储测试"""
+
+    def test_trim_and_clear(self, tmp_path):
+        """测试消息裁剪到上限，以及删除会话"""
+        store = SQLiteSessionStore(str(tmp_path / "sessions.db"), max_messages=3)
+        store.extend("s1", [_message(f"消息{i}") for i in range(5)])
+
+        assert [m.content for m in store.iter_messages("s1")] == ["消息2", "消息3", "消息4"]
+        assert "s1" in store and store.count() == 1
+        assert store.clear("s1")
+        assert list(store.iter_messages("s1")) == []
+        store.close()
+
+    def test_summary_shared_and_removed_with_session(self, tmp_path):
+        """测试会话摘要在实例间共享，只替换为更新的摘要，清理会话时一并删除"""
+        path = str(tmp_path / "sessions.db")
+        store = SQLiteSessionStore(path, max_sessions=1)
+        other = SQLiteSessionStore(path, max_sessions=1)
+
+        assert not store.set_summary("s1", ConversationSummary("摘要", 1.0, 2))
+        store.append("s1", _message("你好"))
+        assert store.set_summary("s1", ConversationSummary("摘要", 2.0, 2))
+        assert not other.set_summary("s1", ConversationSummary("旧摘要", 1.0, 3))
+        assert other.get_summary("s1").text == "摘要"
+
+        store.append("s2", _message("你好"))
+        store._conn().execute("UPDATE sessions SET last_access = 0 WHERE session_id = 's1'")
+        store.sweep()
+        assert other.get_summary("s1") is None
+        store.close()
+        other.close()
+
+    def test_shared_across_processes(self, tmp_path):
+        """测试另一个进程写入的会话可以读取（模拟多 worker）"""
+        path = str(tmp_path / "sessions.db")
+        script = (
+            "from app.services.session_store import MessageRecord, SQLiteSessionStore\n"
+            f"store = SQLiteSessionStore({path!r})\n"
+            "store.append('s1', MessageRecord('user', '来自另一个 worker'))\n"
+        )
+        subprocess.run([sys.executable, "-c", script], cwd=PROJECT_ROOT, check=True)
+
+        store = SQLiteSessionStore(path)
+        assert next(iter(store.iter_messages("s1"))).content == "来自另一个 worker"
+        assert store._conn().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        store.close()
+
+    def test_sweep_expired_and_overflow(self, tmp_path):
+        """测试清理空闲超时和超出上限的会话"""
+        store = SQLiteSessionStore(str(tmp_path / "sessions.db"), max_sessions=2, idle_ttl=60)
+        for sid in ["a", "b", "c", "d"]:
+            store.append(sid, _message("你好"))
+        store._conn().execute("UPDATE sessions SET last_access = 0 WHERE session_id = 'a'")
+
+        assert store.sweep() == 2
+        assert store.stats()["expired_idle"] == 1
+        assert store.stats()["evicted_lru"] == 1
+        assert "a" not in store and "b" not in store and "d" in store
+        store.close()
+
+    @pytest.mark.asyncio
+    async def test_chat_history_shared_between_services(self, tmp_path):
+        """测试两个服务实例（两个 worker）共享同一会话历史"""
+        path = str(tmp_path / "sessions.db")
+        first = ChatService(
+            llm_service=EchoLLM(), rag_service=RAGService(),
+            session_store=SQLiteSessionStore(path)
+        )
+        second = ChatService(
+            llm_service=EchoLLM(), rag_service=RAGService(),
+            session_store=SQLiteSessionStore(path)
+        )
+
+        await first.achat(message="我想退款", session_id="s1", use_rag=False)
+        await second.achat(message="多久到账", session_id="s1", use_rag=False)
+
+        history = await first.aget_history("s1")
+        assert [m.content for m in history] == [
+            "我想退款", "回复: 我想退款", "多久到账", "回复: 多久到账"
+        ]
+        assert (await second.aget_session_stats())["sessions"] == 1
+        await first.stop()
+        await second.stop()
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    """按 RESP 协议解析命令"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                size = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(size + 2)[:-2].decode("utf-8"))
+            self.wfile.write(self.server.execute(args))
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """测试用的最小 Redis 替身（仅实现会话存储用到的命令）"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _FakeRedisHandler)
+        self.lists = {}
+        self.strings = {}
+        self.ttls = {}
+        self.proto = 2
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _encode(value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, list):
+            return f"*{len(value)}\r\n".encode() + b"".join(FakeRedisServer._encode(v) for v in value)
+        data = value.encode("utf-8")
+        return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+    @staticmethod
+    def _range(items, start, stop):
+        size = len(items)
+        start = max(start + size if start < 0 else start, 0)
+        stop = stop + size if stop < 0 else stop
+        return items[start:stop + 1]
+
+    def execute(self, args):
+        command, args = args[0].upper(), args[1:]
+        with self.lock:
+            if command == "PING":
+                return b"+PONG\r\n"
+            if command == "HELLO":
+                # 协议握手：RESP3 map，其余回复使用两种协议通用的格式
+                proto = self.proto = int(args[0]) if args else 2
+                return f"%1\r\n$5\r\nproto\r\n:{proto}\r\n".encode()
+            if command in ("CLIENT", "SELECT"):
+                return b"+OK\r\n"
+            if command == "RPUSH":
+                items = self.lists.setdefault(args[0], [])
+                items.extend(args[1:])
+                return self._encode(len(items))
+            if command == "LTRIM":
+                items = self.lists.get(args[0], [])
+                self.lists[args[0]] = self._range(items, int(args[1]), int(args[2]))
+                return b"+OK\r\n"
+            if command == "LRANGE":
+                return self._encode(self._range(self.lists.get(args[0], []), int(args[1]), int(args[2])))
+            if command == "GET":
+                if args[0] not in self.strings:
+                    # 空值在 RESP2 和 RESP3 中的格式不同
+                    return b"_\r\n" if self.proto == 3 else b"$-1\r\n"
+                return self._encode(self.strings[args[0]])
+            if command == "SET":
+                self.strings[args[0]] = args[1]
+                if "EX" in args:
+                    self.ttls[args[0]] = int(args[args.index("EX") + 1])
+                return b"+OK\r\n"
+            if command == "EXPIRE":
+                if args[0] not in self.lists and args[0] not in self.strings:
+                    return self._encode(0)
+                self.ttls[args[0]] = int(args[1])
+                return self._encode(1)
+            if command == "EXISTS":
+                return self._encode(sum(1 for key in args if key in self.lists))
+            if command == "DEL":
+                return self._encode(sum(
+                    1 for key in args
+                    if self.lists.pop(key, None) is not None or self.strings.pop(key, None) is not None
+                ))
+            if command == "SCAN":
+                pattern = args[args.index("MATCH") + 1] if "MATCH" in args else "*"
+                return self._encode(["0", [k for k in self.lists if fnmatch.fnmatch(k, pattern)]])
+        return f"-ERR unknown command '{command}'\r\n".encode()
+
+
+@pytest.fixture
+def redis_server():
+    pytest.importorskip("redis")
+    server = FakeRedisServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestRedisSessionStore:
+    """Redis 会话存储测试（使用本地 RESP 替身）"""
+
+    def test_roundtrip(self, redis_server):
+        """测试写入、裁剪、过期时间和删除"""
+        host, port = redis_server.server_address
+        store = RedisSessionStore(f"redis://{host}:{port}/0", max_messages=2, idle_ttl=600)
+
+        store.extend("s1", [_message("你好"), _message("请问", role="assistant"), _message("退款")])
+
+        assert [m.content for m in store.iter_messages("s1")] == ["请问", "退款"]
+        assert redis_server.ttls["session:s1"] == 600
+        assert "s1" in store and store.count() == 1
+        assert store.set_summary("s1", ConversationSummary("摘要", 2.0, 2))
+        assert not store.set_summary("s1", ConversationSummary("旧摘要", 1.0, 3))
+        assert store.get_summary("s1").text == "摘要" and store.count() == 1
+        assert redis_server.ttls["summary:session:s1"] == 600
+        assert store.clear("s1")
+        assert "s1" not in store and store.get_summary("s1") is None
+        store.close()
+
+    @pytest.mark.asyncio
+    async def test_chat_history_shared_between_services(self, redis_server):
+        """测试两个服务实例通过 Redis 共享会话历史"""
+        host, port = redis_server.server_address
+        url = f"redis://{host}:{port}/0"
+        first = ChatService(
+            llm_service=EchoLLM(), rag_service=RAGService(),
+            session_store=create_session_store("redis", url=url)
+        )
+        second = ChatService(
+            llm_service=EchoLLM(), rag_service=RAGService(),
+            session_store=create_session_store("redis", url=url)
+        )
+
+        await first.achat(message="我想退款", session_id="s1", use_rag=False)
+        messages = second._build_messages("多久到账", "s1", use_rag=False)
+
+        assert [m["content"] for m in messages[1:]] == ["我想退款", "回复: 我想退款", "多久到账"]
+        await first.stop()
+        await second.stop()
+
+
+def test_unknown_backend():
+    """测试未知的会话存储后端"""
+    with pytest.raises(ValueError):
+        create_session_store("memcached")